@@ -0,0 +1,256 @@
+"""Headless batch runner for NAIP water mapping over many HUC10 watersheds.
+
+Each watershed runs in a bounded process pool and its statistics are
+checkpointed to ``<out_dir>/<huc10>.json`` as soon as they are available, with
+the algorithm version and the thresholds they were computed with; non-default
+thresholds are also part of the file name (``<huc10>_c<c>_p<p>_u<u>.json``).
+Re-running the same command skips completed watersheds and retries the failed
+ones (recorded as ``<huc10>.failed.json``). A checkpoint of another algorithm
+version is recomputed.
+
+Usage:
+    python -m apps.batch --out-dir results --workers 4
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import time
+import traceback
+
+from .common import ALGORITHM_VERSION, DEFAULT_THRESHOLDS
+
+DEFAULT_CSV = os.path.join(os.path.dirname(__file__), "data/WBDHU10.csv")
+
+
+def read_huc10_list(in_csv=DEFAULT_CSV):
+    """Reads the HUC10 watershed IDs from a single-column CSV file."""
+    with open(in_csv, encoding="utf-8-sig") as f:
+        lines = f.readlines()[1:]
+    return [line.strip() for line in lines if line.strip()]
+
+
+def checkpoint_name(watershed, thresholds=DEFAULT_THRESHOLDS):
+    """Returns the file name stem of a watershed computed with the given thresholds."""
+    if tuple(thresholds) == DEFAULT_THRESHOLDS:
+        return watershed
+    return "{}_c{:g}_p{:g}_u{:g}".format(watershed, *thresholds)
+
+
+def checkpoint_path(out_dir, watershed, thresholds=DEFAULT_THRESHOLDS):
+    return os.path.join(out_dir, f"{checkpoint_name(watershed, thresholds)}.json")
+
+
+def failure_path(out_dir, watershed, thresholds=DEFAULT_THRESHOLDS):
+    return os.path.join(
+        out_dir, f"{checkpoint_name(watershed, thresholds)}.failed.json"
+    )
+
+
+def write_json(path, data):
+    """Writes a JSON file atomically so that a crash never leaves a partial checkpoint."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def write_checkpoint(out_dir, watershed, thresholds, stats):
+    """Writes the stats row of a watershed with its algorithm version and thresholds."""
+    write_json(
+        checkpoint_path(out_dir, watershed, thresholds),
+        {
+            "version": ALGORITHM_VERSION,
+            "thresholds": list(thresholds),
+            "stats": stats,
+        },
+    )
+
+
+def read_checkpoint(path, thresholds=None):
+    """Reads the stats row of a checkpoint.
+
+    Parameters
+    ----------
+    path:
+        the checkpoint file.
+    thresholds:
+        the expected (cluster, permanent, usda) thresholds, or None for any.
+
+    Returns
+    -------
+    tuple
+        The stats row and the thresholds of the checkpoint, or None if the file
+        does not exist, predates the versioned checkpoints, or was computed with
+        another algorithm version or other thresholds.
+    """
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("version") != ALGORITHM_VERSION or "stats" not in checkpoint:
+        return None
+    checkpoint_thresholds = tuple(checkpoint["thresholds"])
+    if thresholds is not None and checkpoint_thresholds != tuple(thresholds):
+        return None
+    return checkpoint["stats"], checkpoint_thresholds
+
+
+def pending_watersheds(watersheds, out_dir, thresholds=DEFAULT_THRESHOLDS):
+    """Returns the watersheds without a current checkpoint, in input order."""
+    return [
+        w
+        for w in watersheds
+        if read_checkpoint(checkpoint_path(out_dir, w, thresholds), thresholds) is None
+    ]
+
+
+def _init_worker():
+    from .session import ee_initialize
+
+    ee_initialize()
+
+
+def _run_watershed(watershed, thresholds):
+    from .water import wetland_stats
+
+    start = time.time()
+    stats = wetland_stats(watershed, *thresholds)
+    return stats, time.time() - start
+
+
+def run_batch(
+    watersheds,
+    out_dir,
+    workers=4,
+    cluster_threshold=0.1,
+    permanent_threshold=30,
+    usda_threshold=2,
+    verbose=True,
+):
+    """Runs ``wetland_stats`` for a list of watersheds in a process pool.
+
+    Parameters
+    ----------
+    watersheds:
+        list of HUC10 watershed IDs.
+    out_dir:
+        directory holding one checkpoint file per watershed.
+    workers:
+        maximum number of worker processes (and in-flight watersheds).
+
+    Returns
+    -------
+    tuple
+        The lists of completed and failed watershed IDs of this run.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    thresholds = (cluster_threshold, permanent_threshold, usda_threshold)
+    todo = pending_watersheds(watersheds, out_dir, thresholds)
+    completed, failed = [], []
+
+    if verbose:
+        print(f"{len(watersheds) - len(todo)} done, {len(todo)} to run ...")
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker
+    ) as executor:
+        queue = iter(todo)
+        running = {}
+
+        def submit_next():
+            watershed = next(queue, None)
+            if watershed is not None:
+                future = executor.submit(_run_watershed, watershed, thresholds)
+                running[future] = watershed
+
+        for _ in range(workers):
+            submit_next()
+
+        while running:
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                watershed = running.pop(future)
+                try:
+                    stats, elapsed = future.result()
+                except Exception as e:
+                    failed.append(watershed)
+                    write_json(
+                        failure_path(out_dir, watershed, thresholds),
+                        {
+                            "watershed": watershed,
+                            "thresholds": list(thresholds),
+                            "error": str(e),
+                            "traceback": traceback.format_exc(),
+                        },
+                    )
+                    if verbose:
+                        print(f"{watershed}: failed ({e})")
+                else:
+                    completed.append(watershed)
+                    write_checkpoint(out_dir, watershed, thresholds, stats)
+                    failed_path = failure_path(out_dir, watershed, thresholds)
+                    if os.path.exists(failed_path):
+                        os.remove(failed_path)
+                    if verbose:
+                        print(f"{watershed}: done in {elapsed:.1f}s")
+                submit_next()
+
+    return completed, failed
+
+
+def merge_results(watersheds, out_dir, out_csv, thresholds=DEFAULT_THRESHOLDS):
+    """Merges the current checkpoints of the completed watersheds into a single CSV file."""
+    rows = []
+    for watershed in watersheds:
+        path = checkpoint_path(out_dir, watershed, thresholds)
+        checkpoint = read_checkpoint(path, thresholds)
+        if checkpoint is not None:
+            rows.append(checkpoint[0])
+
+    fields = []
+    for row in rows:
+        fields.extend(key for key in row if key not in fields)
+
+    with open(out_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--out-dir", default="results")
+    parser.add_argument("--in-csv", default=DEFAULT_CSV)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cluster-threshold", type=float, default=0.1)
+    parser.add_argument("--permanent-threshold", type=float, default=30)
+    parser.add_argument("--usda-threshold", type=float, default=2)
+    parser.add_argument("--out-csv", help="merge all checkpoints into this CSV")
+    parser.add_argument("watersheds", nargs="*", help="HUC10 IDs (default: all)")
+    args = parser.parse_args()
+
+    watersheds = args.watersheds or read_huc10_list(args.in_csv)
+    thresholds = (
+        args.cluster_threshold,
+        args.permanent_threshold,
+        args.usda_threshold,
+    )
+    completed, failed = run_batch(watersheds, args.out_dir, args.workers, *thresholds)
+    print(f"{len(completed)} completed, {len(failed)} failed in this run.")
+    if failed:
+        print("Failed: " + ", ".join(failed))
+
+    if args.out_csv:
+        count = merge_results(watersheds, args.out_dir, args.out_csv, thresholds)
+        print(f"{count} watersheds written to {args.out_csv}")
+
+
+if __name__ == "__main__":
+    main()
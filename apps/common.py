@@ -0,0 +1,115 @@
+"""Helpers shared by the Earth Engine and the local raster water mapping engines."""
+
+import zlib
+
+import pandas as pd
+
+# Bump whenever a change to the algorithm invalidates the stored results.
+ALGORITHM_VERSION = 4
+
+# The default (cluster, permanent, usda) thresholds of the water mapping
+DEFAULT_THRESHOLDS = (0.1, 30, 2)
+
+
+def training_seed(watershed):
+    """Returns the random seed used to sample the training pixels of a watershed."""
+    return zlib.crc32(watershed.encode()) & 0x7FFFFFFF
+
+
+def pivot_areas(areas):
+    """Pivots the yearly areas of each product into a product x year table.
+
+    Parameters
+    ----------
+    areas:
+        the "areas" output, i.e., {product: {"Y<year>": area in hectare}}.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The areas rounded to two decimals, with one row per product and one column per year.
+    """
+    records = [
+        (product, year[1:], value)
+        for product, table in areas.items()
+        for year, value in table.items()
+    ]
+    df = pd.DataFrame(records, columns=["product", "year", "sum"])
+    return df.pivot(index="product", columns="year", values="sum").round(2)
+
+
+def chart_data(areas):
+    """Returns the year labels and the NAIP and JRC series of the inundation chart."""
+    table = pivot_areas(areas)
+    return {
+        "labels": list(table.columns),
+        "naip": table.loc["NAIP"].tolist(),
+        "jrc": table.loc["JRC"].tolist(),
+    }
+
+
+def stats_row(areas, summary):
+    """Returns the CSV row of a watershed, with the areas as JRC_/NAIP_/OMI_<year> columns."""
+    row = dict(summary)
+    values = pivot_areas(areas).stack()
+    for (product, year), value in values.items():
+        row[f"{product}_{year}"] = float(value)
+    return row
+
+
+# Short names of the NWI wetland types, as in ``geemap.nwi_rename``
+NWI_NAMES = {
+    "Freshwater Emergent Wetland": "Emergent",
+    "Freshwater Forested/Shrub Wetland": "Forested",
+    "Estuarine and Marine Wetland": "Estuarine",
+    "Freshwater Pond": "Pond",
+    "Lake": "Lake",
+    "Riverine": "Riverine",
+    "Estuarine and Marine Deepwater": "Deepwater",
+    "Other": "Other",
+}
+
+
+def nwi_summary(stats):
+    """Formats the NWI wetland statistics of a watershed in hectares.
+
+    Parameters
+    ----------
+    stats:
+        the wetland polygon area (m2) statistics, i.e., {"count", "sum", "mean",
+        "median", "min", "max", "groups": [{"type", "sum"}]}.
+
+    Returns
+    -------
+    dict
+        The NWI_* columns of the watershed row.
+    """
+
+    def hectares(value):
+        return None if value is None else value / 10000
+
+    def fixed(value):
+        return None if value is None else "{:.4f}".format(hectares(value))
+
+    def rounded(value):
+        return None if value is None else round(hectares(value), 4)
+
+    summary = {
+        "NWI_count": stats["count"],
+        "NWI_sum": fixed(stats["sum"]),
+        "NWI_mean": fixed(stats["mean"]),
+        "NWI_median": rounded(stats["median"]),
+        "NWI_min": fixed(stats["min"]),
+        "NWI_max": fixed(stats["max"]),
+    }
+    for group in sorted(stats["groups"], key=lambda group: group["type"]):
+        name = NWI_NAMES.get(group["type"], group["type"])
+        summary[f"NWI_{name}"] = rounded(group["sum"])
+    return summary
+
+
+def decode_summary(basin_summary):
+    """Returns the watershed columns with the NWI statistics formatted in hectares."""
+    summary = dict(basin_summary)
+    summary.update(nwi_summary(summary.pop("NWI")))
+    return summary
@@ -0,0 +1,244 @@
+"""A precomputed summary cube of the NAIP water mapping results.
+
+The cube holds one row per HUC10 watershed and threshold combination with the
+NWI statistics and the yearly NAIP, JRC and omission areas, plus HUC8 and HUC6
+roll-ups, as Parquet files in ``data/cube``. It is built offline from the batch
+checkpoints and the result store:
+    python -m apps.batch --out-dir results
+    python -m apps.cube --checkpoints results
+
+The water mapping page reads watersheds from the cube when it has them for the
+requested thresholds and only computes the others live.
+"""
+
+import argparse
+import glob
+import os
+import re
+import threading
+
+import pandas as pd
+
+from .batch import read_checkpoint
+from .common import (
+    ALGORITHM_VERSION,
+    NWI_NAMES,
+    decode_summary,
+    stats_row,
+)
+from .store import get_store
+
+CUBE_DIR = os.path.join(os.path.dirname(__file__), "data", "cube")
+
+THRESHOLD_COLUMNS = ["cluster_threshold", "permanent_threshold", "usda_threshold"]
+
+NAME_COLUMNS = ["HUC_10", "HUC_08", "HUC_06", "HUC_Name"]
+NWI_STATS = ["count", "sum", "mean", "median", "min", "max"]
+AREA_COLUMN = re.compile(r"^(JRC|NAIP|OMI)_(\d{4})$")
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def additive_columns(df):
+    """Returns the columns that add up across watersheds."""
+    return [
+        column
+        for column in df.columns
+        if column in ["HUC_Area", "NWI_count", "NWI_sum"]
+        or AREA_COLUMN.match(column)
+        or (column.startswith("NWI_") and column[4:] not in NWI_STATS)
+    ]
+
+
+def rollup(df, level):
+    """Aggregates the HUC10 rows of the cube to the HUC8 ("HUC_08") or HUC6 ("HUC_06") level."""
+    groups = df.groupby([level] + THRESHOLD_COLUMNS)
+    result = groups[additive_columns(df)].sum(min_count=1)
+    result["NWI_min"] = groups["NWI_min"].min()
+    result["NWI_max"] = groups["NWI_max"].max()
+    result["NWI_mean"] = result["NWI_sum"] / result["NWI_count"]
+    result["watersheds"] = groups["HUC_10"].count()
+    return result.reset_index()
+
+
+def to_cube(rows):
+    """Converts watershed stats rows (see ``wetland_stats``) to the HUC10 cube table."""
+    df = pd.DataFrame(rows)
+    for column in df.columns:
+        if column not in NAME_COLUMNS:
+            df[column] = pd.to_numeric(df[column])
+    df["HUC_08"] = df["HUC_10"].str[:8]
+    df["HUC_06"] = df["HUC_10"].str[:6]
+    df["version"] = ALGORITHM_VERSION
+    return df.sort_values(["HUC_10"] + THRESHOLD_COLUMNS).reset_index(drop=True)
+
+
+def read_checkpoints(out_dir, thresholds=None):
+    """Reads the stats rows of the current batch checkpoints.
+
+    Each row is labeled with the thresholds stored in its checkpoint; legacy
+    checkpoints and those of another algorithm version are skipped, and so are
+    those of other thresholds than ``thresholds`` if given.
+    """
+    rows = {}
+    for path in sorted(glob.glob(os.path.join(out_dir, "*.json"))):
+        if path.endswith(".failed.json"):
+            continue
+        checkpoint = read_checkpoint(path, thresholds)
+        if checkpoint is None:
+            continue
+        row, checkpoint_thresholds = checkpoint
+        row.update(zip(THRESHOLD_COLUMNS, checkpoint_thresholds))
+        rows[(row["HUC_10"],) + checkpoint_thresholds] = row
+    return rows
+
+
+def read_store(store):
+    """Reads the stats rows of every complete entry of the result store."""
+    rows = {}
+    for key, value in store.items():
+        if "areas" in value and "basin_summary" in value:
+            row = stats_row(value["areas"], decode_summary(value["basin_summary"]))
+            row.update(zip(THRESHOLD_COLUMNS, key[1:]))
+            rows[key] = row
+    return rows
+
+
+def build_cube(checkpoints=None, thresholds=None, out_dir=CUBE_DIR):
+    """Writes the HUC10 cube and its HUC8/HUC6 roll-ups.
+
+    Parameters
+    ----------
+    checkpoints:
+        optional directory of batch checkpoints (see ``apps/batch.py``).
+    thresholds:
+        optional (cluster, permanent, usda) thresholds of the checkpoints to
+        include; by default, the checkpoints of all thresholds are included.
+    out_dir:
+        output directory of the hu10, hu8 and hu6 Parquet files.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The HUC10 cube.
+    """
+    rows = read_checkpoints(checkpoints, thresholds) if checkpoints else {}
+    # the store is versioned, so its entries take precedence over the checkpoints
+    rows.update(read_store(get_store(ALGORITHM_VERSION)))
+    if not rows:
+        raise ValueError("No watershed results to build the cube from.")
+
+    df = to_cube(list(rows.values()))
+    os.makedirs(out_dir, exist_ok=True)
+    df.to_parquet(os.path.join(out_dir, "hu10.parquet"), index=False)
+    rollup(df, "HUC_08").to_parquet(os.path.join(out_dir, "hu8.parquet"), index=False)
+    rollup(df, "HUC_06").to_parquet(os.path.join(out_dir, "hu6.parquet"), index=False)
+    return df
+
+
+class SummaryCube:
+    """Lookups in the HUC10 cube and its roll-ups.
+
+    Parameters
+    ----------
+    hu10, hu8, hu6:
+        the cube tables written by ``build_cube``.
+    """
+
+    def __init__(self, hu10, hu8, hu6):
+        self.hu10 = hu10[hu10["version"] == ALGORITHM_VERSION].reset_index(drop=True)
+        self.rollups = {8: hu8, 6: hu6}
+        keys = zip(self.hu10["HUC_10"], *[self.hu10[c] for c in THRESHOLD_COLUMNS])
+        self._positions = {key: i for i, key in enumerate(keys)}
+
+    @classmethod
+    def load(cls, cube_dir=CUBE_DIR):
+        return cls(
+            *[
+                pd.read_parquet(os.path.join(cube_dir, f"{level}.parquet"))
+                for level in ["hu10", "hu8", "hu6"]
+            ]
+        )
+
+    def row(self, watershed, *thresholds):
+        """Returns the non-empty columns of a watershed, or None if it is not in the cube."""
+        position = self._positions.get((watershed,) + tuple(thresholds))
+        if position is None:
+            return None
+        return self.hu10.iloc[position].dropna().to_dict()
+
+    def outputs(self, watershed, *thresholds):
+        """Returns the "areas" and "basin_summary" outputs of ``apps/water.py``, or None."""
+        row = self.row(watershed, *thresholds)
+        if row is None:
+            return None
+
+        areas = {"JRC": {}, "NAIP": {}, "OMI": {}}
+        for column, value in row.items():
+            match = AREA_COLUMN.match(column)
+            if match:
+                areas[match.group(1)][f"Y{match.group(2)}"] = value
+
+        # back to the raw NWI statistics (m2) decoded by common.nwi_summary
+        types = {name: wetland_type for wetland_type, name in NWI_NAMES.items()}
+        nwi = {stat: row.get(f"NWI_{stat}") for stat in NWI_STATS}
+        for stat in NWI_STATS[1:]:
+            if nwi[stat] is not None:
+                nwi[stat] = nwi[stat] * 10000
+        nwi["count"] = None if nwi["count"] is None else int(nwi["count"])
+        nwi["groups"] = [
+            {"type": types.get(column[4:], column[4:]), "sum": value * 10000}
+            for column, value in row.items()
+            if column.startswith("NWI_") and column[4:] not in NWI_STATS
+        ]
+        summary = {
+            "HUC_10": watershed,
+            "HUC_08": row["HUC_08"],
+            "HUC_Name": row.get("HUC_Name"),
+            "HUC_Area": (
+                "{:.4f}".format(row["HUC_Area"]) if "HUC_Area" in row else None
+            ),
+            "NWI": nwi,
+        }
+        return {"areas": areas, "basin_summary": summary}
+
+    def rollup(self, code, *thresholds):
+        """Returns the HUC8 or HUC6 roll-up of a unit, or None if it is not in the cube."""
+        table = self.rollups[len(code)]
+        selected = table[f"HUC_{len(code):02d}"] == code
+        for column, value in zip(THRESHOLD_COLUMNS, thresholds):
+            selected &= table[column] == value
+        rows = table[selected]
+        return None if rows.empty else rows.iloc[0].dropna().to_dict()
+
+
+def get_cube(cube_dir=CUBE_DIR):
+    """Returns the process-wide summary cube, or None if it has not been built."""
+    global _cube
+    with _cube_lock:
+        if _cube is None and os.path.exists(os.path.join(cube_dir, "hu10.parquet")):
+            _cube = SummaryCube.load(cube_dir)
+        return _cube
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--checkpoints", help="directory of batch checkpoints")
+    parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs=3,
+        metavar=("CLUSTER", "PERMANENT", "USDA"),
+        help="only include the checkpoints of these thresholds (default: all)",
+    )
+    parser.add_argument("--out-dir", default=CUBE_DIR)
+    args = parser.parse_args()
+
+    thresholds = tuple(args.thresholds) if args.thresholds else None
+    df = build_cube(args.checkpoints, thresholds, args.out_dir)
+    print(f"{len(df)} watershed rows written to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
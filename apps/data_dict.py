@@ -1,8 +1,30 @@
+import functools
+import hashlib
+from types import MappingProxyType
+
 import ee
 import geemap.colormaps as cm
 import geemap.foliumap as geemap
 
-geemap.ee_initialize()
+from .session import ee_initialize
+
+
+def freeze(value):
+    """Returns a read-only copy of nested dictionaries and lists."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Returns a mutable copy of a frozen value."""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
 
 
 dem_vis = {"min": 0, "max": 4000, "palette": cm.get_palette("terrain", 15)}
@@ -33,73 +55,161 @@ esri_vis = {
     "palette": list(geemap.builtin_legends["ESRI_LandCover"].values()),
 }
 
-DEMS = {
-    "STRM": {"id": ee.Image("CGIAR/SRTM90_V4"), "vis": dem_vis},
-    "NASA SRTM": {
-        "id": ee.Image("USGS/SRTMGL1_003").select("elevation"),
-        "vis": dem_vis,
-    },
-    "NASA DEM": {
-        "id": ee.Image("NASA/NASADEM_HGT/001").select("elevation"),
-        "vis": dem_vis,
-    },
-    "ASTER GDEM": {
-        "id": ee.Image("projects/sat-io/open-datasets/ASTER/GDEM"),
-        "vis": dem_vis,
-    },
-    "ALOS DEM": {
-        "id": ee.ImageCollection("JAXA/ALOS/AW3D30/V3_2")
-        .mosaic()
-        .select("DSM")
-        .rename("elevation"),
-        "vis": dem_vis,
-    },
-    "GLO-30": {
-        "id": ee.ImageCollection("projects/sat-io/open-datasets/GLO-30")
-        .mosaic()
-        .rename("elevation"),
-        "vis": dem_vis,
-    },
-    "FABDEM": {
-        "id": ee.ImageCollection("projects/sat-io/open-datasets/FABDEM")
-        .mosaic()
-        .rename("elevation"),
-        "vis": dem_vis,
-    },
-    "NED": {
-        "id": ee.Image("USGS/3DEP/10m"),
-        "vis": dem_vis,
-    },
-}
+# Catalog layers: {name: {"image": function building the ee.Image, "vis": vis
+# params}}. The images are built by layer_image, once Earth Engine is initialized.
+DEMS = freeze(
+    {
+        "STRM": {"image": lambda: ee.Image("CGIAR/SRTM90_V4"), "vis": dem_vis},
+        "NASA SRTM": {
+            "image": lambda: ee.Image("USGS/SRTMGL1_003").select("elevation"),
+            "vis": dem_vis,
+        },
+        "NASA DEM": {
+            "image": lambda: ee.Image("NASA/NASADEM_HGT/001").select("elevation"),
+            "vis": dem_vis,
+        },
+        "ASTER GDEM": {
+            "image": lambda: ee.Image("projects/sat-io/open-datasets/ASTER/GDEM"),
+            "vis": dem_vis,
+        },
+        "GMTED": {
+            "image": lambda: (
+                ee.Image("USGS/GMTED2010").select("be75").rename("elevation")
+            ),
+            "vis": dem_vis,
+        },
+        "ALOS DEM": {
+            "image": lambda: (
+                ee.ImageCollection("JAXA/ALOS/AW3D30/V3_2")
+                .mosaic()
+                .select("DSM")
+                .rename("elevation")
+            ),
+            "vis": dem_vis,
+        },
+        "GLO-30": {
+            "image": lambda: (
+                ee.ImageCollection("projects/sat-io/open-datasets/GLO-30")
+                .mosaic()
+                .rename("elevation")
+            ),
+            "vis": dem_vis,
+        },
+        "FABDEM": {
+            "image": lambda: (
+                ee.ImageCollection("projects/sat-io/open-datasets/FABDEM")
+                .mosaic()
+                .rename("elevation")
+            ),
+            "vis": dem_vis,
+        },
+        "NED": {
+            "image": lambda: ee.Image("USGS/3DEP/10m"),
+            "vis": dem_vis,
+        },
+    }
+)
 
-LANDCOVERS = {
-    "ESA WorldCover": {
-        "id": ee.ImageCollection("ESA/WorldCover/v100").first(),
-        "vis": {},
-    },
-    "ESRI Global Land Cover": {
-        "id": ee.ImageCollection(
-            "projects/sat-io/open-datasets/landcover/ESRI_Global-LULC_10m"
-        ).mosaic(),
-        "vis": esri_vis,
-    },
-    "NLCD 2019": {
-        "id": ee.Image("USGS/NLCD_RELEASES/2019_REL/NLCD/2019").select("landcover"),
-        "vis": {},
-    },
-}
+LANDCOVERS = freeze(
+    {
+        "ESA WorldCover": {
+            "image": lambda: ee.ImageCollection("ESA/WorldCover/v100").first(),
+            "vis": {},
+        },
+        "ESRI Global Land Cover": {
+            "image": lambda: ee.ImageCollection(
+                "projects/sat-io/open-datasets/landcover/ESRI_Global-LULC_10m"
+            ).mosaic(),
+            "vis": esri_vis,
+        },
+        "NLCD 2019": {
+            "image": lambda: ee.Image("USGS/NLCD_RELEASES/2019_REL/NLCD/2019").select(
+                "landcover"
+            ),
+            "vis": {},
+        },
+    }
+)
 
-LANDFORMS = {
-    "Global ALOS Landforms": {
-        "id": ee.Image("CSP/ERGo/1_0/Global/ALOS_landforms").select("constant"),
-        "vis": landform_vis,
-    },
-    "Global SRTM Landforms": {
-        "id": ee.Image("CSP/ERGo/1_0/Global/SRTM_landforms").select("constant"),
-        "vis": landform_vis,
-    },
-    "NED Landforms": {
-        "id": ee.Image("CSP/ERGo/1_0/US/landforms").select("constant"),
-        "vis": landform_vis,
-    },
-}
+LANDFORMS = freeze(
+    {
+        "Global ALOS Landforms": {
+            "image": lambda: ee.Image("CSP/ERGo/1_0/Global/ALOS_landforms").select(
+                "constant"
+            ),
+            "vis": landform_vis,
+        },
+        "Global SRTM Landforms": {
+            "image": lambda: ee.Image("CSP/ERGo/1_0/Global/SRTM_landforms").select(
+                "constant"
+            ),
+            "vis": landform_vis,
+        },
+        "NED Landforms": {
+            "image": lambda: ee.Image("CSP/ERGo/1_0/US/landforms").select("constant"),
+            "vis": landform_vis,
+        },
+    }
+)
+
+LAYERS = MappingProxyType({**DEMS, **LANDCOVERS, **LANDFORMS})
+
+
+class _ROI:
+    """An Earth Engine ROI hashed by its computation graph."""
+
+    def __init__(self, roi):
+        self.roi = roi
+        self.key = hashlib.sha256(roi.serialize().encode()).hexdigest()
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, _ROI) and other.key == self.key
+
+
+@functools.lru_cache(maxsize=None)
+def layer_image(name):
+    """Returns the ee.Image of a catalog layer, initializing Earth Engine if needed."""
+    ee_initialize()
+    return LAYERS[name]["image"]()
+
+
+@functools.lru_cache(maxsize=256)
+def _derived_layer(name, roi, palette, hillshade):
+    layer = LAYERS[name]
+    image = layer_image(name)
+    vis = thaw(layer["vis"])
+    if roi is not None:
+        image = image.clip(roi.roi)
+    if hillshade:
+        image = ee.Terrain.hillshade(image.setDefaultProjection("EPSG:3857"), 315, 45)
+        vis = {}
+    elif palette is not None:
+        vis["palette"] = cm.get_palette(palette, 15)
+    return image, freeze(vis)
+
+
+def derived_layer(name, roi=None, palette=None, hillshade=False):
+    """Returns the image and vis params of a catalog layer variant.
+
+    Variants are memoized by (layer, ROI graph, palette, hillshade), so the same
+    variant is always the same graph and reuses its cached tile URL.
+
+    Parameters
+    ----------
+    name:
+        the name of a layer of DEMS, LANDCOVERS or LANDFORMS.
+    roi:
+        optional ee.FeatureCollection to clip the layer to.
+    palette:
+        optional colormap name applied to DEM layers.
+    hillshade:
+        whether to return the hillshade of a DEM layer.
+    """
+    roi = None if roi is None else _ROI(roi)
+    if name not in DEMS:
+        palette = None
+    image, vis = _derived_layer(name, roi, palette, hillshade)
+    return image, thaw(vis)
@@ -3,12 +3,17 @@ import geemap.foliumap as geemap
 import geemap.colormaps as cm
 import streamlit as st
 
+from .huc_catalog import HUC_ASSETS, get_catalog
+from .tile_proxy import add_basemap
+from .tiles import LayerBatch
+
 
 def app():
 
     st.title("Surface Water Datasets for Missouri River Basins")
 
     Map = geemap.Map()
+    layers = LayerBatch()
 
     roi = ee.FeatureCollection("users/giswqs/MRB/NWI_HU8_Boundary_Simplify")
     style = {
@@ -21,7 +26,7 @@ def app():
     col1, col2 = st.columns([1.5, 4])
 
     basemap = col1.selectbox("Select a basemap", geemap.basemaps.keys())
-    Map.add_basemap(basemap)
+    add_basemap(Map, basemap)
 
     select_holder = col2.empty()
     selected = select_holder.multiselect(
@@ -42,6 +47,13 @@ def app():
         ],
     )
 
+    catalog = get_catalog()
+    region = col1.selectbox(
+        "Limit the NHD-HUC layers to",
+        [""] + catalog.units(2) + catalog.units(4) + catalog.units(6),
+        format_func=lambda code: catalog.label(code) if code else "All",
+    )
+
     form = st.form(key="submit_form")
     submit = form.form_submit_button(label="Submit")
 
@@ -64,10 +76,12 @@ def app():
             nass_waters = cropland.map(extract_nass_water)
             nass_water_2019 = nass_waters.filterDate("2019-01-01", "2019-12-31").first()
             nass_water_max = nass_waters.map(lambda img: img.gt(0)).sum().selfMask()
-            Map.addLayer(
-                nass_water_max.randomVisualizer().clip(roi), {}, "NASS Max Water Extent"
+            layers.add(
+                nass_water_max.randomVisualizer().clip(roi),
+                {},
+                "NASS Max Water Extent",
             )
-            Map.addLayer(nass_water_2019.clip(roi), {}, "NASS Water 2019")
+            layers.add(nass_water_2019.clip(roi), {}, "NASS Water 2019")
 
         if "JRC Surface Water" in selected:
             dataset = (
@@ -83,8 +97,10 @@ def app():
                 "palette": ["ffffff", "fffcb8", "0905ff"],
             }
 
-            Map.addLayer(
-                dataset.mosaic().clip(roi), {"palette": ["blue"]}, "JRC Monthly Water"
+            layers.add(
+                dataset.mosaic().clip(roi),
+                {"palette": ["blue"]},
+                "JRC Monthly Water",
             )
 
         if "NLCD" in selected:
@@ -100,7 +116,7 @@ def app():
 
             nlcd_waters = nlcd.map(extract_nlcd_water)
             nlcd_water_2016 = nlcd_waters.filterDate("2016-01-01", "2016-12-31").first()
-            Map.addLayer(nlcd_water_2016.clip(roi), {}, "NLCD Water 2016")
+            layers.add(nlcd_water_2016.clip(roi), {}, "NLCD Water 2016")
 
         if "Esri Land Cover" in selected:
 
@@ -135,8 +151,8 @@ def app():
             }
 
             vis_params = {"min": 1, "max": 10, "palette": legend_dict["colors"]}
-            Map.addLayer(esri_lulc10.clip(roi), vis_params, "ESRI LULC 10m", False)
-            Map.addLayer(
+            layers.add(esri_lulc10.clip(roi), vis_params, "ESRI LULC 10m", False)
+            layers.add(
                 esri_lulc10.eq(1).clip(roi).selfMask(),
                 {"palette": "blue"},
                 "ESRI Water",
@@ -147,7 +163,7 @@ def app():
             dataset = (
                 ee.ImageCollection("ESA/WorldCover/v100").first().clip(roi).selfMask()
             )
-            Map.addLayer(dataset, {}, "Landcover")
+            layers.add(dataset, {}, "Landcover")
 
         if "OpenStreetMap" in selected:
             osm_water = (
@@ -161,7 +177,7 @@ def app():
                 "max": 5,
                 "palette": ["08306b", "08519c", "2171b5", "4292c6", "6baed6"],
             }
-            Map.addLayer(osm_water, vis, "OSM Water")
+            layers.add(osm_water, vis, "OSM Water")
 
         if "Global River Width Dataset" in selected:
             water_mask = (
@@ -180,91 +196,38 @@ def app():
                 "projects/sat-io/open-datasets/GRWL/water_vector_v01_01"
             ).filterBounds(roi)
 
-            Map.addLayer(water_mask, {"palette": "blue"}, "GRWL RIver Mask")
-            Map.addLayer(
+            layers.add(water_mask, {"palette": "blue"}, "GRWL RIver Mask")
+            layers.add(
                 grwl_water_vector.style(**{"fillColor": "00000000", "color": "FF5500"}),
                 {},
                 "GRWL Centerline",
                 False,
             )
-            Map.addLayer(
+            layers.add(
                 grwl_summary.style(**{"fillColor": "00000000", "color": "EE5500"}),
                 {},
                 "GRWL Centerline Simplified",
             )
 
-        if "NHD-HUC2" in selected:
-            huc2 = ee.FeatureCollection("USGS/WBD/2017/HUC02").filter(
-                ee.Filter.inList(
-                    "name",
-                    ["Upper Mississippi Region", "Missouri Region", "Ohio Region"],
-                )
-            )
-            Map.addLayer(huc2.style(**{"fillColor": "00000000"}), {}, "NHD-HUC2")
-
-        if "NHD-HUC4" in selected:
-            huc4 = ee.FeatureCollection("USGS/WBD/2017/HUC04").filter(
-                ee.Filter.Or(
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc4", "rightValue": "05"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc4", "rightValue": "07"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc4", "rightValue": "10"}
-                    ),
-                )
-            )
-            Map.addLayer(huc4.style(**{"fillColor": "00000000"}), {}, "NHD-HUC4")
-
-        if "NHD-HUC6" in selected:
-            huc6 = ee.FeatureCollection("USGS/WBD/2017/HUC06").filter(
-                ee.Filter.Or(
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc6", "rightValue": "05"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc6", "rightValue": "07"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc6", "rightValue": "10"}
-                    ),
-                )
-            )
-            Map.addLayer(huc6.style(**{"fillColor": "00000000"}), {}, "NHD-HUC6")
-
-        if "NHD-HUC8" in selected:
-            huc8 = ee.FeatureCollection("USGS/WBD/2017/HUC08").filter(
-                ee.Filter.Or(
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc8", "rightValue": "05"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc8", "rightValue": "07"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc8", "rightValue": "10"}
-                    ),
+        for level in [2, 4, 6, 8, 10]:
+            name = f"NHD-HUC{level}"
+            if name in selected:
+                field = f"huc{level}"
+                prefixes = [region[:level]] if region else catalog.units(2)
+                huc = ee.FeatureCollection(HUC_ASSETS[level]).filter(
+                    ee.Filter.Or(
+                        *[
+                            ee.Filter.stringStartsWith(field, prefix)
+                            for prefix in prefixes
+                        ]
+                    )
                 )
-            )
-            Map.addLayer(huc8.style(**{"fillColor": "00000000"}), {}, "NHD-HUC8")
-
-        if "NHD-HUC10" in selected:
-            huc10 = ee.FeatureCollection("USGS/WBD/2017/HUC10").filter(
-                ee.Filter.Or(
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc10", "rightValue": "05"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc10", "rightValue": "07"}
-                    ),
-                    ee.Filter.stringStartsWith(
-                        **{"leftField": "huc10", "rightValue": "10"}
-                    ),
-                )
-            )
-            Map.addLayer(huc10.style(**{"fillColor": "00000000"}), {}, "NHD-HUC10")
+                layers.add(huc.style(**{"fillColor": "00000000"}), {}, name)
+
+        bounds = catalog.bounds(region) if region else None
+        if bounds is not None:
+            Map.fit_bounds(bounds)
 
-    Map.addLayer(roi.style(**style), {}, "MRB")
+    layers.add(roi.style(**style), {}, "MRB")
+    layers.add_to(Map)
     Map.to_streamlit(width=1400, height=650)
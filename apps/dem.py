@@ -1,10 +1,11 @@
 import ee
 import geemap.foliumap as geemap
 import geemap.colormaps as cm
-import geopandas as gpd
 import streamlit as st
-import plotly.express as px
 import pandas as pd
+from .data_dict import DEMS, derived_layer, layer_image
+from .tile_proxy import add_basemap
+from .tiles import LayerBatch
 
 
 @st.cache
@@ -12,6 +13,7 @@ def uploaded_file_to_gdf(data):
     import tempfile
     import os
     import uuid
+    import geopandas as gpd
 
     _, file_extension = os.path.splitext(data.name)
     file_id = str(uuid.uuid4())
@@ -93,24 +95,7 @@ def app():
         "NED Landforms": "ALOS_landforms",
     }
 
-    dem_options = {
-        "STRM": ee.Image("CGIAR/SRTM90_V4"),
-        "NASA SRTM": ee.Image("USGS/SRTMGL1_003").select("elevation"),
-        "NASA DEM": ee.Image("NASA/NASADEM_HGT/001").select("elevation"),
-        "ASTER GDEM": ee.Image("projects/sat-io/open-datasets/ASTER/GDEM"),
-        "GMTED": ee.Image("USGS/GMTED2010").select("be75").rename("elevation"),
-        "ALOS DEM": ee.ImageCollection("JAXA/ALOS/AW3D30/V3_2")
-        .mosaic()
-        .select("DSM")
-        .rename("elevation"),
-        "GLO-30": ee.ImageCollection("projects/sat-io/open-datasets/GLO-30")
-        .mosaic()
-        .rename("elevation"),
-        "FABDEM": ee.ImageCollection("projects/sat-io/open-datasets/FABDEM")
-        .mosaic()
-        .rename("elevation"),
-        "NED": ee.Image("USGS/3DEP/10m"),
-    }
+    dem_options = list(DEMS.keys())
 
     palettes = cm.list_colormaps()
 
@@ -118,7 +103,7 @@ def app():
         lc_datasets = st.multiselect(
             "Select landcover/landform datasets", list(landcover_options.keys())
         )
-        dem_datasets = st.multiselect("Select DEM datasets", dem_options.keys())
+        dem_datasets = st.multiselect("Select DEM datasets", dem_options)
         palette = st.selectbox(
             "Select a palette", palettes, index=palettes.index("terrain")
         )
@@ -139,8 +124,8 @@ def app():
         add_diff = st.checkbox("Add DEM differencing")
         if add_diff:
             with st.expander("DEM differencing", True):
-                first_dem = st.selectbox("First DEM", dem_options.keys(), index=1)
-                second_dem = st.selectbox("Second DEM", dem_options.keys(), index=3)
+                first_dem = st.selectbox("First DEM", dem_options, index=1)
+                second_dem = st.selectbox("Second DEM", dem_options, index=3)
                 min_max = st.slider("Min/Max for visualization", -100, 100, (-20, 20))
                 diff_palette = st.selectbox(
                     "Color palette", palettes, index=palettes.index("coolwarm")
@@ -157,8 +142,9 @@ def app():
         plugin_Draw=True,
         Draw_export=True,
     )
-    Map.add_basemap("HYBRID")
-    Map.add_basemap("TERRAIN")
+    add_basemap(Map, "HYBRID")
+    add_basemap(Map, "TERRAIN")
+    layers = LayerBatch()
 
     if upload:
         gdf = uploaded_file_to_gdf(upload)
@@ -203,7 +189,7 @@ def app():
             else:
                 landcover = landcover_options[dataset]
 
-            Map.addLayer(
+            layers.add(
                 landcover,
                 vis,
                 dataset,
@@ -223,36 +209,32 @@ def app():
 
     if dem_datasets:
         for dataset in dem_datasets:
+            roi = st.session_state["ROI"] if clip else None
             if clip:
-                dem = dem_options[dataset].clip(st.session_state["ROI"])
-                Map.centerObject(st.session_state["ROI"])
-            else:
-                dem = dem_options[dataset]
+                Map.centerObject(roi)
+            dem, _ = derived_layer(dataset, roi)
 
             if add_hillshade:
-
-                hillshade = ee.Terrain.hillshade(
-                    dem.setDefaultProjection("EPSG:3857"), 315, 45
-                )
-                Map.addLayer(hillshade, {}, f"{dataset} hillshade")
+                hillshade, _ = derived_layer(dataset, roi, hillshade=True)
+                layers.add(hillshade, {}, f"{dataset} hillshade")
 
             vis_params = {
                 "min": dem_min_max[0],
                 "max": dem_min_max[1],
                 "palette": cm.get_palette(palette, 15),
             }
-            Map.addLayer(dem, vis_params, dataset, True, opacity)
+            layers.add(dem, vis_params, dataset, True, opacity)
             Map.add_colorbar(
                 vis_params,
                 label="Elevation (m)",
             )
 
     if add_diff:
-        diff = dem_options[first_dem].subtract(dem_options[second_dem])
+        diff = layer_image(first_dem).subtract(layer_image(second_dem))
         if clip:
             diff = diff.clip(st.session_state["ROI"])
             Map.centerObject(st.session_state["ROI"])
-        Map.addLayer(
+        layers.add(
             diff,
             {
                 "min": min_max[0],
@@ -271,13 +253,13 @@ def app():
         )
 
     sinks_30m = ee.FeatureCollection("users/giswqs/MRB/NED_30m_sinks")
-    Map.addLayer(sinks_30m, {}, "Depressions (30m)", False)
+    layers.add(sinks_30m, {}, "Depressions (30m)", False)
 
     sinks_10m = ee.FeatureCollection("users/giswqs/MRB/NED_10m_sinks")
     sinks_10m_style = sinks_10m.style(
         **{"color": "0000ff", "width": 2, "fillColor": "0000ff44"}
     )
-    Map.addLayer(sinks_10m_style, {}, "Depressions (10m)", False)
+    layers.add(sinks_10m_style, {}, "Depressions (10m)", False)
 
     huc8 = ee.FeatureCollection("USGS/WBD/2017/HUC10").filter(
         ee.Filter.Or(
@@ -286,14 +268,15 @@ def app():
             ee.Filter.stringStartsWith(**{"leftField": "huc10", "rightValue": "10"}),
         )
     )
-    Map.addLayer(
+    layers.add(
         huc8.style(**{"fillColor": "00000000", "width": 1}), {}, "NHD-HUC10", False
     )
 
     ROI_style = st.session_state["ROI"].style(
         **{"color": "ff0000", "width": 2, "fillColor": "00000000"}
     )
-    Map.addLayer(ROI_style, {}, "Study Area")
+    layers.add(ROI_style, {}, "Study Area")
+    layers.add_to(Map)
 
     with row1_col1:
 
@@ -336,6 +319,8 @@ def app():
             ).getInfo()
             x = hist["elevation"]["bucketMeans"]
             y = hist["elevation"]["histogram"]
+            import plotly.express as px
+
             hist_df = pd.DataFrame(
                 {
                     "Value": x,
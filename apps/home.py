@@ -1,5 +1,7 @@
 import streamlit as st
 
+from .session import ee_initialize
+
 
 def app():
     st.title("Home")
@@ -22,6 +24,9 @@ def app():
         "The Mississippi River system ⎼ Upper Mississippi, Ohio, and Missouri  River Basins."
     )
 
+    # the introduction renders before Earth Engine is initialized for the map
+    ee_initialize()
+
     with st.expander("See source code"):
         with st.echo():
 
@@ -0,0 +1,306 @@
+"""A hierarchical catalog of the HUC2 to HUC10 hydrologic units.
+
+The catalog is a compact ``.npz`` file of arrays sorted by HUC code: code,
+name, area (km2) and bounding box. Parent and child links follow from the code
+prefixes and are resolved with binary searches, so nothing but the arrays is
+kept in memory. It is loaded once per process; without the file, the codes of
+``data/WBDHU8.csv`` and ``data/WBDHU10.csv`` are used (without names, areas and
+bounding boxes), and the pages hide their name search and zoom-to controls.
+
+The catalog file is built from Earth Engine with:
+    python -m apps.huc_catalog --prefixes 05 07 10
+"""
+
+import argparse
+import os
+import threading
+
+import numpy as np
+
+HUC_ASSETS = {
+    2: "USGS/WBD/2017/HUC02",
+    4: "USGS/WBD/2017/HUC04",
+    6: "USGS/WBD/2017/HUC06",
+    8: "USGS/WBD/2017/HUC08",
+    10: "USGS/WBD/2017/HUC10",
+}
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+CATALOG_PATH = os.path.join(DATA_DIR, "WBDHU.npz")
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+class HUCCatalog:
+    """Hydrologic units sorted by code, with prefix-based parent/child links.
+
+    Parameters
+    ----------
+    codes:
+        array of HUC codes of any level (2 to 10 digits).
+    names:
+        array of unit names.
+    areas:
+        array of unit areas in km2 (NaN if unknown).
+    bboxes:
+        (n, 4) array of (west, south, east, north) bounds (NaN if unknown).
+    """
+
+    def __init__(self, codes, names, areas, bboxes):
+        order = np.argsort(codes, kind="stable")
+        self.codes = np.asarray(codes)[order]
+        self.names = np.asarray(names)[order]
+        self.areas = np.asarray(areas, dtype=float)[order]
+        self.bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)[order]
+        self.levels = np.char.str_len(self.codes)
+        self._search_names = np.char.lower(self.names)
+
+    @classmethod
+    def load(cls, path=CATALOG_PATH):
+        with np.load(path) as data:
+            return cls(data["codes"], data["names"], data["areas"], data["bboxes"])
+
+    @classmethod
+    def from_csv(cls, data_dir=DATA_DIR):
+        """Builds a catalog of codes only from the HUC8 and HUC10 CSV files."""
+        codes = set()
+        for filename in ["WBDHU8.csv", "WBDHU10.csv"]:
+            with open(os.path.join(data_dir, filename), encoding="utf-8-sig") as f:
+                lines = [line.strip() for line in f.readlines()[1:] if line.strip()]
+            for code in lines:
+                codes.update(code[:level] for level in range(2, len(code) + 1, 2))
+        codes = np.array(sorted(codes))
+        return cls(
+            codes,
+            np.full(len(codes), ""),
+            np.full(len(codes), np.nan),
+            np.full((len(codes), 4), np.nan),
+        )
+
+    def save(self, path=CATALOG_PATH):
+        np.savez_compressed(
+            path,
+            codes=self.codes,
+            names=self.names,
+            areas=self.areas,
+            bboxes=self.bboxes,
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def has_names(self):
+        """Whether the units have names, i.e., can be searched by name."""
+        return bool((self.names != "").any())
+
+    @property
+    def has_bounds(self):
+        """Whether the units have bounding boxes, i.e., can be zoomed to."""
+        return bool((~np.isnan(self.bboxes)).any())
+
+    def __contains__(self, code):
+        return self._position(code) is not None
+
+    def _position(self, code):
+        i = np.searchsorted(self.codes, code)
+        return i if i < len(self.codes) and self.codes[i] == code else None
+
+    def _prefix_range(self, prefix):
+        start = np.searchsorted(self.codes, prefix, side="left")
+        end = np.searchsorted(self.codes, prefix + "\uffff", side="left")
+        return start, end
+
+    def info(self, code):
+        """Returns the code, level, name, area (km2), bbox and parent of a unit."""
+        i = self._position(code)
+        if i is None:
+            raise KeyError(code)
+        bbox = self.bboxes[i]
+        return {
+            "huc": code,
+            "level": int(self.levels[i]),
+            "name": str(self.names[i]),
+            "area": None if np.isnan(self.areas[i]) else float(self.areas[i]),
+            "bbox": None if np.isnan(bbox).any() else bbox.tolist(),
+            "parent": self.parent(code),
+        }
+
+    def name(self, code):
+        i = self._position(code)
+        return "" if i is None else str(self.names[i])
+
+    def label(self, code):
+        """Returns "<code> - <name>", or the bare code of unnamed units."""
+        name = self.name(code)
+        return f"{code} - {name}" if name else code
+
+    def parent(self, code):
+        return code[:-2] if len(code) > 2 and code[:-2] in self else None
+
+    def ancestors(self, code):
+        """Returns the codes of the enclosing units, from HUC2 down to the parent."""
+        return [
+            code[:level] for level in range(2, len(code), 2) if code[:level] in self
+        ]
+
+    def units(self, level, prefix=""):
+        """Returns the codes of a level within the unit (or code prefix) ``prefix``."""
+        start, end = self._prefix_range(prefix)
+        selected = self.levels[start:end] == level
+        return self.codes[start:end][selected].tolist()
+
+    def children(self, code):
+        return self.units(len(code) + 2, code)
+
+    def search(self, text, level=None, limit=None):
+        """Returns the codes matching a code prefix or part of a name, in code order."""
+        text = text.strip()
+        if text.isdigit():
+            start, end = self._prefix_range(text)
+            matches = np.arange(start, end)
+        else:
+            found = np.char.find(self._search_names, text.lower()) >= 0
+            matches = np.nonzero(found)[0]
+        if level is not None:
+            matches = matches[self.levels[matches] == level]
+        return self.codes[matches[:limit]].tolist()
+
+    def bounds(self, code):
+        """Returns the [[south, west], [north, east]] bounds of a unit, or None."""
+        bbox = self.info(code)["bbox"]
+        return None if bbox is None else [[bbox[1], bbox[0]], [bbox[3], bbox[2]]]
+
+
+def get_catalog(path=CATALOG_PATH):
+    """Returns the process-wide HUC catalog."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            if os.path.exists(path):
+                _catalog = HUCCatalog.load(path)
+            else:
+                _catalog = HUCCatalog.from_csv()
+        return _catalog
+
+
+def select_unit(container, label, level, prefix="", key=None, default=None):
+    """Adds a watershed search box and selectbox; returns the selected code or None.
+
+    Parameters
+    ----------
+    container:
+        the streamlit container (e.g. a column) to add the widgets to.
+    label:
+        label of the selectbox.
+    level:
+        number of digits of the units to select (2 to 10).
+    prefix:
+        only units within this parent unit (or code prefix) are listed.
+    key:
+        unique widget key prefix.
+    default:
+        code selected when the search box is empty.
+
+    Returns None, with a message, when no unit matches the search and prefix.
+    """
+    catalog = get_catalog()
+    query = ""
+    if catalog.has_names:
+        query = container.text_input(
+            f"Search {label.lower()} by code or name", "", key=f"{key}_query"
+        ).strip()
+    if query:
+        options = [
+            code for code in catalog.search(query, level) if code.startswith(prefix)
+        ]
+    else:
+        options = catalog.units(level, prefix)
+    if not options:
+        message = f"No {label} found"
+        if query:
+            message += f" for '{query}'"
+        if prefix:
+            message += f" in {catalog.label(prefix)}"
+        container.warning(f"{message}.")
+        return None
+
+    if default in options and not query:
+        choices, index = options, options.index(default)
+    else:
+        choices, index = [""] + options, 0
+    selected = container.selectbox(
+        label,
+        choices,
+        index=index,
+        format_func=lambda code: catalog.label(code) if code else "",
+        key=key,
+    )
+    return selected or None
+
+
+def build_catalog(prefixes=None, path=CATALOG_PATH):
+    """Builds the catalog file from the Earth Engine WBD collections.
+
+    Parameters
+    ----------
+    prefixes:
+        list of HUC2 region codes to include, e.g. ["05", "07", "10"]; all by default.
+    """
+    import ee
+
+    codes, names, areas, bboxes = [], [], [], []
+    for level, asset in HUC_ASSETS.items():
+        field = f"huc{level}"
+        collection = ee.FeatureCollection(asset)
+        if prefixes:
+            collection = collection.filter(
+                ee.Filter.Or(
+                    *[ee.Filter.stringStartsWith(field, prefix) for prefix in prefixes]
+                )
+            )
+        collection = collection.map(
+            lambda f: ee.Feature(
+                None,
+                {
+                    "code": f.get(field),
+                    "name": f.get("name"),
+                    "area": f.get("areasqkm"),
+                    "bounds": f.geometry().bounds(100).coordinates().get(0),
+                },
+            )
+        )
+        columns = ee.Dictionary(
+            {
+                name: collection.aggregate_array(name)
+                for name in ["code", "name", "area", "bounds"]
+            }
+        ).getInfo()
+        codes.extend(columns["code"])
+        names.extend(columns["name"])
+        areas.extend(columns["area"])
+        for ring in columns["bounds"]:
+            lons, lats = zip(*ring)
+            bboxes.append([min(lons), min(lats), max(lons), max(lats)])
+
+    catalog = HUCCatalog(np.array(codes), np.array(names), areas, bboxes)
+    catalog.save(path)
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--prefixes", nargs="*", help="HUC2 regions to include")
+    parser.add_argument("--out", default=CATALOG_PATH)
+    args = parser.parse_args()
+
+    from .session import ee_initialize
+
+    ee_initialize()
+    catalog = build_catalog(args.prefixes, path=args.out)
+    print(f"{len(catalog)} hydrologic units written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
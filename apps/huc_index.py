@@ -0,0 +1,186 @@
+"""A local spatial index of the HUC10 watersheds.
+
+The index is a compact ``.npz`` file holding the HUC10 IDs, names and
+simplified polygons (as one WKB buffer with offsets), loaded once per process
+into a shapely STRtree. It resolves coordinates to a watershed and checks
+watershed IDs without any Earth Engine request. The full-resolution geometry
+of a watershed (``find_HUC10``) is still filtered on the server.
+
+The index file is not shipped; it is built from Earth Engine with:
+    python -m apps.huc_index --prefixes 05 07 10
+Without it, ``lookup_HUC10`` queries Earth Engine.
+"""
+
+import argparse
+import os
+import threading
+
+import ee
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+HUC10_ASSET = "USGS/WBD/2017/HUC10"
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), "data/WBDHU10.npz")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+class HUCIndex:
+    """An STRtree of simplified HUC10 polygons.
+
+    Parameters
+    ----------
+    ids:
+        array of HUC10 IDs.
+    names:
+        array of watershed names.
+    geometries:
+        array of shapely polygons in longitude/latitude.
+    """
+
+    def __init__(self, ids, names, geometries):
+        self.ids = ids
+        self.names = names
+        self.geometries = geometries
+        self.tree = shapely.STRtree(geometries)
+        self._positions = {huc: i for i, huc in enumerate(ids.tolist())}
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with np.load(path) as data:
+            offsets = data["offsets"]
+            buffer = data["wkb"].tobytes()
+            wkb = np.array(
+                [buffer[start:end] for start, end in zip(offsets[:-1], offsets[1:])],
+                dtype=object,
+            )
+            return cls(data["ids"], data["names"], shapely.from_wkb(wkb))
+
+    def save(self, path=INDEX_PATH):
+        wkb = shapely.to_wkb(self.geometries)
+        offsets = np.cumsum([0] + [len(item) for item in wkb])
+        np.savez_compressed(
+            path,
+            ids=self.ids,
+            names=self.names,
+            wkb=np.frombuffer(b"".join(wkb), dtype=np.uint8),
+            offsets=offsets,
+        )
+
+    def __contains__(self, huc):
+        return huc in self._positions
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self, lon, lat):
+        """Returns the ID of the HUC10 containing a point, or None if there is none."""
+        matches = self.tree.query(shapely.Point(lon, lat), predicate="intersects")
+        return str(self.ids[matches.min()]) if len(matches) else None
+
+    def name(self, huc):
+        return str(self.names[self._positions[huc]])
+
+    def geometry(self, huc):
+        return self.geometries[self._positions[huc]]
+
+    def center(self, huc):
+        """Returns the (lon, lat) of a point inside the watershed."""
+        point = self.geometry(huc).representative_point()
+        return point.x, point.y
+
+
+def get_index(path=INDEX_PATH):
+    """Returns the process-wide HUC10 index, or None if the index file is missing."""
+    global _index
+    with _index_lock:
+        if _index is None and os.path.exists(path):
+            _index = HUCIndex.load(path)
+        return _index
+
+
+def find_HUC10(watershed):
+    """Returns the feature collection of a HUC10 watershed.
+
+    Unlike ``geemap.find_HUC10``, unknown IDs are rejected locally when the
+    index is available instead of producing an empty collection on the server.
+    """
+    index = get_index()
+    if index is not None and watershed not in index:
+        raise ValueError(f"Unknown HUC10 watershed: {watershed}")
+    return ee.FeatureCollection(HUC10_ASSET).filter(ee.Filter.eq("huc10", watershed))
+
+
+def lookup_HUC10(lon, lat):
+    """Returns the ID of the HUC10 watershed containing a point, or None.
+
+    The local index is used when available; otherwise Earth Engine is queried.
+    """
+    index = get_index()
+    if index is not None:
+        return index.lookup(lon, lat)
+    point = ee.Geometry.Point([lon, lat])
+    matches = ee.FeatureCollection(HUC10_ASSET).filterBounds(point)
+    return matches.aggregate_first("huc10").getInfo()
+
+
+def build_index(prefixes=None, tolerance=30, page_size=500, path=INDEX_PATH):
+    """Builds the index file from the Earth Engine HUC10 collection.
+
+    Parameters
+    ----------
+    prefixes:
+        list of HUC2 region codes to include, e.g. ["05", "07", "10"]; all by default.
+    tolerance:
+        simplification tolerance of the polygons, in meters.
+    page_size:
+        number of watersheds fetched per request.
+    """
+    collection = ee.FeatureCollection(HUC10_ASSET)
+    if prefixes:
+        collection = collection.filter(
+            ee.Filter.Or(
+                *[ee.Filter.stringStartsWith("huc10", prefix) for prefix in prefixes]
+            )
+        )
+    collection = collection.map(
+        lambda f: ee.Feature(
+            f.geometry().simplify(tolerance),
+            {"huc10": f.get("huc10"), "name": f.get("name")},
+        )
+    )
+
+    size = collection.size().getInfo()
+    features = []
+    for start in range(0, size, page_size):
+        page = ee.FeatureCollection(collection.toList(page_size, start)).getInfo()
+        features.extend(page["features"])
+
+    index = HUCIndex(
+        np.array([f["properties"]["huc10"] for f in features]),
+        np.array([f["properties"]["name"] for f in features]),
+        shapely.make_valid(np.array([shape(f["geometry"]) for f in features])),
+    )
+    index.save(path)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--prefixes", nargs="*", help="HUC2 regions to include")
+    parser.add_argument("--tolerance", type=float, default=30)
+    parser.add_argument("--out", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    from .session import ee_initialize
+
+    ee_initialize()
+    index = build_index(args.prefixes, args.tolerance, path=args.out)
+    print(f"{len(index)} watersheds written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import ee
 import folium
 import streamlit as st
 import geemap.foliumap as geemap
+from .tile_proxy import add_basemap, add_wms_layer
+from .tiles import add_layer, ee_tile_layer
 
 
 def app():
@@ -15,7 +17,7 @@ def app():
         Map = geemap.Map(center=[40, -100], zoom=4)
 
         url = "https://index.nationalmap.gov/arcgis/services/3DEPElevationIndex/MapServer/WMSServer"
-        Map.add_wms_layer(url, "30", "USGS 3DEP")
+        add_wms_layer(Map, url, "30", "USGS 3DEP")
 
         dataset = ee.ImageCollection("USGS/3DEP/1m")
         visualization = {
@@ -23,14 +25,15 @@ def app():
             "max": 3000,
             "palette": "terrain",
         }
-        left_layer = geemap.ee_tile_layer(dataset, visualization, "3DEP GEE")
+        left_layer = ee_tile_layer(dataset, visualization, "3DEP GEE")
         # mosaic = dataset.mosaic().setDefaultProjection("EPSG:3857")
         # left_layer = geemap.ee_tile_layer(ee.Terrain.hillshade(mosaic), {}, "3DEP GEE")
 
         bbox = ee.Geometry.BBox(-127.2656, 23.4834, -66.0938, 50.3455)
         states = ee.FeatureCollection("TIGER/2018/States").filterBounds(bbox)
         Map.split_map(left_layer, left_layer)
-        Map.addLayer(
+        add_layer(
+            Map,
             states.style(**{"fillColor": "00000000", "color": "00000088", "width": 1}),
             {},
             "US States",
@@ -40,7 +43,7 @@ def app():
         ROI_style = ROI.style(
             **{"color": "000000", "width": 2, "fillColor": "00000000"}
         )
-        Map.addLayer(ROI_style, {}, "Study Area", False)
+        add_layer(Map, ROI_style, {}, "Study Area", False)
 
         Map.to_streamlit(height=650)
 
@@ -67,7 +70,7 @@ def app():
             center=[latitude, longitude], zoom=zoom, plugin_LatLngPopup=True
         )
 
-        Map.add_basemap("HYBRID")
+        add_basemap(Map, "HYBRID")
 
         dataset = ee.ImageCollection("USGS/3DEP/1m")
         dataset2 = ee.Image("USGS/3DEP/10m")
@@ -82,16 +85,17 @@ def app():
                 }
             )
 
-        left_layer = geemap.ee_tile_layer(
+        left_layer = ee_tile_layer(
             ee.Terrain.hillshade(mosaic), {}, "3DEP 1-m hillshade"
         )
 
         # Map.addLayer(ee.Terrain.hillshade(dataset2), {}, "3DEP 10-m hillshade")
-        Map.addLayer(geemap.blend(dataset2), {}, "3DEP 10-m hillshade")
+        add_layer(Map, geemap.blend(dataset2), {}, "3DEP 10-m hillshade")
         bbox = ee.Geometry.BBox(-127.2656, 23.4834, -66.0938, 50.3455)
         states = ee.FeatureCollection("TIGER/2018/States").filterBounds(bbox)
         Map.split_map(left_layer, left_layer)
-        Map.addLayer(
+        add_layer(
+            Map,
             states.style(**{"fillColor": "00000000", "color": "00000088", "width": 1}),
             {},
             "US States",
@@ -101,7 +105,7 @@ def app():
         ROI_style = ROI.style(
             **{"color": "0000FF", "width": 2, "fillColor": "00000000"}
         )
-        Map.addLayer(ROI_style, {}, "Study Area", False)
+        add_layer(Map, ROI_style, {}, "Study Area", False)
 
         with col1:
             Map.to_streamlit(height=650)
@@ -172,15 +176,15 @@ def app():
 
         Map = geemap.Map(center=[40, -100], zoom=4, plugin_LatLngPopup=True)
 
-        Map.add_basemap(basemap)
+        add_basemap(Map, basemap)
 
         dataset = ee.ImageCollection("USGS/3DEP/1m")
         dataset2 = ee.Image("USGS/3DEP/10m")
 
-        Map.addLayer(geemap.blend(dataset2), {}, "3DEP 10-m hillshade")
+        add_layer(Map, geemap.blend(dataset2), {}, "3DEP 10-m hillshade")
 
         mosaic = dataset.mosaic().setDefaultProjection("EPSG:3857")
-        Map.addLayer(ee.Terrain.hillshade(mosaic), {}, "3DEP 1-m hillshade")
+        add_layer(Map, ee.Terrain.hillshade(mosaic), {}, "3DEP 1-m hillshade")
         style = {"color": "ffff00", "fillColor": "00000000"}
         if set_map:
             Map.setCenter(longitude, latitude, zoom)
@@ -194,7 +198,7 @@ def app():
                 .clipToCollection(selected_fc)
             )
             jrc_vis = {"min": 0, "max": 100, "palette": ["ffffff", "ffbbbb", "0000ff"]}
-            Map.addLayer(jrc, jrc_vis, "JRC Water Occurrence")
+            add_layer(Map, jrc, jrc_vis, "JRC Water Occurrence")
             Map.add_colorbar(jrc_vis, label="Water occurrence (%)")
 
         if add_nwi:
@@ -237,7 +241,7 @@ def app():
                     }
                 )
             )
-            Map.addLayer(nwi_fc.style(**{"styleProperty": "style"}), {}, "NWI")
+            add_layer(Map, nwi_fc.style(**{"styleProperty": "style"}), {}, "NWI")
             Map.add_legend(title="NWI Wetland Type", builtin_legend="NWI")
 
         prefix = f"projects/sat-io/open-datasets/NHD/NHD_{name}/"
@@ -251,12 +255,12 @@ def app():
                     "fillColor": fill_color[1:] + hex(int(opacity * 255))[2:].zfill(2),
                 }
 
-                Map.addLayer(data.style(**data_style), {}, dataset)
+                add_layer(Map, data.style(**data_style), {}, dataset)
             except Exception as e:
                 with col2:
                     st.error(f"dataset {dataset} not found")
 
-        Map.addLayer(selected_fc.style(**style), {}, state)
+        add_layer(Map, selected_fc.style(**style), {}, state)
 
         with col1:
             Map.to_streamlit(height=650)
@@ -276,7 +280,7 @@ def app():
         layers = None
 
         Map = geemap.Map()
-        Map.add_basemap("TERRAIN")
+        add_basemap(Map, "TERRAIN")
 
         datasets = {
             "ND - James River Basin LiDAR Phase 1": ee.FeatureCollection(
@@ -332,7 +336,7 @@ def app():
 
             data = st.multiselect("Select a dataset", options, default=default)
             for d in data:
-                Map.addLayer(datasets[d], {}, d)
+                add_layer(Map, datasets[d], {}, d)
 
         # url = "https://elevation.nationalmap.gov/arcgis/services/3DEPElevation/ImageServer/WMSServer?"
         # Map.add_wms_layer(
@@ -343,7 +347,7 @@ def app():
         #     transparent=True,
         # )
 
-        Map.addLayer(roi.style(**style), {}, "MRB")
+        add_layer(Map, roi.style(**style), {}, "MRB")
         Map.centerObject(roi)
 
         with row1_col1:
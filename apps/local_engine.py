@@ -0,0 +1,443 @@
+"""An offline engine running the NAIP water mapping algorithm on local rasters.
+
+It mirrors the Earth Engine pipeline of ``apps/water.py`` without any server
+call: X-Means clustering of each NAIP year, selection of the clusters found in
+JRC permanent water, refinement by the USDA cropland water extent, omission
+against the JRC monthly water, and area summaries. Rasters are read window by
+window and the windows are processed by a pool of worker processes.
+
+All rasters are resampled on the fly (nearest neighbour) onto the grid of the
+first NAIP image, so they may come in any projection and resolution.
+
+Usage:
+    python -m apps.local_engine config.json
+
+where config.json holds the keyword arguments of ``run_local``.
+"""
+
+import argparse
+import concurrent.futures
+import json
+
+import numpy as np
+import rasterio
+from rasterio import features
+from rasterio.transform import rowcol, xy
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window, transform as window_transform
+
+from .common import nwi_summary, stats_row, training_seed
+
+# USDA cropland classes of open water and wetlands
+USDA_WATER_CLASSES = [83, 87, 111, 190, 195]
+
+# Scale (m) of the cluster frequency histogram, as in the server version
+HISTOGRAM_SCALE = 30
+
+# Rasters opened by the current process: {(path, grid): (dataset, warped dataset)}
+_datasets = {}
+
+
+def open_on_grid(path, grid):
+    """Opens a raster resampled onto the reference grid, once per process."""
+    key = (path, grid["crs"], grid["transform"], grid["width"], grid["height"])
+    if key not in _datasets:
+        src = rasterio.open(path)
+        vrt = WarpedVRT(
+            src,
+            crs=grid["crs"],
+            transform=grid["transform"],
+            width=grid["width"],
+            height=grid["height"],
+            resampling=Resampling.nearest,
+        )
+        _datasets[key] = (src, vrt)
+    return _datasets[key][1]
+
+
+def naip_features(pixels):
+    """Returns the R, G, B, N, NDVI and NDWI features of 4-band NAIP pixels."""
+    pixels = pixels.astype(np.float32)
+    red, green, nir = pixels[:, 0], pixels[:, 1], pixels[:, 3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ndvi = np.nan_to_num((nir - red) / (nir + red))
+        ndwi = np.nan_to_num((green - nir) / (green + nir))
+    return np.column_stack([pixels[:, :4], ndvi, ndwi])
+
+
+def read_naip(path, grid, window):
+    """Reads NAIP pixels of a window as a (n, 6) feature array and a validity mask."""
+    data = open_on_grid(path, grid).read([1, 2, 3, 4], window=window, masked=True)
+    valid = ~np.ma.getmaskarray(data).any(axis=0)
+    pixels = data.data.reshape(4, -1).T
+    return naip_features(pixels), valid.ravel()
+
+
+def assign_clusters(samples, centers):
+    """Returns the index of the nearest center of every sample."""
+    distances = (
+        -2 * samples @ centers.T + (centers**2).sum(axis=1)[np.newaxis, :]
+    )  # the squared norm of the samples does not change the argmin
+    return distances.argmin(axis=1)
+
+
+def kmeans(samples, k, rng, iterations=100):
+    """Clusters samples into k clusters with Lloyd's algorithm."""
+    centers = samples[rng.choice(len(samples), k, replace=False)]
+    for _ in range(iterations):
+        labels = assign_clusters(samples, centers)
+        updated = np.array(
+            [
+                samples[labels == i].mean(axis=0) if np.any(labels == i) else centers[i]
+                for i in range(k)
+            ]
+        )
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return centers, assign_clusters(samples, centers)
+
+
+def bic(samples, centers, labels):
+    """Bayesian information criterion of a k-means model (Pelleg and Moore, 2000)."""
+    n, d = samples.shape
+    k = len(centers)
+    sse = ((samples - centers[labels]) ** 2).sum()
+    variance = max(sse / max(n - k, 1) / d, 1e-12)
+    counts = np.bincount(labels, minlength=k)
+    counts = counts[counts > 0]
+    log_likelihood = (
+        (counts * np.log(counts)).sum()
+        - n * np.log(n)
+        - n * d / 2 * np.log(2 * np.pi * variance)
+        - (n - k) * d / 2
+    )
+    return log_likelihood - k * (d + 1) / 2 * np.log(n)
+
+
+def xmeans(samples, seed, min_clusters=2, max_clusters=8):
+    """Clusters samples choosing the number of clusters by BIC, like Weka's X-Means.
+
+    The features are min/max normalized as Weka's Euclidean distance does.
+
+    Returns
+    -------
+    tuple
+        The cluster centers and the (offset, scale) normalization of the features.
+
+    Raises
+    ------
+    ValueError
+        If there are fewer than ``min_clusters`` samples.
+    """
+    if len(samples) < min_clusters:
+        raise ValueError(
+            f"X-Means needs at least {min_clusters} valid samples, got "
+            f"{len(samples)}; the training area has too few valid NAIP pixels."
+        )
+    offset = samples.min(axis=0)
+    scale = samples.max(axis=0) - offset
+    scale[scale == 0] = 1
+    normalized = (samples - offset) / scale
+
+    best = None
+    for k in range(min_clusters, min(max_clusters, len(samples)) + 1):
+        centers, labels = kmeans(normalized, k, np.random.default_rng(seed))
+        score = bic(normalized, centers, labels)
+        if best is None or score > best[0]:
+            best = (score, centers)
+    return best[1], (offset, scale)
+
+
+def classify(pixels, model):
+    centers, (offset, scale) = model
+    return assign_clusters((pixels - offset) / scale, centers)
+
+
+def train_model(path, grid, center, seed, radius=5000, scale=2, num_pixels=5000):
+    """Trains the clusterer of a NAIP year on pixels sampled around a point."""
+    transform = grid["transform"]
+    row, col = rowcol(transform, *center)
+    size = int(radius / abs(transform.a))
+    window = Window(col - size, row - size, 2 * size, 2 * size).intersection(
+        Window(0, 0, grid["width"], grid["height"])
+    )
+    # read the window at the sampling scale
+    factor = max(int(round(scale / abs(transform.a))), 1)
+    out_shape = (
+        4,
+        max(int(window.height) // factor, 1),
+        max(int(window.width) // factor, 1),
+    )
+    data = open_on_grid(path, grid).read(
+        [1, 2, 3, 4], window=window, out_shape=out_shape, masked=True
+    )
+    valid = ~np.ma.getmaskarray(data).any(axis=0).ravel()
+    pixels = naip_features(data.data.reshape(4, -1).T)[valid]
+
+    rng = np.random.default_rng(seed)
+    if len(pixels) > num_pixels:
+        pixels = pixels[rng.choice(len(pixels), num_pixels, replace=False)]
+    return xmeans(pixels, seed)
+
+
+def basin_mask(config, grid, window):
+    """Returns the pixels of a window inside the basin (all pixels without a basin)."""
+    shape = (int(window.height), int(window.width))
+    if not config.get("basin"):
+        return np.ones(shape, dtype=bool).ravel()
+    transform = window_transform(window, grid["transform"])
+    return features.geometry_mask(
+        config["basin"], shape, transform, invert=True
+    ).ravel()
+
+
+def sample_basin_pixel(config, grid, windows, rng):
+    """Returns the (row, col) of a pixel drawn uniformly from the basin of all windows."""
+    counts = np.array([basin_mask(config, grid, window).sum() for window in windows])
+    ends = np.cumsum(counts)
+    if not ends[-1]:
+        raise ValueError("The basin does not overlap the NAIP images.")
+    index = rng.integers(ends[-1])
+    i = int(np.searchsorted(ends, index, side="right"))
+    window = windows[i]
+    inside = basin_mask(config, grid, window).reshape(
+        int(window.height), int(window.width)
+    )
+    rows, cols = np.nonzero(inside)
+    offset = index - (ends[i] - counts[i])
+    return int(window.row_off + rows[offset]), int(window.col_off + cols[offset])
+
+
+def read_band(path, grid, window):
+    data = open_on_grid(path, grid).read(1, window=window, masked=True)
+    return np.ma.filled(data, 0).ravel()
+
+
+def _histograms(config, grid, models, window):
+    """Counts the clusters of every year inside JRC permanent water in a window."""
+    stride = max(int(round(HISTOGRAM_SCALE / abs(grid["transform"].a))), 1)
+    inside = basin_mask(config, grid, window)
+    occurrence = read_band(config["jrc_occurrence"], grid, window)
+    permanent = (occurrence > config["permanent_threshold"]) & inside
+
+    shape = (int(window.height), int(window.width))
+    sampled = np.zeros(shape, dtype=bool)
+    sampled[::stride, ::stride] = True
+    permanent &= sampled.ravel()
+
+    counts = {}
+    for year, path in config["naip"].items():
+        pixels, valid = read_naip(path, grid, window)
+        selected = permanent & valid
+        labels = classify(pixels[selected], models[year])
+        counts[year] = np.bincount(labels, minlength=len(models[year][0]))
+    return counts
+
+
+def _areas(config, grid, models, water_clusters, window):
+    """Sums the NAIP, JRC and omission water areas of every year in a window."""
+    pixel_area = abs(grid["transform"].a * grid["transform"].e) / 10000
+    inside = basin_mask(config, grid, window)
+
+    usda_occurrence = 0
+    for path in config["cdl"]:
+        cropland = read_band(path, grid, window)
+        usda_occurrence = usda_occurrence + np.isin(cropland, USDA_WATER_CLASSES)
+    usda_extent = usda_occurrence > config["usda_threshold"]
+
+    waters = {}
+    for year, path in config["naip"].items():
+        pixels, valid = read_naip(path, grid, window)
+        labels = classify(pixels, models[year])
+        waters[year] = valid & inside & np.isin(labels, water_clusters[year])
+    water_extent = sum(water.astype(np.uint8) for water in waters.values()) > 1
+
+    areas = {"JRC": {}, "NAIP": {}, "OMI": {}}
+    for year, water in waters.items():
+        refined = water & usda_extent & water_extent
+        jrc = (read_band(config["jrc_monthly"][year], grid, window) == 2) & inside
+        omission = ~refined & jrc
+        areas["NAIP"][f"Y{year}"] = refined.sum() * pixel_area
+        areas["JRC"][f"Y{year}"] = jrc.sum() * pixel_area
+        areas["OMI"][f"Y{year}"] = omission.sum() * pixel_area
+    return areas
+
+
+def _run_chunk(task):
+    func, config, grid, args, windows = task
+    return [func(config, grid, *args, window) for window in windows]
+
+
+def map_windows(executor, func, config, grid, args, windows, chunk_size):
+    """Applies func to every window on the process pool, in chunks of windows."""
+    chunks = [windows[i : i + chunk_size] for i in range(0, len(windows), chunk_size)]
+    tasks = [(func, config, grid, args, chunk) for chunk in chunks]
+    for results in executor.map(_run_chunk, tasks):
+        yield from results
+
+
+def nwi_stats(path, basin=None, crs=None):
+    """Computes the wetland polygon area statistics of a local NWI vector file."""
+    import geopandas as gpd
+
+    nwi = gpd.read_file(path)
+    if basin:
+        from shapely.geometry import shape
+
+        geoms = gpd.GeoSeries([shape(g) for g in basin], crs=crs).to_crs(nwi.crs)
+        nwi = nwi[nwi.intersects(geoms.union_all())]
+
+    area = nwi["Shape_Area"]
+    groups = area.groupby(nwi["WETLAND_TY"]).sum()
+    return {
+        "count": int(area.count()),
+        "sum": float(area.sum()),
+        "mean": float(area.mean()),
+        "median": float(area.median()),
+        "min": float(area.min()),
+        "max": float(area.max()),
+        "groups": [{"type": k, "sum": float(v)} for k, v in groups.items()],
+    }
+
+
+def run_local(
+    naip,
+    jrc_occurrence,
+    jrc_monthly,
+    cdl,
+    watershed="",
+    basin=None,
+    nwi=None,
+    cluster_threshold=0.1,
+    permanent_threshold=30,
+    usda_threshold=2,
+    workers=4,
+    block_size=1024,
+    chunk_size=8,
+    training_center=None,
+):
+    """Runs the NAIP water mapping algorithm on local rasters.
+
+    Parameters
+    ----------
+    naip:
+        {year: path} of 4-band (R, G, B, N) NAIP GeoTIFFs. The first one defines the output grid.
+    jrc_occurrence:
+        path of the JRC Global Surface Water occurrence raster.
+    jrc_monthly:
+        {year: path} of the JRC monthly water rasters (2 = water) matching each NAIP year.
+    cdl:
+        list of paths of the USDA Cropland Data Layer rasters.
+    watershed:
+        HUC10 watershed ID, used for the random seed and the output row.
+    basin:
+        list of GeoJSON-like geometries of the watershed, in the CRS of the first NAIP image.
+    nwi:
+        optional path of the NWI wetlands vector file of the watershed.
+    training_center:
+        (x, y) center of the training area; defaults to a seeded random pixel in the basin.
+
+    Returns
+    -------
+    dict
+        The "areas" and "summary" outputs and the CSV "stats" row, as in ``apps/water.py``.
+    """
+    naip = {str(year): path for year, path in sorted(naip.items())}
+    jrc_monthly = {str(year): path for year, path in jrc_monthly.items()}
+    config = {
+        "naip": naip,
+        "jrc_occurrence": jrc_occurrence,
+        "jrc_monthly": jrc_monthly,
+        "cdl": list(cdl),
+        "basin": basin,
+        "permanent_threshold": permanent_threshold,
+        "usda_threshold": usda_threshold,
+    }
+    with rasterio.open(next(iter(naip.values()))) as ref:
+        grid = {
+            "crs": ref.crs,
+            "transform": ref.transform,
+            "width": ref.width,
+            "height": ref.height,
+        }
+
+    windows = [
+        Window(
+            col,
+            row,
+            min(block_size, grid["width"] - col),
+            min(block_size, grid["height"] - row),
+        )
+        for row in range(0, grid["height"], block_size)
+        for col in range(0, grid["width"], block_size)
+    ]
+
+    seed = training_seed(watershed)
+    if training_center is None:
+        rng = np.random.default_rng(seed)
+        row, col = sample_basin_pixel(config, grid, windows, rng)
+        training_center = xy(grid["transform"], row, col)
+    models = {
+        year: train_model(path, grid, training_center, seed)
+        for year, path in naip.items()
+    }
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        totals = {year: np.zeros(len(models[year][0]), dtype=np.int64) for year in naip}
+        for counts in map_windows(
+            executor, _histograms, config, grid, (models,), windows, chunk_size
+        ):
+            for year, count in counts.items():
+                totals[year] += count
+
+        water_clusters = {}
+        for year, count in totals.items():
+            threshold = min(count.sum() * cluster_threshold, 5000)
+            water_clusters[year] = np.nonzero(count > threshold)[0]
+
+        areas = {"JRC": {}, "NAIP": {}, "OMI": {}}
+        for result in map_windows(
+            executor,
+            _areas,
+            config,
+            grid,
+            (models, water_clusters),
+            windows,
+            chunk_size,
+        ):
+            for product, values in result.items():
+                for year, value in values.items():
+                    areas[product][year] = areas[product].get(year, 0) + float(value)
+
+    summary = {"HUC_10": watershed, "HUC_08": watershed[0:8]}
+    if basin:
+        total = sum(basin_mask(config, grid, window).sum() for window in windows) * abs(
+            grid["transform"].a * grid["transform"].e
+        )
+        summary["HUC_Area"] = "{:.4f}".format(total / 1e4)
+    if nwi:
+        summary.update(nwi_summary(nwi_stats(nwi, basin, grid["crs"])))
+
+    return {"areas": areas, "summary": summary, "stats": stats_row(areas, summary)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("config", help="JSON file with the arguments of run_local")
+    parser.add_argument("--out", help="write the result as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    result = run_local(**config)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result["stats"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Latency spans of Earth Engine calls, geemap helpers and map renders.
+
+``instrument`` wraps the Earth Engine client calls (``getInfo``, ``getMapId``,
+thumbnails and downloads), the slow geemap helpers, the layers added through
+``apps.tiles``, map renders and ``geopandas.read_file`` with timing spans. Each span is tagged with the page
+being rendered, set by ``page`` in ``streamlit_app.py``, and feeds:
+
+- a histogram and a counter of the calls of each (page, span), exported in the
+  Prometheus text format by ``render_prometheus``, on
+  ``http://127.0.0.1:$NFW_METRICS_PORT/metrics`` when that variable is set (on
+  another interface with ``NFW_METRICS_HOST``, e.g. ``0.0.0.0`` for a scraper
+  on another host);
+- the quantiles of the latencies of the last ``WINDOW`` seconds;
+- a JSON lines log, ``CACHE_DIR/metrics.jsonl`` by default (``NFW_METRICS_LOG``),
+  written in batches and rotated past ``LOG_MAX_BYTES``.
+"""
+
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .store import CACHE_DIR
+
+LOG_PATH = os.environ.get("NFW_METRICS_LOG", os.path.join(CACHE_DIR, "metrics.jsonl"))
+PORT = os.environ.get("NFW_METRICS_PORT")
+HOST = os.environ.get("NFW_METRICS_HOST", "127.0.0.1")
+
+# Size (bytes) past which the log is rotated, keeping LOG_BACKUPS old logs
+LOG_MAX_BYTES = int(os.environ.get("NFW_METRICS_LOG_BYTES", 64 * 1024**2))
+LOG_BACKUPS = 3
+
+# Number of spans buffered before they are written to the log
+LOG_BUFFER = 100
+
+# Upper bounds (s) of the histogram buckets
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Time span (s) of the rolling latency quantiles
+WINDOW = 300
+QUANTILES = (0.5, 0.9, 0.99)
+
+# {module: [function names]} of the wrapped module functions
+TARGETS = {
+    "ee.data": [
+        "computeValue",
+        "getMapId",
+        "getThumbId",
+        "getVideoThumbId",
+        "getFilmstripThumbId",
+        "getDownloadId",
+        "getTableDownloadId",
+        "getAsset",
+        "listAssets",
+    ],
+    "geemap.foliumap": [
+        "create_timelapse",
+        "landsat_timelapse",
+        "goes_timelapse",
+        "goes_fire_timelapse",
+        "modis_ndvi_timelapse",
+        "modis_ocean_color_timelapse",
+        "reduce_gif_size",
+        "geocode",
+        "search_ee_data",
+        "geopandas_to_ee",
+        "ee_to_gdf",
+        "ee_to_geojson",
+    ],
+    "apps.tiles": ["tile_url", "ee_tile_layer", "add_layer"],
+    "geopandas": ["read_file"],
+    "streamlit_folium": ["st_folium"],
+}
+
+# {module: (class name, [method names])} of the wrapped methods
+METHOD_TARGETS = {
+    "geemap.foliumap": (
+        "Map",
+        ["addLayer", "add_wms_layer", "split_map", "add_styled_vector", "to_streamlit"],
+    ),
+    # the pages add their Earth Engine layers through apps.tiles, not addLayer
+    "apps.tiles": ("LayerBatch", ["add_to"]),
+}
+
+_page = contextvars.ContextVar("page", default="none")
+_registry = None
+_registry_lock = threading.Lock()
+_exporter = None
+
+
+class Registry:
+    """Thread-safe latency histograms of the spans, by page and span name."""
+
+    def __init__(self, log_path=LOG_PATH):
+        self.log_path = log_path
+        self._log = None
+        self._lock = threading.Lock()
+        self._buckets = collections.defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self._sums = collections.defaultdict(float)
+        self._errors = collections.Counter()
+        self._recent = collections.defaultdict(collections.deque)
+        if log_path:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+            # flushed every LOG_BUFFER spans and by logging.shutdown at exit
+            self._log = logging.handlers.MemoryHandler(
+                LOG_BUFFER,
+                flushLevel=logging.CRITICAL,
+                target=logging.handlers.RotatingFileHandler(
+                    log_path,
+                    maxBytes=LOG_MAX_BYTES,
+                    backupCount=LOG_BACKUPS,
+                    delay=True,
+                ),
+            )
+
+    def observe(self, page, name, duration, error=None):
+        key = (page, name)
+        now = time.time()
+        with self._lock:
+            self._buckets[key][bisect.bisect_left(BUCKETS, duration)] += 1
+            self._sums[key] += duration
+            if error is not None:
+                self._errors[key] += 1
+            recent = self._recent[key]
+            recent.append((now, duration))
+            while recent[0][0] < now - WINDOW:
+                recent.popleft()
+        if self._log is not None:
+            record = {
+                "time": now,
+                "page": page,
+                "span": name,
+                "duration": round(duration, 6),
+                "error": error,
+            }
+            line = {"msg": json.dumps(record), "levelno": logging.INFO}
+            self._log.handle(logging.makeLogRecord(line))
+
+    def quantiles(self, page, name):
+        """Returns the latency quantiles of a span over the last ``WINDOW`` seconds."""
+        with self._lock:
+            durations = sorted(
+                d for t, d in self._recent[(page, name)] if t >= time.time() - WINDOW
+            )
+        if not durations:
+            return {}
+        return {
+            q: durations[min(int(q * len(durations)), len(durations) - 1)]
+            for q in QUANTILES
+        }
+
+    def render_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP nfw_span_seconds Latency of the instrumented calls.",
+            "# TYPE nfw_span_seconds histogram",
+        ]
+        with self._lock:
+            keys = sorted(self._buckets)
+            buckets = {key: list(self._buckets[key]) for key in keys}
+            sums = dict(self._sums)
+            errors = dict(self._errors)
+        for key in keys:
+            labels = f'page="{key[0]}",span="{key[1]}"'
+            count = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), buckets[key]):
+                count += n
+                lines.append(
+                    f'nfw_span_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                )
+            lines.append(f"nfw_span_seconds_sum{{{labels}}} {sums[key]:.6f}")
+            lines.append(f"nfw_span_seconds_count{{{labels}}} {count}")
+        lines += [
+            "# HELP nfw_span_errors_total Instrumented calls that raised.",
+            "# TYPE nfw_span_errors_total counter",
+        ]
+        for key in keys:
+            labels = f'page="{key[0]}",span="{key[1]}"'
+            lines.append(f"nfw_span_errors_total{{{labels}}} {errors.get(key, 0)}")
+        lines += [
+            f"# HELP nfw_span_window_seconds Latency quantiles over the last {WINDOW} s.",
+            "# TYPE nfw_span_window_seconds summary",
+        ]
+        for key in keys:
+            for q, value in self.quantiles(*key).items():
+                labels = f'page="{key[0]}",span="{key[1]}",quantile="{q}"'
+                lines.append(f"nfw_span_window_seconds{{{labels}}} {value:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def get_registry():
+    """Returns the process-wide metrics registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = Registry()
+        return _registry
+
+
+def current_page():
+    return _page.get()
+
+
+@contextlib.contextmanager
+def page(name):
+    """Tags the spans recorded in the block with a page, and times the block."""
+    token = _page.set(name)
+    try:
+        with span("page"):
+            yield
+    finally:
+        _page.reset(token)
+
+
+@contextlib.contextmanager
+def span(name):
+    """Records the duration of the block as a span of the current page."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        get_registry().observe(current_page(), name, time.perf_counter() - start, error)
+
+
+def timed(name):
+    """Returns a decorator recording the calls of a function as spans."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        wrapper._nfw_span = name
+        return wrapper
+
+    return decorator
+
+
+def _wrap(owner, attr, name):
+    original = getattr(owner, attr, None)
+    if original is None or hasattr(original, "_nfw_span"):
+        return
+    wrapped = timed(name)(original)
+    setattr(owner, attr, wrapped)
+    # names bound by ``from module import func`` in the pages
+    for module_name, module in list(sys.modules.items()):
+        if module_name.startswith("apps.") and getattr(module, attr, None) is original:
+            setattr(module, attr, wrapped)
+
+
+def instrument():
+    """Wraps the targets of the already imported modules with spans; idempotent.
+
+    Called before each page runs, so that the libraries imported at the top of
+    a page module are instrumented from its first run on. Those a page imports
+    inside a function (e.g. ``geopandas`` or ``plotly``) are only instrumented
+    from the next page run on.
+    """
+    for module_name, attrs in TARGETS.items():
+        module = sys.modules.get(module_name)
+        if module is not None:
+            for attr in attrs:
+                _wrap(module, attr, f"{module_name}.{attr}")
+    for module_name, (class_name, attrs) in METHOD_TARGETS.items():
+        cls = getattr(sys.modules.get(module_name), class_name, None)
+        if cls is not None:
+            for attr in attrs:
+                _wrap(cls, attr, f"{class_name}.{attr}")
+    if PORT:
+        start_exporter(int(PORT))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = get_registry().render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_exporter(port, host=HOST):
+    """Serves ``/metrics`` in a background thread, once per process."""
+    global _exporter
+    with _registry_lock:
+        if _exporter is None:
+            try:
+                _exporter = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError:
+                # another process of the app already serves the port
+                _exporter = False
+                return
+            _exporter.daemon_threads = True
+            threading.Thread(target=_exporter.serve_forever, daemon=True).start()
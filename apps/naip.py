@@ -2,6 +2,8 @@ import os
 import ee
 import geemap.foliumap as geemap
 import streamlit as st
+from .tile_proxy import add_basemap
+from .tiles import add_layer
 
 
 def app():
@@ -35,7 +37,7 @@ def app():
     Map = geemap.Map(plugin_Draw=True, Draw_export=True)
     with col1:
         basemap = st.selectbox("Select a basemap", geemap.basemaps.keys())
-    Map.add_basemap(basemap)
+    add_basemap(Map, basemap)
 
     roi = ee.FeatureCollection("users/giswqs/MRB/NWI_HU8_Boundary_Simplify")
     style = {"color": "0000FF", "width": 2, "fillColor": "00000000"}
@@ -64,11 +66,11 @@ def app():
         if year in [2005, 2006, 2007]:
             vis_params = {"bands": ["R", "G", "B"]}
 
-        Map.addLayer(naip, vis_params, f"NAIP {year}")
+        add_layer(Map, naip, vis_params, f"NAIP {year}")
 
         with col4:
             st.write(f"Number of images: {naip_count[str(year)]}")
 
-    Map.addLayer(roi.style(**style), {}, "MRB")
+    add_layer(Map, roi.style(**style), {}, "MRB")
     Map.set_center(float(lon), float(lat), int(zoom))
     Map.to_streamlit(width=1400, height=700)
@@ -0,0 +1,275 @@
+"""A shared cache of the layers of WMS services.
+
+The layers of a service are parsed from its ``GetCapabilities`` document once
+and kept, as a compact list of ``(name, title, parent)`` tuples, in memory and
+in a SQLite database under ``CACHE_DIR``. Cached layers are returned at once;
+when they are older than ``CAPABILITIES_TTL``, the document is revalidated in
+a background thread with ``If-None-Match``/``If-Modified-Since``, so pages
+never wait on ``GetCapabilities`` once a service has been seen by any process.
+
+Only http(s) services are fetched, redirects to other hosts are refused, and
+failed or empty responses are never cached. Besides ``WMS_URLS``, at most
+``MAX_ENTRIES`` services (e.g. typed in the WMS page) are kept, the least
+recently checked being evicted.
+
+``get_wms_layers`` replaces ``geemap.get_wms_layers``.
+
+Usage::
+
+    python -m apps.ows [URL ...]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from xml.etree import ElementTree
+
+from .store import CACHE_DIR
+
+# Age (s) after which the layers of a service are revalidated
+CAPABILITIES_TTL = float(os.environ.get("NFW_OWS_TTL", 24 * 3600))
+
+# Number of cached services besides WMS_URLS
+MAX_ENTRIES = int(os.environ.get("NFW_OWS_MAX_ENTRIES", 64))
+
+# The services used by the pages, warmed by the CLI
+WMS_URLS = [
+    "https://services.terrascope.be/wms/v2",
+    "https://hydro.nationalmap.gov/arcgis/services/wbd/MapServer/WMSServer?",
+    "https://index.nationalmap.gov/arcgis/services/3DEPElevationIndex/MapServer/WMSServer",
+]
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class SameHostRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follows the redirects of a service to the same host only, never from https to http."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        old, new = urllib.parse.urlsplit(req.full_url), urllib.parse.urlsplit(newurl)
+        if new.hostname != old.hostname or new.scheme not in ("https", old.scheme):
+            raise urllib.error.HTTPError(
+                newurl, 403, "Redirect to another host", headers, fp
+            )
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(SameHostRedirectHandler)
+
+
+class CapabilitiesCache:
+    """A map of WMS URLs to their layers, backed by SQLite.
+
+    Parameters
+    ----------
+    path:
+        the SQLite database file.
+    ttl:
+        the age (s) after which the layers of a service are revalidated.
+    """
+
+    def __init__(self, path, ttl=CAPABILITIES_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._memory = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS capabilities (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked REAL NOT NULL,
+                    layers TEXT NOT NULL
+                )""")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self, url):
+        with self._lock:
+            if url not in self._memory:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT etag, last_modified, checked, layers FROM capabilities"
+                        " WHERE url = ?",
+                        (url,),
+                    ).fetchone()
+                if row is None:
+                    return None
+                etag, last_modified, checked, layers = row
+                layers = [tuple(layer) for layer in json.loads(layers)]
+                self._memory[url] = (etag, last_modified, checked, layers)
+            return self._memory[url]
+
+    def _save(self, url, etag, last_modified, layers):
+        checked = time.time()
+        with self._lock:
+            self._memory[url] = (etag, last_modified, checked, layers)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO capabilities VALUES (?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, checked, json.dumps(layers)),
+                )
+                self._evict(conn)
+
+    def _evict(self, conn):
+        placeholders = ", ".join("?" * len(WMS_URLS))
+        evicted = conn.execute(
+            f"SELECT url FROM capabilities WHERE url NOT IN ({placeholders})"
+            " ORDER BY checked DESC LIMIT -1 OFFSET ?",
+            (*WMS_URLS, MAX_ENTRIES),
+        ).fetchall()
+        for (url,) in evicted:
+            conn.execute("DELETE FROM capabilities WHERE url = ?", (url,))
+            self._memory.pop(url, None)
+
+    def refresh(self, url):
+        """Revalidates the layers of a service, downloading them if they changed.
+
+        Raises
+        ------
+        ValueError
+            If the URL is not an http(s) URL, or the response lists no layers.
+        """
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+            raise ValueError(f"Not an http(s) WMS URL: {url}")
+        cached = self._load(url)
+        request = urllib.request.Request(
+            capabilities_url(url), headers={"User-Agent": "nfw-ows"}
+        )
+        if cached is not None:
+            if cached[0]:
+                request.add_header("If-None-Match", cached[0])
+            if cached[1]:
+                request.add_header("If-Modified-Since", cached[1])
+        try:
+            with _opener.open(request, timeout=30) as response:
+                body = response.read()
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or cached is None:
+                raise
+            self._save(url, cached[0], cached[1], cached[3])
+            return cached[3]
+        layers = parse_layers(body)
+        if not layers:
+            raise ValueError(f"No WMS layers found at {url}")
+        self._save(url, headers.get("ETag"), headers.get("Last-Modified"), layers)
+        return layers
+
+    def _refresh_in_background(self, url):
+        try:
+            self.refresh(url)
+        except (urllib.error.URLError, OSError, ValueError, ElementTree.ParseError):
+            # keep serving the cached layers until the service is reachable
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def get(self, url):
+        """Returns the layers of a service, revalidating them in the background if stale."""
+        cached = self._load(url)
+        if cached is None:
+            return self.refresh(url)
+        if time.time() - cached[2] > self.ttl:
+            with self._lock:
+                start = url not in self._pending
+                self._pending.add(url)
+            if start:
+                threading.Thread(
+                    target=self._refresh_in_background, args=(url,), daemon=True
+                ).start()
+        return cached[3]
+
+
+def get_capabilities_cache(path=None):
+    """Returns the process-wide capabilities cache."""
+    if path is None:
+        path = os.path.join(CACHE_DIR, "ows.sqlite")
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = CapabilitiesCache(path)
+        return _caches[path]
+
+
+def capabilities_url(url):
+    """Returns the ``GetCapabilities`` request of a WMS URL."""
+    parts = urllib.parse.urlsplit(url)
+    query = [
+        (key, value)
+        for key, value in urllib.parse.parse_qsl(parts.query)
+        if key.lower() not in ("service", "request", "version")
+    ]
+    query += [("service", "WMS"), ("request", "GetCapabilities"), ("version", "1.1.1")]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def parse_layers(xml):
+    """Returns the named layers of a WMS capabilities document.
+
+    Returns
+    -------
+    A list of ``(name, title, parent)`` in document order, where ``parent`` is
+    the name of the closest named ancestor layer, or None.
+    """
+    root = ElementTree.fromstring(xml)
+    for elem in root.iter():
+        elem.tag = elem.tag.rpartition("}")[2]
+
+    def text(elem):
+        return elem.text.strip() if elem is not None and elem.text else None
+
+    layers = {}
+
+    def gather(parent_elem, parent):
+        for elem in parent_elem.findall("Layer"):
+            name = text(elem.find("Name"))
+            if name:
+                layers[name] = (name, text(elem.find("Title")), parent)
+            gather(elem, name or parent)
+
+    capability = root.find("Capability")
+    if capability is not None:
+        gather(capability, None)
+    return list(layers.values())
+
+
+def get_wms_layers(url, return_titles=False):
+    """Returns the sorted layer names of a WMS service, and their titles if ``return_titles``."""
+    layers = sorted(get_capabilities_cache().get(url))
+    names = [layer[0] for layer in layers]
+    if return_titles:
+        return names, [layer[1] for layer in layers]
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("urls", nargs="*", default=WMS_URLS, help="WMS URLs")
+    args = parser.parse_args()
+
+    cache = get_capabilities_cache()
+    for url in args.urls:
+        print(f"{len(cache.refresh(url))} layers cached for {url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@ import ee
 import geemap.foliumap as geemap
 import streamlit as st
 
+from .huc_catalog import get_catalog, select_unit
+from .tile_proxy import add_basemap
+from .tiles import add_layer
+
 
 def app():
 
@@ -14,7 +18,7 @@ def app():
     Map = geemap.Map(plugin_Draw=True, Draw_export=False)
     with col1:
         basemap = st.selectbox("Select a basemap", geemap.basemaps.keys())
-    Map.add_basemap(basemap)
+    add_basemap(Map, basemap)
 
     roi = ee.FeatureCollection("users/giswqs/MRB/NWI_HU8_Boundary_Simplify")
     style = {"color": "0000FF", "width": 2, "fillColor": "00000000"}
@@ -34,6 +38,18 @@ def app():
     with col7:
         zoom = st.text_input("Zoom", "4")
 
+    catalog = get_catalog()
+    bounds = None
+    # without the catalog file, the units have no bounds to zoom to
+    if catalog.has_bounds:
+        huc_col1, huc_col2, _ = st.columns([1, 1, 2])
+        subbasin = select_unit(huc_col1, "HU8", 8, key="planet_hu8")
+        watershed = select_unit(
+            huc_col2, "HU10", 10, prefix=subbasin or "", key="planet_hu10"
+        )
+        zoom_to = watershed or subbasin
+        bounds = catalog.bounds(zoom_to) if zoom_to else None
+
     if ratio == "Quarterly":
         with col4:
             quarter = st.slider("Select a quarter", 1, 4, 1)
@@ -74,8 +90,11 @@ def app():
             ee.Filter.stringStartsWith(**{"leftField": "huc8", "rightValue": "10"}),
         )
     )
-    Map.addLayer(huc8.style(**{"fillColor": "00000000"}), {}, "NHD-HUC8", False)
+    add_layer(Map, huc8.style(**{"fillColor": "00000000"}), {}, "NHD-HUC8", False)
 
-    Map.addLayer(roi.style(**style), {}, "MRB")
-    Map.set_center(float(lon), float(lat), int(zoom))
+    add_layer(Map, roi.style(**style), {}, "MRB")
+    if bounds is not None:
+        Map.fit_bounds(bounds)
+    else:
+        Map.set_center(float(lon), float(lat), int(zoom))
     Map.to_streamlit(width=1400, height=700)
@@ -0,0 +1,197 @@
+"""Record and replay of Earth Engine calls, to run recorded computations offline.
+
+With ``NFW_EE_REPLAY=record``, the responses of the Earth Engine calls in
+``CALLS`` (``getInfo``, ``getMapId``, thumbnails, downloads and the algorithm
+signatures loaded by ``ee.Initialize``) are written, while running against the
+live service, to ``NFW_EE_REPLAY_DIR`` (``data/replay`` by default). A capture
+is keyed by a hash of the call and of its serialized request graphs, so the
+same computation of any page maps to the same capture.
+
+With ``NFW_EE_REPLAY=replay``, the session is initialized without credentials
+nor network, and the calls are served from the captures; a call that was never
+recorded raises ``ee.EEException``. Replayed calls return instantly, or after
+their recorded latency with ``NFW_EE_REPLAY_LATENCY=recorded``, so that
+benchmarks are reproducible either way. The offline initialization relies on
+a private hook of the client, so it is only supported by the
+``earthengine-api`` versions in ``OFFLINE_EE_VERSIONS``.
+
+A capture only replays a computation whose graph is identical to the
+recorded one. Graphs built from the current date, e.g. the ``date.today()``
+end dates of the timelapse page, change every day and must be re-recorded;
+so must every capture after a change to a page or to ``ALGORITHM_VERSION``
+alters its graphs, or after an ``earthengine-api`` upgrade changes their
+serialization.
+
+``tests/test_replay.py`` checks that a computation recorded through
+``install`` is replayed by ``initialize_offline``, with stubbed ``ee.data``
+calls. The pages themselves, including the water mapping page, are not
+covered: whether a page runs offline is only known by running it with
+``NFW_EE_REPLAY=replay`` over a fresh recording.
+"""
+
+import base64
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+MODE = os.environ.get("NFW_EE_REPLAY", "")
+REPLAY_DIR = os.environ.get("NFW_EE_REPLAY_DIR", os.path.join("data", "replay"))
+LATENCY = os.environ.get("NFW_EE_REPLAY_LATENCY", "0")
+
+# earthengine-api versions (min included, max excluded) whose private
+# ee.data._install_cloud_api_resource hook initialize_offline relies on
+OFFLINE_EE_VERSIONS = ((1, 0), (2, 0))
+
+# Placeholder project of an offline session
+OFFLINE_PROJECT = "nfw-replay"
+
+# ee.data functions whose responses are recorded
+CALLS = [
+    "getAlgorithms",
+    "computeValue",
+    "getMapId",
+    "getThumbId",
+    "getThumbnail",
+    "getVideoThumbId",
+    "getFilmstripThumbId",
+    "getDownloadId",
+    "getTableDownloadId",
+    "getInfo",
+    "getAsset",
+    "listAssets",
+]
+
+
+class ReplayCredentials:
+    """Placeholder credentials of an offline session, never sent anywhere."""
+
+
+def call_key(name, args, kwargs):
+    """Returns the hash of an Earth Engine call and of its serialized arguments.
+
+    The key covers the whole graph of the arguments, including the dates and
+    any other values computed when the graph was built.
+    """
+    import ee
+
+    def encode(value):
+        if isinstance(value, ee.ComputedObject):
+            return ee.serializer.encode(value, for_cloud_api=True)
+        raise TypeError(f"Cannot serialize a {type(value).__name__}.")
+
+    data = json.dumps([name, args, kwargs], sort_keys=True, default=encode)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def capture_path(key, replay_dir=None):
+    return os.path.join(replay_dir or REPLAY_DIR, key[:2], f"{key}.json")
+
+
+def to_record(name, result):
+    """Returns the JSON form of the response of a call."""
+    if name == "getMapId":
+        return {
+            "mapid": result["mapid"],
+            "token": result.get("token", ""),
+            "url_format": result["tile_fetcher"].url_format,
+        }
+    if isinstance(result, bytes):
+        return {"bytes": base64.b64encode(result).decode()}
+    return result
+
+
+def from_record(name, record):
+    """Returns the response of a call from its JSON form."""
+    import ee
+
+    if name == "getMapId":
+        fetcher = ee.data.TileFetcher(record["url_format"], map_name=record["mapid"])
+        return {
+            "mapid": record["mapid"],
+            "token": record["token"],
+            "tile_fetcher": fetcher,
+        }
+    if isinstance(record, dict) and set(record) == {"bytes"}:
+        return base64.b64decode(record["bytes"])
+    return record
+
+
+def recording(name, func, replay_dir=None):
+    """Wraps an ``ee.data`` function so that its responses are recorded."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        path = capture_path(call_key(name, args, kwargs), replay_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        capture = {"call": name, "elapsed": elapsed, "result": to_record(name, result)}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(capture, f)
+        os.replace(tmp_path, path)
+        return result
+
+    return wrapper
+
+
+def replaying(name, func, replay_dir=None):
+    """Wraps an ``ee.data`` function so that its responses come from the captures."""
+    import ee
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = call_key(name, args, kwargs)
+        try:
+            with open(capture_path(key, replay_dir)) as f:
+                capture = json.load(f)
+        except FileNotFoundError:
+            raise ee.EEException(
+                f"No recorded response for {name} ({key}); "
+                "record it with NFW_EE_REPLAY=record."
+            ) from None
+        if LATENCY == "recorded":
+            time.sleep(capture["elapsed"])
+        return from_record(name, capture["result"])
+
+    return wrapper
+
+
+def install(mode=MODE, replay_dir=None):
+    """Wraps the ``ee.data`` calls for recording or replay; idempotent."""
+    import ee
+
+    wrap = {"record": recording, "replay": replaying}[mode]
+    for name in CALLS:
+        func = getattr(ee.data, name, None)
+        if func is not None and not hasattr(func, "_nfw_replay"):
+            wrapper = wrap(name, func, replay_dir)
+            wrapper._nfw_replay = mode
+            setattr(ee.data, name, wrapper)
+
+
+def initialize_offline(replay_dir=None):
+    """Initializes Earth Engine from the captures, without credentials nor network."""
+    import ee
+
+    version = tuple(int(part) for part in re.findall(r"\d+", ee.__version__)[:2])
+    low, high = OFFLINE_EE_VERSIONS
+    if not low <= version < high or not hasattr(ee.data, "_install_cloud_api_resource"):
+        raise ee.EEException(
+            f"Offline replay is not supported by earthengine-api {ee.__version__}; "
+            "install a version from {}.{} to {}.{} (excluded).".format(*low, *high)
+        )
+    install("replay", replay_dir)
+    # ee.Initialize loads the algorithms (replayed), but builds the API client
+    # from its discovery document; the replayed calls never use the client.
+    install_resource = ee.data._install_cloud_api_resource
+    ee.data._install_cloud_api_resource = lambda: None
+    try:
+        ee.Initialize(ReplayCredentials(), project=OFFLINE_PROJECT)
+    finally:
+        ee.data._install_cloud_api_resource = install_resource
@@ -0,0 +1,195 @@
+"""The process-wide Earth Engine session.
+
+Earth Engine is initialized once per process by ``ee_initialize``, with a
+single pooled HTTP transport shared by all the threads and Streamlit sessions
+of the process. By default, the Earth Engine client opens a new connection,
+and so a new TLS handshake, for every request.
+
+A keep-alive thread refreshes the OAuth credentials before they expire and,
+when the process has been idle, sends a cheap probe request, so that the
+first request after an idle period neither re-authenticates nor reconnects.
+The outcome of the last probe is reported by ``EESession.health``.
+
+With ``NFW_EE_REPLAY`` set, the session records the Earth Engine responses or
+replays them offline (see ``apps.replay``).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import replay
+
+# Size of the connection pool to Earth Engine
+POOL_SIZE = int(os.environ.get("NFW_EE_POOL_SIZE", 16))
+
+# Timeout (s) of a request to Earth Engine, so that a stalled connection never
+# blocks a thread forever
+TIMEOUT = float(os.environ.get("NFW_EE_TIMEOUT", 300))
+
+# Idle time (s) after which the keep-alive thread probes the connection
+KEEPALIVE = float(os.environ.get("NFW_EE_KEEPALIVE", 240))
+
+# Credentials are refreshed when they expire within REFRESH_MARGIN (s)
+REFRESH_MARGIN = 600
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PooledHttp:
+    """An ``httplib2.Http``-like transport over a shared ``requests`` session.
+
+    Parameters
+    ----------
+    pool_size:
+        the maximum number of kept-alive connections per host.
+    timeout:
+        the timeout (s) of a request.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(
+            "https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        )
+        self.last_used = 0.0
+
+    def request(
+        self,
+        uri,
+        method="GET",
+        body=None,
+        headers=None,
+        redirections=None,
+        connection_type=None,
+    ):
+        import httplib2
+
+        response = self.session.request(
+            method, uri, data=body, headers=headers, timeout=self.timeout
+        )
+        self.last_used = time.time()
+        response_headers = dict(response.headers)
+        response_headers["status"] = response.status_code
+        return httplib2.Response(response_headers), response.content
+
+
+class EESession:
+    """Initializes Earth Engine once and keeps its connection and credentials warm.
+
+    Parameters
+    ----------
+    pool_size:
+        the maximum number of kept-alive connections to Earth Engine.
+    keepalive:
+        the idle time (s) after which the connection is probed; 0 disables the keep-alive thread.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, keepalive=KEEPALIVE):
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.transport = None
+        self.credentials = None
+        self._initialized = False
+        self._lock = threading.Lock()
+        self._status = {"ok": None, "checked": None, "latency": None, "error": None}
+
+    @property
+    def initialized(self):
+        return self._initialized
+
+    def initialize(self):
+        """Initializes Earth Engine with the pooled transport, once."""
+        if self.initialized:
+            return
+        with self._lock:
+            if self.initialized:
+                return
+            if replay.MODE == "replay":
+                # no credentials, connection nor keep-alive to manage
+                replay.initialize_offline()
+                self._initialized = True
+                return
+            if replay.MODE == "record":
+                replay.install("record")
+
+            import ee
+            import geemap.foliumap as geemap
+
+            # authenticates, from the EARTHENGINE_TOKEN environment variable if set
+            geemap.ee_initialize()
+            self.transport = PooledHttp(self.pool_size)
+            self.credentials = ee.data._credentials
+            ee.Initialize(self.credentials, http_transport=self.transport)
+            self._initialized = True
+            if self.keepalive:
+                threading.Thread(target=self._keep_alive, daemon=True).start()
+
+    def refresh_credentials(self, force=False):
+        """Refreshes the OAuth credentials if they expire within ``REFRESH_MARGIN``."""
+        expiry = getattr(self.credentials, "expiry", None)
+        margin = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
+            seconds=REFRESH_MARGIN
+        )
+        if force or (expiry is not None and expiry < margin):
+            from google.auth.transport.requests import Request
+
+            self.credentials.refresh(Request(self.transport.session))
+
+    def probe(self):
+        """Sends a minimal computation to Earth Engine and returns the health status."""
+        import ee
+
+        self.initialize()
+        start = time.time()
+        try:
+            self.refresh_credentials()
+            ee.Number(1).getInfo()
+        except Exception as e:
+            status = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        else:
+            status = {"ok": True, "error": None}
+        status.update(checked=time.time(), latency=time.time() - start)
+        self._status = status
+        return self.health()
+
+    def health(self):
+        """Returns the outcome of the last probe, without any request."""
+        expiry = getattr(self.credentials, "expiry", None)
+        return {
+            "initialized": self.initialized,
+            **self._status,
+            "credentials_expiry": expiry.isoformat() if expiry else None,
+        }
+
+    def _keep_alive(self):
+        while True:
+            time.sleep(min(self.keepalive, REFRESH_MARGIN / 2))
+            if time.time() - self.transport.last_used >= self.keepalive:
+                self.probe()
+                continue
+            try:
+                self.refresh_credentials()
+            except Exception:
+                # retried on the next round, and by the transport once expired
+                pass
+
+
+def get_session():
+    """Returns the process-wide Earth Engine session."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = EESession()
+        return _session
+
+
+def ee_initialize():
+    """Initializes Earth Engine for the process (replaces ``geemap.ee_initialize``)."""
+    get_session().initialize()
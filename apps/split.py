@@ -5,7 +5,9 @@ import pandas as pd
 import streamlit as st
 import geemap.foliumap as geemap
 import folium.plugins as plugins
-from .data_dict import DEMS, LANDCOVERS, LANDFORMS
+from .data_dict import DEMS, LANDCOVERS, LANDFORMS, derived_layer
+from .tile_proxy import add_basemap
+from .tiles import add_layer, ee_tile_layer
 
 
 def app():
@@ -74,8 +76,8 @@ def app():
         measure_control=False,
         google_map=False,
     )
-    Map.add_basemap("HYBRID")
-    Map.add_basemap("TERRAIN")
+    add_basemap(Map, "HYBRID")
+    add_basemap(Map, "TERRAIN")
     measure = plugins.MeasureControl(position="bottomleft", active_color="orange")
     measure.add_to(Map)
 
@@ -83,40 +85,21 @@ def app():
         "users/giswqs/MRB/NWI_HU8_Boundary_Simplify"
     )
 
+    roi = st.session_state["ROI"] if clip else None
+
     if left_name in basemaps:
         left_layer = basemaps[left_name]
     else:
-        if left_name in DEMS:
-            data = DEMS[left_name]
-        elif left_name in LANDCOVERS:
-            data = LANDCOVERS[left_name]
-        elif left_name in LANDFORMS:
-            data = LANDFORMS[left_name]
-
-        if clip:
-            data["id"] = data["id"].clip(st.session_state["ROI"])
-        if left_palette != "Default":
-            if left_name in DEMS:
-                data["vis"]["palette"] = cm.get_palette(left_palette, 15)
-        left_layer = geemap.ee_tile_layer(data["id"], data["vis"], left_name)
+        palette = None if left_palette == "Default" else left_palette
+        image, vis = derived_layer(left_name, roi, palette)
+        left_layer = ee_tile_layer(image, vis, left_name)
 
     if right_name in basemaps:
         right_layer = basemaps[right_name]
     else:
-        if right_name in DEMS:
-            data = DEMS[right_name]
-        elif right_name in LANDCOVERS:
-            data = LANDCOVERS[right_name]
-        elif right_name in LANDFORMS:
-            data = LANDFORMS[right_name]
-
-        if clip:
-            data["id"] = data["id"].clip(st.session_state["ROI"])
-
-        if right_palette != "Default":
-            if right_name in DEMS:
-                data["vis"]["palette"] = cm.get_palette(right_palette, 15)
-        right_layer = geemap.ee_tile_layer(data["id"], data["vis"], right_name)
+        palette = None if right_palette == "Default" else right_palette
+        image, vis = derived_layer(right_name, roi, palette)
+        right_layer = ee_tile_layer(image, vis, right_name)
 
     if left_name == right_name:
         st.error("Please select different layers")
@@ -124,13 +107,13 @@ def app():
 
     sinks_30m = ee.FeatureCollection("users/giswqs/MRB/NED_30m_sinks")
 
-    Map.addLayer(sinks_30m, {}, "Depressions (30m)", False)
+    add_layer(Map, sinks_30m, {}, "Depressions (30m)", False)
 
     sinks_10m = ee.FeatureCollection("users/giswqs/MRB/NED_10m_sinks")
     sinks_10m_style = sinks_10m.style(
         **{"color": "0000ff", "width": 2, "fillColor": "0000ff44"}
     )
-    Map.addLayer(sinks_10m_style, {}, "Depressions (10m)", False)
+    add_layer(Map, sinks_10m_style, {}, "Depressions (10m)", False)
 
     huc8 = ee.FeatureCollection("USGS/WBD/2017/HUC10").filter(
         ee.Filter.Or(
@@ -139,14 +122,14 @@ def app():
             ee.Filter.stringStartsWith(**{"leftField": "huc10", "rightValue": "10"}),
         )
     )
-    Map.addLayer(
-        huc8.style(**{"fillColor": "00000000", "width": 1}), {}, "NHD-HUC10", False
+    add_layer(
+        Map, huc8.style(**{"fillColor": "00000000", "width": 1}), {}, "NHD-HUC10", False
     )
 
     ROI_style = st.session_state["ROI"].style(
         **{"color": "ff0000", "width": 2, "fillColor": "00000000"}
     )
-    Map.addLayer(ROI_style, {}, "Study Area")
+    add_layer(Map, ROI_style, {}, "Study Area")
 
     if left_name in LANDFORMS or right_name in LANDFORMS:
         Map.add_legend(title="ALOS Landforms", builtin_legend="ALOS_landforms")
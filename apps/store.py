@@ -0,0 +1,169 @@
+"""A disk-backed store of per-watershed NAIP water mapping results.
+
+Results are kept in a SQLite database keyed by
+``(watershed, cluster_threshold, permanent_threshold, usda_threshold)``. Every
+entry carries the algorithm version it was computed with; entries of other
+versions are dropped when the store is opened. The least recently used
+entries are evicted once the database grows beyond ``max_bytes``.
+
+The store also keeps the training sample location of the X-Means clustering of
+each watershed, so that reruns train on exactly the same pixels.
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.environ.get(
+    "NFW_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "nfw")
+)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ResultStore:
+    """A size-bounded, versioned SQLite store of watershed results.
+
+    Parameters
+    ----------
+    path:
+        the SQLite database file.
+    version:
+        the algorithm version of the results; entries of any other version are stale.
+    max_bytes:
+        the total size of the stored values above which the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, version, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.version = version
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                    watershed TEXT NOT NULL,
+                    cluster_threshold REAL NOT NULL,
+                    permanent_threshold REAL NOT NULL,
+                    usda_threshold REAL NOT NULL,
+                    version INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (watershed, cluster_threshold, permanent_threshold, usda_threshold)
+                )""")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+            )
+            conn.execute("""CREATE TABLE IF NOT EXISTS training (
+                    watershed TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    value TEXT NOT NULL
+                )""")
+            conn.execute("DELETE FROM results WHERE version != ?", (version,))
+            conn.execute("DELETE FROM training WHERE version != ?", (version,))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, watershed, cluster_threshold, permanent_threshold, usda_threshold):
+        """Returns the stored result dictionary, or None if there is none."""
+        key = (watershed, cluster_threshold, permanent_threshold, usda_threshold)
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                """SELECT value FROM results WHERE watershed = ? AND cluster_threshold = ?
+                AND permanent_threshold = ? AND usda_threshold = ? AND version = ?""",
+                key + (self.version,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """UPDATE results SET accessed = ? WHERE watershed = ? AND cluster_threshold = ?
+                AND permanent_threshold = ? AND usda_threshold = ?""",
+                (time.time(),) + key,
+            )
+        return json.loads(row[0])
+
+    def put(
+        self, watershed, cluster_threshold, permanent_threshold, usda_threshold, value
+    ):
+        """Stores a result dictionary, merging it into any existing entry of the same key."""
+        key = (watershed, cluster_threshold, permanent_threshold, usda_threshold)
+        existing = self.get(*key) or {}
+        existing.update(value)
+        data = json.dumps(existing)
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (self.version, data, len(data), time.time()),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT rowid, size FROM results ORDER BY accessed ASC"
+        ).fetchall()
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM results WHERE rowid = ?", (rowid,))
+            total -= size
+
+    def items(self):
+        """Yields the (key, value) of every entry, without updating access times."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                """SELECT watershed, cluster_threshold, permanent_threshold, usda_threshold,
+                value FROM results WHERE version = ?""",
+                (self.version,),
+            ).fetchall()
+        for row in rows:
+            yield tuple(row[:4]), json.loads(row[4])
+
+    def get_training(self, watershed):
+        """Returns the stored training sample of a watershed, or None if there is none."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM training WHERE watershed = ? AND version = ?",
+                (watershed, self.version),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put_training(self, watershed, value):
+        """Stores the training sample of a watershed."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO training VALUES (?, ?, ?)",
+                (watershed, self.version, json.dumps(value)),
+            )
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM training")
+
+
+def get_store(version, path=None):
+    """Returns the process-wide result store of the given algorithm version."""
+    if path is None:
+        path = os.path.join(CACHE_DIR, "results.sqlite")
+    with _stores_lock:
+        if (path, version) not in _stores:
+            _stores[(path, version)] = ResultStore(path, version)
+        return _stores[(path, version)]
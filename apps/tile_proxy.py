@@ -0,0 +1,533 @@
+"""A local caching proxy for XYZ map tiles.
+
+When ``NFW_TILE_PROXY`` is set, the tile URLs of Earth Engine layers and
+basemaps are rewritten to a small HTTP server running in the app process,
+which serves tiles from a size-capped disk cache under ``CACHE_DIR`` and
+fetches the missing ones upstream. Stale tiles are revalidated with
+``If-None-Match``/``If-Modified-Since`` requests, so unchanged tiles are never
+downloaded twice. All sessions of the process share the cache.
+
+A proxied URL template looks like
+``<proxy>/t/<signature>/<base64 upstream template>/{z}/{x}/{y}``, so the proxy
+holds no state besides the cache. WMS layers are served as an XYZ pyramid under
+``<proxy>/w/<signature>/<base64 layer spec>/{z}/{x}/{y}``: each ``GetMap``
+request renders a metatile of ``METATILE`` x ``METATILE`` tiles (a power of two
+up to 16, ``NFW_WMS_METATILE``), which is sliced and cached at once.
+``NFW_TILE_PROXY_URL`` sets the address the browser reaches the proxy at
+(``http://127.0.0.1:<port>`` by default), e.g. when it runs behind a reverse
+proxy.
+
+The proxy only serves the templates it signed, with an HMAC key shared by the
+app processes of the host (``NFW_TILE_PROXY_SECRET``, or a key file created
+under ``CACHE_DIR``), and only fetches tiles over https from ``TILE_HOSTS``
+and WMS layers from ``WMS_HOSTS``; other tile and WMS URLs are left unproxied.
+"""
+
+import base64
+import contextlib
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from .ows import WMS_URLS, SameHostRedirectHandler
+from .store import CACHE_DIR
+
+ENABLED = bool(os.environ.get("NFW_TILE_PROXY"))
+PORT = int(os.environ.get("NFW_TILE_PROXY_PORT", 8765))
+PUBLIC_URL = os.environ.get("NFW_TILE_PROXY_URL", f"http://127.0.0.1:{PORT}")
+MAX_BYTES = int(os.environ.get("NFW_TILE_CACHE_BYTES", 1024**3))
+
+# Freshness of tiles whose response has no max-age
+DEFAULT_MAX_AGE = 24 * 3600
+
+# Upstream hosts of the proxied tile templates, fetched over https only
+TILE_HOSTS = {
+    "earthengine.googleapis.com",
+    "mt1.google.com",
+    "storage.googleapis.com",
+}
+
+# Hosts of the WMS services of the pages, rendered over https only
+WMS_HOSTS = {urllib.parse.urlsplit(url).hostname for url in WMS_URLS}
+
+# Google basemaps used by the pages: {name: (url, attribution)}
+BASEMAPS = {
+    "ROADMAP": ("https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}", "Google"),
+    "SATELLITE": ("https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}", "Google"),
+    "TERRAIN": ("https://mt1.google.com/vt/lyrs=p&x={x}&y={y}&z={z}", "Google"),
+    "HYBRID": ("https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}", "Google"),
+}
+
+
+def metatile_size(value):
+    """Returns the metatile size set by ``value``, rounded down to a power of two.
+
+    A metatile must align with the tile pyramid, so its size is a power of two,
+    from 1 (no metatiling) to 16 tiles.
+    """
+    try:
+        n = int(value)
+    except ValueError:
+        raise ValueError(
+            f"NFW_WMS_METATILE must be an integer, not {value!r}."
+        ) from None
+    if not 1 <= n <= 16:
+        raise ValueError(f"NFW_WMS_METATILE must be between 1 and 16, not {n}.")
+    return 1 << (n.bit_length() - 1)
+
+
+# A WMS metatile spans METATILE x METATILE tiles and is rendered with a GUTTER
+# (px) around it, so that labels near its edges are placed as in its neighbours.
+METATILE = metatile_size(os.environ.get("NFW_WMS_METATILE", 4))
+GUTTER = 128
+TILE_SIZE = 256
+
+# Half the width (m) of the web mercator world
+ORIGIN = 20037508.342789244
+
+_metatile_locks = [threading.Lock() for _ in range(64)]
+_server = None
+_server_lock = threading.Lock()
+_secret = None
+
+
+class TileStore:
+    """A size-capped disk cache of tiles with their validators.
+
+    Parameters
+    ----------
+    cache_dir:
+        directory of the tile files and their SQLite index.
+    max_bytes:
+        the total size of the tiles above which the least recently used ones are evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS tiles (
+                    key TEXT PRIMARY KEY,
+                    content_type TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    expires REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )""")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """Returns the (metadata, body) of a cached tile, or None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT content_type, etag, last_modified, expires FROM tiles WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tiles SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        try:
+            with open(self._path(key), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        meta = dict(zip(["content_type", "etag", "last_modified", "expires"], row))
+        return meta, body
+
+    def put(self, key, meta, body=None):
+        """Stores a tile; without a body, only refreshes the metadata of a cached tile."""
+        if body is not None:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        with self._lock, self._connect() as conn:
+            if body is None:
+                conn.execute(
+                    "UPDATE tiles SET expires = ?, accessed = ? WHERE key = ?",
+                    (meta["expires"], time.time(), key),
+                )
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    meta["content_type"],
+                    meta["etag"],
+                    meta["last_modified"],
+                    meta["expires"],
+                    len(body),
+                    time.time(),
+                ),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM tiles ORDER BY accessed ASC")
+        for key, size in rows.fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM tiles WHERE key = ?", (key,))
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path(key))
+            total -= size
+
+
+def read_key(path):
+    """Returns the key stored in a file, created with a random key if missing."""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT, 0o600), "wb") as f:
+            f.write(os.urandom(32))
+        # the first process to link its key wins
+        with contextlib.suppress(FileExistsError):
+            os.link(tmp_path, path)
+        os.remove(tmp_path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def get_secret():
+    """Returns the HMAC key of the proxied URLs, shared by the processes of the host."""
+    global _secret
+    with _server_lock:
+        if _secret is None:
+            _secret = os.environ.get("NFW_TILE_PROXY_SECRET", "").encode() or read_key(
+                os.path.join(CACHE_DIR, "tile_proxy.key")
+            )
+        return _secret
+
+
+def sign(kind, encoded):
+    """Returns the signature of a base64 tile template ("t") or WMS layer spec ("w")."""
+    message = f"{kind}/{encoded}".encode()
+    return hmac.new(get_secret(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def allowed(url, hosts):
+    """Returns whether a URL is an https URL of one of the hosts."""
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme == "https" and parts.hostname in hosts
+
+
+_opener = urllib.request.build_opener(SameHostRedirectHandler)
+
+
+def max_age(headers):
+    match = re.search(r"max-age=(\d+)", headers.get("Cache-Control") or "")
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+def fetch_tile(store, url):
+    """Returns the (status, content type, body) of a tile, from the cache if fresh."""
+    key = hashlib.sha256(url.encode()).hexdigest()
+    cached = store.get(key)
+    if cached is not None and cached[0]["expires"] > time.time():
+        return 200, cached[0]["content_type"], cached[1]
+
+    request = urllib.request.Request(url, headers={"User-Agent": "nfw-tile-proxy"})
+    if cached is not None:
+        if cached[0]["etag"]:
+            request.add_header("If-None-Match", cached[0]["etag"])
+        if cached[0]["last_modified"]:
+            request.add_header("If-Modified-Since", cached[0]["last_modified"])
+    try:
+        with _opener.open(request, timeout=30) as response:
+            body = response.read()
+            headers = response.headers
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached is not None:
+            store.put(key, {"expires": time.time() + max_age(e.headers)})
+            return 200, cached[0]["content_type"], cached[1]
+        return e.code, "text/plain", e.read()
+
+    meta = {
+        "content_type": headers.get("Content-Type", "image/png"),
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "expires": time.time() + max_age(headers),
+    }
+    store.put(key, meta, body)
+    return 200, meta["content_type"], body
+
+
+def tile_bounds(z, x, y, n=1):
+    """Returns the web mercator bounds of the n x n tiles from tile (z, x, y)."""
+    size = 2 * ORIGIN / 2**z
+    return (
+        -ORIGIN + x * size,
+        ORIGIN - (y + n) * size,
+        -ORIGIN + (x + n) * size,
+        ORIGIN - y * size,
+    )
+
+
+def wms_key(spec, z, x, y):
+    return hashlib.sha256(f"{spec}/{z}/{x}/{y}".encode()).hexdigest()
+
+
+def fetch_wms_tile(store, spec, z, x, y):
+    """Returns the (status, content type, body) of a tile of a WMS layer.
+
+    A missing or stale tile is cut from the metatile containing it, rendered by
+    a single ``GetMap`` request, and all the tiles of the metatile are cached.
+
+    Parameters
+    ----------
+    store:
+        the tile cache.
+    spec:
+        the JSON layer spec (``url`` and the ``GetMap`` parameters of the layer).
+    z, x, y:
+        the tile.
+    """
+    key = wms_key(spec, z, x, y)
+    n = min(METATILE, 2**z)
+    mx, my = x - x % n, y - y % n
+    with _metatile_locks[hash((spec, z, mx, my)) % len(_metatile_locks)]:
+        # concurrent requests for the tiles of a metatile render it only once
+        cached = store.get(key)
+        if cached is not None and cached[0]["expires"] > time.time():
+            return 200, cached[0]["content_type"], cached[1]
+
+        params = json.loads(spec)
+        url = params.pop("url")
+        xmin, ymin, xmax, ymax = tile_bounds(z, mx, my, n)
+        gutter = GUTTER * (xmax - xmin) / (n * TILE_SIZE)
+        size = n * TILE_SIZE + 2 * GUTTER
+        params.update(
+            service="WMS",
+            request="GetMap",
+            version="1.1.1",
+            srs="EPSG:3857",
+            bbox=f"{xmin - gutter},{ymin - gutter},{xmax + gutter},{ymax + gutter}",
+            width=size,
+            height=size,
+        )
+        url = url.rstrip("?&")
+        separator = "&" if "?" in url else "?"
+        request = urllib.request.Request(
+            url + separator + urllib.parse.urlencode(params),
+            headers={"User-Agent": "nfw-tile-proxy"},
+        )
+        if cached is not None:
+            if cached[0]["etag"]:
+                request.add_header("If-None-Match", cached[0]["etag"])
+            if cached[0]["last_modified"]:
+                request.add_header("If-Modified-Since", cached[0]["last_modified"])
+        try:
+            with _opener.open(request, timeout=60) as response:
+                body = response.read()
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None:
+                expires = time.time() + max_age(e.headers)
+                for i, j in itertools.product(range(n), range(n)):
+                    store.put(wms_key(spec, z, mx + i, my + j), {"expires": expires})
+                return 200, cached[0]["content_type"], cached[1]
+            return e.code, "text/plain", e.read()
+
+        content_type = headers.get("Content-Type", "")
+        if not content_type.startswith("image/"):
+            # a WMS service exception
+            return 502, content_type or "text/plain", body
+
+        meta = {
+            "content_type": content_type,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "expires": time.time() + max_age(headers),
+        }
+        image = Image.open(io.BytesIO(body))
+        for i, j in itertools.product(range(n), range(n)):
+            left, top = GUTTER + i * TILE_SIZE, GUTTER + j * TILE_SIZE
+            tile = image.crop((left, top, left + TILE_SIZE, top + TILE_SIZE))
+            output = io.BytesIO()
+            tile.save(output, image.format)
+            store.put(wms_key(spec, z, mx + i, my + j), meta, output.getvalue())
+            if (mx + i, my + j) == (x, y):
+                result = output.getvalue()
+    return 200, content_type, result
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    store = None
+
+    def do_GET(self):
+        match = re.match(
+            r"^/([tw])/([0-9a-f]{32})/([A-Za-z0-9_=-]+)/(\d+)/(\d+)/(\d+)", self.path
+        )
+        if match is None:
+            self.send_error(404)
+            return
+        kind, signature, encoded = match.group(1, 2, 3)
+        z, x, y = match.group(4, 5, 6)
+        if not hmac.compare_digest(signature, sign(kind, encoded)):
+            self.send_error(403, "Invalid signature")
+            return
+        try:
+            decoded = base64.urlsafe_b64decode(encoded).decode()
+            if kind == "w":
+                url = json.loads(decoded)["url"]
+            else:
+                url = decoded.replace("{z}", z).replace("{x}", x).replace("{y}", y)
+        except (ValueError, TypeError, KeyError):
+            self.send_error(400, "Malformed tile template")
+            return
+        if not allowed(url, WMS_HOSTS if kind == "w" else TILE_HOSTS):
+            self.send_error(403, "Upstream host not allowed")
+            return
+        try:
+            if kind == "w":
+                status, content_type, body = fetch_wms_tile(
+                    self.store, decoded, int(z), int(x), int(y)
+                )
+            else:
+                status, content_type, body = fetch_tile(self.store, url)
+        except (urllib.error.URLError, OSError) as e:
+            self.send_error(502, str(e))
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "max-age=3600")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_proxy(port=PORT, cache_dir=None):
+    """Starts the tile proxy in a background thread, once per process."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            handler = type(
+                "Handler",
+                (TileHandler,),
+                {"store": TileStore(cache_dir or os.path.join(CACHE_DIR, "tiles"))},
+            )
+            try:
+                _server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+            except OSError:
+                # another process of the app already serves the port
+                _server = False
+                return
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+
+
+def proxy_url(url):
+    """Returns the proxied URL template of an XYZ tile URL template.
+
+    The template is unchanged if the proxy is disabled or its host is not in ``TILE_HOSTS``.
+    """
+    if not ENABLED or not allowed(url, TILE_HOSTS):
+        return url
+    start_proxy()
+    template = base64.urlsafe_b64encode(url.encode()).decode()
+    return f"{PUBLIC_URL}/t/{sign('t', template)}/{template}/{{z}}/{{x}}/{{y}}"
+
+
+def add_basemap(Map, name):
+    """Adds a basemap to a map, through the proxy for the Google basemaps."""
+    if ENABLED and name in BASEMAPS:
+        url, attribution = BASEMAPS[name]
+        Map.add_tile_layer(proxy_url(url), name, attribution)
+    else:
+        Map.add_basemap(name)
+
+
+def wms_url(url, layers, styles="", fmt="image/png", transparent=True):
+    """Returns the XYZ URL template of a WMS layer served by the proxy from metatiles.
+
+    The service must be one of ``WMS_HOSTS``, over https.
+    """
+    if not allowed(url, WMS_HOSTS):
+        raise ValueError(f"The tile proxy does not serve the WMS service {url}.")
+    start_proxy()
+    spec = {
+        "url": url,
+        "layers": layers,
+        "styles": styles,
+        "format": fmt,
+        "transparent": str(transparent).upper(),
+    }
+    encoded = base64.urlsafe_b64encode(json.dumps(spec, sort_keys=True).encode())
+    encoded = encoded.decode()
+    return f"{PUBLIC_URL}/w/{sign('w', encoded)}/{encoded}/{{z}}/{{x}}/{{y}}"
+
+
+def add_wms_layer(
+    Map,
+    url,
+    layers,
+    name=None,
+    attribution=" ",
+    fmt="image/png",
+    transparent=True,
+    shown=True,
+):
+    """Adds a WMS layer to a map, as cached XYZ tiles when the proxy is enabled.
+
+    Takes the arguments of ``Map.add_wms_layer``. The layers of services
+    outside ``WMS_HOSTS`` are added directly.
+    """
+    if not ENABLED or not allowed(url, WMS_HOSTS):
+        Map.add_wms_layer(
+            url,
+            layers,
+            name,
+            attribution=attribution,
+            shown=shown,
+            format=fmt,
+            transparent=transparent,
+        )
+        return
+    Map.add_tile_layer(
+        wms_url(url, layers, fmt=fmt, transparent=transparent),
+        name or layers,
+        attribution,
+        shown=shown,
+    )
@@ -0,0 +1,223 @@
+"""A persistent cache of Earth Engine tile URLs.
+
+Adding an Earth Engine object to a map needs a ``getMapId`` request to get its
+tile URL. The URL only depends on the object's computation graph and the
+visualization parameters, so it is cached in memory and in a SQLite database
+under ``CACHE_DIR``, keyed by a hash of both, until the map ID expires. Layers
+that were already shown, by any process, are then added without any request.
+
+``ee_tile_layer`` and ``add_layer`` replace ``geemap.ee_tile_layer`` and
+``Map.addLayer``; ``LayerBatch`` resolves all the layers of a page concurrently.
+The tiles themselves go through the local tile proxy when it is enabled.
+"""
+
+import concurrent.futures
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import ee
+import folium
+
+from .store import CACHE_DIR
+from .tile_proxy import proxy_url
+
+# Earth Engine map IDs stay valid for a few hours; refresh them well before.
+TILE_TTL = float(os.environ.get("NFW_TILE_TTL", 3 * 3600))
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class TileCache:
+    """A TTL-bound map of layer keys to tile URLs, backed by SQLite.
+
+    Parameters
+    ----------
+    path:
+        the SQLite database file.
+    ttl:
+        the lifetime (s) of a tile URL.
+    """
+
+    def __init__(self, path, ttl=TILE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS tiles (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )""")
+            conn.execute("DELETE FROM tiles WHERE expires < ?", (time.time(),))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """Returns the unexpired tile URL of a layer key, or None."""
+        now = time.time()
+        with self._lock:
+            url, expires = self._memory.get(key, (None, 0))
+            if expires > now:
+                return url
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT url, expires FROM tiles WHERE key = ? AND expires > ?",
+                    (key, now),
+                ).fetchone()
+            if row is None:
+                return None
+            self._memory[key] = row
+            return row[0]
+
+    def put(self, key, url):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._memory[key] = (url, expires)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?)", (key, url, expires)
+                )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            with self._connect() as conn:
+                conn.execute("DELETE FROM tiles")
+
+
+def get_tile_cache(path=None):
+    """Returns the process-wide tile URL cache."""
+    if path is None:
+        path = os.path.join(CACHE_DIR, "tiles.sqlite")
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = TileCache(path)
+        return _caches[path]
+
+
+def to_image(ee_object, vis_params):
+    """Returns the image displayed for an Earth Engine object, as ``Map.addLayer`` does."""
+    if isinstance(ee_object, (ee.Geometry, ee.Feature, ee.FeatureCollection)):
+        features = ee.FeatureCollection(ee_object)
+        width = vis_params.get("width", 2)
+        color = vis_params.get("color", "000000")
+        image_fill = features.style(**{"fillColor": color}).updateMask(
+            ee.Image.constant(0.5)
+        )
+        image_outline = features.style(
+            **{"color": color, "fillColor": "00000000", "width": width}
+        )
+        return image_fill.blend(image_outline), {}
+    if isinstance(ee_object, ee.ImageCollection):
+        return ee_object.mosaic(), vis_params
+    if isinstance(ee_object, ee.Image):
+        return ee_object, vis_params
+    raise TypeError(f"Cannot display a {type(ee_object).__name__} on a map.")
+
+
+def layer_key(image, vis_params):
+    """Returns the cache key of an image and its visualization parameters."""
+    data = image.serialize() + json.dumps(vis_params, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def tile_url(ee_object, vis_params=None):
+    """Returns the XYZ tile URL of an Earth Engine object, from the cache if possible."""
+    image, vis_params = to_image(ee_object, dict(vis_params or {}))
+    key = layer_key(image, vis_params)
+    cache = get_tile_cache()
+    url = cache.get(key)
+    if url is None:
+        url = image.getMapId(vis_params)["tile_fetcher"].url_format
+        cache.put(key, url)
+    return url
+
+
+def url_tile_layer(url, name, shown=True, opacity=1.0):
+    return folium.raster_layers.TileLayer(
+        tiles=proxy_url(url),
+        attr="Google Earth Engine",
+        name=name,
+        overlay=True,
+        control=True,
+        show=shown,
+        opacity=opacity,
+        max_zoom=24,
+    )
+
+
+def ee_tile_layer(
+    ee_object, vis_params=None, name="Layer untitled", shown=True, opacity=1.0
+):
+    """Returns a folium tile layer of an Earth Engine object (see ``geemap.ee_tile_layer``)."""
+    return url_tile_layer(tile_url(ee_object, vis_params), name, shown, opacity)
+
+
+def add_layer(
+    Map, ee_object, vis_params=None, name="Layer untitled", shown=True, opacity=1.0
+):
+    """Adds an Earth Engine object to a map (see ``Map.addLayer``)."""
+    ee_tile_layer(ee_object, vis_params, name, shown, opacity).add_to(Map)
+
+
+class LayerBatch:
+    """Collects the Earth Engine layers of a page and adds them all at once.
+
+    The tile URLs of the pending layers are resolved concurrently on a bounded
+    thread pool and the layers are added to the map in the order they were
+    collected.
+
+    Parameters
+    ----------
+    max_workers:
+        maximum number of concurrent ``getMapId`` requests.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.layers = []
+
+    def add(
+        self, ee_object, vis_params=None, name="Layer untitled", shown=True, opacity=1.0
+    ):
+        """Queues a layer; takes the same arguments as ``add_layer``."""
+        self.layers.append((ee_object, vis_params, name, shown, opacity))
+
+    def resolve(self):
+        """Returns the tile URLs of the pending layers, in order."""
+        if not self.layers:
+            return []
+        workers = min(self.max_workers, len(self.layers))
+        # run each request in the context of the caller (e.g. its metrics page tag)
+        contexts = [contextvars.copy_context() for _ in self.layers]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    lambda context, layer: context.run(tile_url, *layer[:2]),
+                    contexts,
+                    self.layers,
+                )
+            )
+
+    def add_to(self, Map):
+        """Adds the pending layers to a map and empties the batch."""
+        for url, layer in zip(self.resolve(), self.layers):
+            url_tile_layer(url, *layer[2:]).add_to(Map)
+        self.layers = []
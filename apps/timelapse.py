@@ -8,6 +8,7 @@ import geemap.colormaps as cm
 import geemap.foliumap as geemap
 from datetime import date
 from .rois import *
+from .tile_proxy import add_basemap
 
 
 @st.cache
@@ -63,7 +64,7 @@ def app():
             locate_control=True,
             plugin_LatLngPopup=False,
         )
-        m.add_basemap("ROADMAP")
+        add_basemap(m, "ROADMAP")
 
     with row1_col2:
 
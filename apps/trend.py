@@ -1,33 +1,34 @@
-from gettext import lngettext
 import ee
 import folium
 import geemap.foliumap as geemap
 import geemap.colormaps as cm
-import geopandas as gpd
 import streamlit as st
-import plotly.express as px
 import pandas as pd
 from streamlit_folium import st_folium
 from folium import plugins
-import leafmap
 
-geemap.ee_initialize()
+from .huc_catalog import get_catalog, select_unit
+from .ows import get_wms_layers
+from .session import ee_initialize
+from .tile_proxy import add_basemap, add_wms_layer, proxy_url
 
 
 def app():
+    ee_initialize()
     st.title("Analyzing Surface Water Dynamics")
+    catalog = get_catalog()
     col1, col2 = st.columns([3, 1])
 
     Map = geemap.Map(search_control=False, center=[44.96, -100.40], zoom_start=9, Draw_export=True)
-    Map.add_basemap("HYBRID")
+    add_basemap(Map, "HYBRID")
 
     jrc_url = "https://storage.googleapis.com/global-surface-water/tiles2020/occurrence/{z}/{x}/{y}.png"
-    Map.add_tile_layer(jrc_url, "JRC Water Occurrence")
+    Map.add_tile_layer(proxy_url(jrc_url), "JRC Water Occurrence")
 
     wms_url = (
         url
     ) = "https://hydro.nationalmap.gov/arcgis/services/wbd/MapServer/WMSServer?"
-    wms_layers, wms_titles = geemap.get_wms_layers(url, return_titles=True)
+    wms_layers, wms_titles = get_wms_layers(url, return_titles=True)
     wms_layers = ["User drawn ROI"] + wms_layers[2:]
     wms_titles = ["User drawn ROI"] + wms_titles[2:]
 
@@ -42,8 +43,18 @@ def app():
         else:
             st.text("Click on the map to select a watershed.")
 
+        # without the catalog file, the units have no bounds to zoom to
+        if "(" in wms_layer and catalog.has_bounds:
+            zoom_to = select_unit(
+                st, f"HU{int(huc_level)}", int(huc_level), key="trend_huc"
+            )
+            bounds = catalog.bounds(zoom_to) if zoom_to else None
+            if bounds is not None:
+                Map.fit_bounds(bounds)
+
     if wms_layer != "User drawn ROI":
-        Map.add_wms_layer(
+        add_wms_layer(
+            Map,
             wms_url,
             wms_layers[wms_titles.index(wms_layer)],
             name=wms_layer,
@@ -95,7 +106,16 @@ def app():
                 fc = ee.FeatureCollection([m["last_active_drawing"]])
 
             with st.expander("Selected HUC:"):
-                st.write(fc.toDictionary().getInfo())
+                properties = fc.toDictionary().getInfo()
+                st.write(properties)
+                code = properties.get(f"huc{int(huc_level)}", "")
+                if "(" in wms_layer and code in catalog:
+                    path = catalog.ancestors(code) + [code]
+                    st.write(" › ".join(catalog.label(unit) for unit in path))
+                    children = catalog.children(code)
+                    if children:
+                        st.write(f"Sub-watersheds ({len(children)}):")
+                        st.write([catalog.label(child) for child in children])
 
             months = st.slider("Select start and end month:", 1, 12, (7, 8))
             method = st.selectbox(
@@ -125,6 +145,9 @@ def app():
 
                 areas = dataset.map(cal_area)
                 stats = areas.aggregate_array("area").getInfo()
+                import leafmap
+                import plotly.express as px
+
                 values = [item["water"] for item in stats]
                 labels = areas.aggregate_array("system:index").getInfo()
                 years = [int(label[:4]) for label in labels]
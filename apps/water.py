@@ -1,169 +1,183 @@
-import os
+import itertools
+import threading
+from collections import OrderedDict
+
 import ee
 import geemap.foliumap as geemap
 import streamlit as st
 import matplotlib.pyplot as plt
 import numpy as np
-
-# Format a table of triplets into a 2D table of rowId x colId.
-
-
-def format_table(table, rowId, colId, valueId):
-    # Get a FeatureCollection with unique row IDs.
-    rows = table.distinct(rowId)
-    # Join the table to the unique IDs to get a collection in which
-    # each feature stores a list of all features having a common row ID.
-    joined = ee.Join.saveAll("matches").apply(
-        **{
-            "primary": rows,
-            "secondary": table,
-            "condition": ee.Filter.equals(**{"leftField": rowId, "rightField": rowId}),
+import pandas as pd
+from .common import (
+    ALGORITHM_VERSION,
+    DEFAULT_THRESHOLDS,
+    chart_data,
+    decode_summary,
+    pivot_areas,
+    stats_row,
+    training_seed,
+)
+from .cube import get_cube
+from .huc_catalog import get_catalog, select_unit
+from .huc_index import find_HUC10, get_index, lookup_HUC10
+from .store import get_store
+from .tiles import add_layer
+
+# HU10 selected when the water mapping page opens
+DEFAULT_HU10 = "1016000315"
+
+# Properties carried from each NAIP image to the images derived from it. The
+# "year" property is the key used to pair NAIP-derived and JRC images.
+DATE_PROPERTIES = ["year", "system:time_start", "system:time_end"]
+
+# Pipeline stages in dependency order: {name: (function, inputs)}. An input is
+# either a pipeline parameter or the name of an upstream stage.
+STAGES = OrderedDict()
+
+# Largest threshold sweep grid, and grid points evaluated per request
+MAX_SWEEP_POINTS = 64
+SWEEP_CHUNK = 8
+
+# Cached stage outputs and evaluated values shared by all sessions of the process.
+STAGE_CACHE_SIZE = 256
+_stage_cache = OrderedDict()
+_stage_lock = threading.Lock()
+
+
+def stage(*inputs):
+    """Registers a function as a pipeline stage computed from the given inputs."""
+
+    def decorator(func):
+        STAGES[func.__name__] = (func, inputs)
+        return func
+
+    return decorator
+
+
+def stage_params(name):
+    """Returns the pipeline parameters a stage depends on, directly or through upstream stages."""
+    params = set()
+    for item in STAGES[name][1]:
+        if item in STAGES:
+            params.update(stage_params(item))
+        else:
+            params.add(item)
+    return sorted(params)
+
+
+def stage_key(name, params):
+    """Builds the cache key of a stage from the values of its own inputs only."""
+    return (name,) + tuple((key, params[key]) for key in stage_params(name))
+
+
+def _cache_get(key):
+    with _stage_lock:
+        if key in _stage_cache:
+            _stage_cache.move_to_end(key)
+            return _stage_cache[key]
+    return None
+
+
+def _cache_set(key, value):
+    with _stage_lock:
+        _stage_cache[key] = value
+        _stage_cache.move_to_end(key)
+        while len(_stage_cache) > STAGE_CACHE_SIZE:
+            _stage_cache.popitem(last=False)
+
+
+def run_stage(name, params):
+    """Returns the output of a stage, computing it and its upstream stages if not cached."""
+    key = stage_key(name, params)
+    output = _cache_get(key)
+    if output is None:
+        func, inputs = STAGES[name]
+        kwargs = {
+            item: run_stage(item, params) if item in STAGES else params[item]
+            for item in inputs
         }
-    )
-
-    def get_value(feature):
-        feature = ee.Feature(feature)
-        return [feature.get(colId), feature.get(valueId)]
-
-    def join_func(row):
-        values = ee.List(row.get("matches")).map(get_value)
-        # Map a function over the list of rows to return a list of
-        # column ID and value. \
-        return row.select([rowId]).set(ee.Dictionary(values.flatten()))
-
-    return joined.map(join_func)
-
-
-def wetland_mapping(
-    Map,
-    output,
-    watershed,
-    selected_year,
-    cluster_threshold,
-    permanent_threshold,
-    usda_threshold,
-):
-
-    # Customize parameters
-    # watershed:           HUC10 watershed ID
-    # selected_year:       selected year to display NAIP imagery
-    # nclusters:           number of clusters for the k-means clustering
-    # cluster_threshold:   A cluster within permanent water must exceed x% of pixels in order to be classified as water
-    # permanent_threshold: threshold (%) for extracting permanent water from JRC Global Water Occurrence
-    # usda_threshold:      usda cropland water threshold 1-21.
+        output = func(**kwargs)
+        _cache_set(key, output)
+    return output
 
-    huc8_id = watershed[0:8]
-    # Available 4-band NAIP imagery
-    years = [2009, 2010, 2011, 2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019]
-    num_years = len(years)  # number of years with available NAIP imagery
 
-    basin_fc = geemap.find_HUC10(watershed)
+@stage("watershed")
+def basin(watershed):
+    basin_fc = find_HUC10(watershed)
     basin_geom = basin_fc.geometry()
-    basin_name = basin_fc.first().get("name")
-    basin_size = basin_geom.area().divide(1e4).format("%.4f")
-
-    # Get time-series NAIP imagery with NDWI and NDVI bands added
-    NAIP_images = geemap.find_NAIP(basin_fc)
-    with output:
-        st.write("Running. Please wait ...")
+    return {
+        "huc8_id": watershed[0:8],
+        "basin_fc": basin_fc,
+        "basin_geom": basin_geom,
+        "basin_name": basin_fc.first().get("name"),
+        "basin_size": basin_geom.area().divide(1e4).format("%.4f"),
+    }
 
-    # image acquisition date (starting time)
-    time_start = ee.List(NAIP_images.aggregate_array("system:time_start"))
-    # image acquisition date (ending time)
-    time_end = ee.List(NAIP_images.aggregate_array("system:time_end"))
-    yearList = time_start.map(lambda y: ee.Date(y).get("year"))
 
-    ith_year_tmp = yearList.indexOf(selected_year)
-    print(ith_year_tmp.getInfo())
-    ith_year = ee.List([ith_year_tmp, 0]).reduce(ee.Reducer.max())
-    shown_year = yearList.get(ith_year).getInfo()
-    # selected NAIP imagery to display on the map
-    ith_NAIP = ee.Image(NAIP_images.toList(num_years).get(ith_year))
-
-    # image = ee.Image(NAIP_images.toList(NAIP_images.size()).get(ith_year))
-    # Map.layers = Map.layers[:5]
-    layer_name = "NAIP " + ith_NAIP.get("system:time_start").getInfo()
-    #     Map.centerObject(basin_geom, 11)
-    Map.addLayer(ith_NAIP, {"bands": ["N", "R", "G"]}, layer_name)
-
-    # get NED and landforms
-    elev = ee.Image("USGS/NED").clip(basin_geom)
-    hillshade = ee.Terrain.hillshade(elev)
-    landforms = (
-        ee.Image("CSP/ERGo/1_0/US/landforms").select("constant").clip(basin_geom).byte()
+@stage("basin")
+def naip(basin):
+    # Get time-series NAIP imagery with NDWI and NDVI bands added
+    NAIP_images = geemap.find_NAIP(basin["basin_fc"]).map(
+        lambda img: img.set("year", ee.Date(img.get("system:time_start")).get("year"))
     )
-    # including upper slope (flat), lower slope, valley
-    landforms_wet = landforms.gt(23).selfMask()
+    return {
+        "NAIP_images": NAIP_images,
+        "yearList": NAIP_images.aggregate_array("year"),
+    }
+
 
+@stage("basin")
+def occurrences(basin):
     # Get waters and wetlands from USDA Cropland data layer
     # https://developers.google.com/earth-engine/datasets/catalog/USDA_NASS_CDL
+    cropland = (
+        ee.ImageCollection("USDA/NASS/CDL")
+        .filterDate("1997-01-01", "2019-12-31")
+        .select("cropland")
+    )
+    usda_waters = cropland.map(
+        lambda img: img.remap([83, 87, 111, 190, 195], ee.List.repeat(999, 5))
+        .eq(999)
+        .clip(basin["basin_geom"])
+        .selfMask()
+    )
+    usda_occurrence = usda_waters.reduce(ee.Reducer.sum()).selfMask()
 
-    def get_usda_waters(geometry, usda_water_threshold):
-        cropland = (
-            ee.ImageCollection("USDA/NASS/CDL")
-            .filterDate("1997-01-01", "2019-12-31")
-            .select("cropland")
-        )
-        usda_waters = cropland.map(
-            lambda img: img.remap([83, 87, 111, 190, 195], ee.List.repeat(999, 5))
-            .eq(999)
-            .clip(geometry)
-            .selfMask()
-        )
-        usda_water_occurrence = usda_waters.reduce(ee.Reducer.sum()).selfMask()
-        usda_water_extent = usda_water_occurrence.gt(usda_water_threshold).selfMask()
-        return usda_water_occurrence, usda_water_extent
+    # JRC Global Surface Water Mapping Layers (1984-2019)
+    JRC_Water = ee.Image("JRC/GSW1_2/GlobalSurfaceWater").clip(basin["basin_geom"])
+    JRC_Water_Occurrence = JRC_Water.select("occurrence")
+    return {
+        "usda_occurrence": usda_occurrence,
+        "JRC_Water_Occurrence": JRC_Water_Occurrence,
+    }
 
-    usda_occurrence, usda_max_extent = get_usda_waters(basin_geom, usda_threshold)
 
-    # Get NLCD land cover 1992, 2001, 2004, 2006, 2008, 2011, 2013, 2016
-    def get_nlcd(geometry, nlcd_water_threshold):
+@stage("occurrences", "usda_threshold")
+def usda(occurrences, usda_threshold):
+    usda_occurrence = occurrences["usda_occurrence"]
+    usda_max_extent = usda_occurrence.gt(usda_threshold).selfMask()
+    return {"usda_max_extent": usda_max_extent}
 
-        landcover = (
-            ee.ImageCollection("USGS/NLCD")
-            .filterBounds(geometry)
-            .select("landcover")
-            .map(lambda x: x.clip(geometry))
-        )
-        nlcd_waters = landcover.map(
-            lambda img: img.remap([11, 90, 95], ee.List.repeat(99, 3))
-            .eq(99)
-            .clip(geometry)
-            .selfMask()
-        )
-        nlcd_water_occurrence = nlcd_waters.reduce(ee.Reducer.sum()).selfMask()
-        nlcd_water_extent = nlcd_water_occurrence.gt(nlcd_water_threshold).selfMask()
-        return landcover, nlcd_water_occurrence, nlcd_water_extent
 
-    nlcd_landcover, nlcd_occurrence, nlcd_max_extent = get_nlcd(
-        basin_geom, usda_threshold
-    )
-    nlcd_2016 = ee.Image(nlcd_landcover.toList(nlcd_landcover.size()).get(-1))
-
-    # JRC Global Surface Water Mapping Layers (1984-2019)
-    JRC_Water = ee.Image("JRC/GSW1_2/GlobalSurfaceWater").clip(basin_geom)
-    # Binary image containing 1 anywhere water has ever been detected.
-    JRC_Water_Max_Extent = JRC_Water.select("max_extent")
-    JRC_Water_Occurrence = JRC_Water.select("occurrence")
+@stage("occurrences", "permanent_threshold")
+def jrc_permanent(occurrences, permanent_threshold):
+    JRC_Water_Occurrence = occurrences["JRC_Water_Occurrence"]
     JRC_Permanent_Water = JRC_Water_Occurrence.gt(permanent_threshold)
     JRC_Permanent_Water = JRC_Permanent_Water.selfMask()
+    return {"JRC_Permanent_Water": JRC_Permanent_Water}
 
-    # NWI wetlands for the clicked watershed
-    nwi_asset_path = "users/giswqs/NWI-HU8/HU8_" + huc8_id + "_Wetlands"
-    basin_nwi = ee.FeatureCollection(nwi_asset_path).filterBounds(basin_geom)
-    #     print(basin_nwi.first().getInfo())
-    #     print(basin_nwi.aggregate_stats('Shape_Area').getInfo())
-    nwi_color = geemap.nwi_add_color(basin_nwi)
+
+@stage("basin", "naip")
+def jrc_monthly(basin, naip):
+    basin_geom = basin["basin_geom"]
 
     # extract JRC Monthly History product
     def get_JRC_monthly(img):
         start_date = ee.Date(img.get("system:time_start"))
-        end_date = ee.Date(img.get("system:time_end"))
         start_year_tmp = ee.Number(start_date.get("year"))
         start_year = ee.List([start_year_tmp, 2019]).reduce(ee.Reducer.min())
         # Between 16 March 1984 and 31 December 2019
         start_month = ee.Number(start_date.get("month"))
-        end_month = ee.Number(end_date.get("month")).add(1)
         start = ee.Date.fromYMD(start_year, start_month, 1)
         end = start.advance(59, "day")
         JRC_monthly_images = ee.ImageCollection("JRC/GSW1_2/MonthlyHistory").filterDate(
@@ -180,35 +194,40 @@ def wetland_mapping(
                 JRC_monthly_size.gt(0), JRC_monthly_images, alt_JRC_monthly_images
             )
         )
-        # JRC_monthly = JRC_monthly_images.max().eq(2).clip(getImageBound(img))
         JRC_monthly = JRC_monthly_images.max().eq(2).clip(basin_geom).selfMask()
-        # JRC_monthly = JRC_monthly.updateMask(JRC_monthly)
-        return JRC_monthly.set({"system:time_start": start, "system:time_end": end})
-
-    #     # extract JRC Monthly History product
-    #     def get_JRC_monthly(img):
-    #         start_date = ee.Date(img.get('system:time_start'))
-    #         end_date = ee.Date(img.get('system:time_end'))
-    #         start_year = ee.Number(start_date.get('year'))
-    #         start_month = ee.Number(start_date.get('month'))
-    # #         end_month = ee.Number(end_date.get('month')).add(1)
-    #         start = ee.Date.fromYMD(start_year, start_month, 1)
-    #         end = start.advance(1, 'month')
-    #         JRC_monthly_images = ee.ImageCollection("JRC/GSW1_2/MonthlyHistory").filterDate(start, end)
-    #         JRC_monthly = JRC_monthly_images.max().clip(basin_geom).selfMask()
-    #         return JRC_monthly
-
-    JRC_monthly_waters = NAIP_images.map(get_JRC_monthly)
-    #     print(JRC_monthly_waters.getInfo())
-    ith_JRCwater = ee.Image(JRC_monthly_waters.toList(num_years).get(ith_year))
-
-    centroid = ee.FeatureCollection.randomPoints(basin_geom, 1).first().geometry()
-    lon = centroid.coordinates().get(0)
-    # deal with points near the US/Canada border
-    lat_tmp = centroid.coordinates().get(1)
-    lat = ee.List([lat_tmp, 48.998]).reduce(ee.Reducer.min())
-    centroid = ee.Geometry.Point([lon, lat])
-    cls_roi = centroid.buffer(5000)
+        return JRC_monthly.set(
+            {
+                "year": img.get("year"),
+                "system:time_start": start,
+                "system:time_end": end,
+            }
+        )
+
+    return {"JRC_monthly_waters": naip["NAIP_images"].map(get_JRC_monthly)}
+
+
+def training_sample(watershed, basin_geom):
+    """Returns the seed and the center of the clustering training area of a watershed.
+
+    The center is drawn once with the watershed's seed and persisted in the
+    result store, so later runs reuse it without any server call.
+    """
+    store = get_store(ALGORITHM_VERSION)
+    sample = store.get_training(watershed)
+    if sample is None:
+        seed = training_seed(watershed)
+        point = ee.FeatureCollection.randomPoints(basin_geom, 1, seed).first()
+        lon, lat = point.geometry().coordinates().getInfo()
+        # deal with points near the US/Canada border
+        sample = {"seed": seed, "lon": lon, "lat": min(lat, 48.998)}
+        store.put_training(watershed, sample)
+    return sample
+
+
+@stage("watershed", "basin", "naip")
+def clusters(watershed, basin, naip):
+    sample = training_sample(watershed, basin["basin_geom"])
+    cls_roi = ee.Geometry.Point([sample["lon"], sample["lat"]]).buffer(5000)
 
     # function for classifying image using k-means clustering
     def classify_image(img):
@@ -218,6 +237,7 @@ def wetland_mapping(
                 "region": cls_roi,  # using the sample image to extract training samples
                 "scale": 2,
                 "numPixels": 5000,
+                "seed": sample["seed"],
             }
         )
         # Instantiate the clusterer and train it.
@@ -225,13 +245,15 @@ def wetland_mapping(
         clusterer = ee.Clusterer.wekaXMeans().train(training)
         # Cluster the img using the trained clusterer.
         classified_image = img.cluster(clusterer).select("cluster")
-        return classified_image
+        return ee.Image(classified_image.copyProperties(img, DATE_PROPERTIES))
 
     # classifying the image collection using the map function
-    cluster_images = NAIP_images.map(classify_image)
-    ith_cluster_image = ee.Image(
-        cluster_images.toList(num_years).get(ith_year)
-    )  # selected year of image to display on the map
+    return {"cluster_images": naip["NAIP_images"].map(classify_image)}
+
+
+@stage("clusters", "jrc_permanent", "cluster_threshold")
+def water_clusters(clusters, jrc_permanent, cluster_threshold):
+    JRC_Permanent_Water = jrc_permanent["JRC_Permanent_Water"]
 
     def get_water_cluster(img):
         cluster_img = img.updateMask(JRC_Permanent_Water)
@@ -244,7 +266,6 @@ def wetland_mapping(
         )
         cluster_dict = ee.Dictionary(frequency.get("cluster"))
         keys = ee.List(cluster_dict.keys())
-        # print(keys.getInfo())
         values = ee.List(cluster_dict.values())
         threshold = ee.Number(values.reduce(ee.Reducer.sum())).multiply(
             cluster_threshold
@@ -264,71 +285,411 @@ def wetland_mapping(
         outList = ee.List.repeat(-1, clsLabels.size())
         cluster_img = img.remap(clsLabels, outList).eq(-1)
         cluster_img = cluster_img.updateMask(cluster_img)
-        return cluster_img
+        return ee.Image(cluster_img.copyProperties(img, DATE_PROPERTIES))
+
+    return {"water_images": clusters["cluster_images"].map(get_water_cluster)}
+
+
+@stage("water_clusters", "usda", "jrc_monthly")
+def refinement(water_clusters, usda, jrc_monthly):
+    water_images = water_clusters["water_images"]
+    usda_max_extent = usda["usda_max_extent"]
+    JRC_monthly_waters = jrc_monthly["JRC_monthly_waters"]
 
-    # ithClusterImg = getWaterCluster(ithClusterImage)
-    water_images = cluster_images.map(get_water_cluster)
-    ith_water_image = ee.Image(water_images.toList(num_years).get(ith_year))
+    water_extent = water_images.sum().gt(1)
 
     # Water regions must reside within USDA max water extent
     def refine_water(img):
-        return img.And(usda_max_extent).And(water_images.sum().gt(1)).selfMask()
+        refined = img.And(usda_max_extent).And(water_extent).selfMask()
+        return ee.Image(refined.copyProperties(img, DATE_PROPERTIES))
 
     refined_images = water_images.map(refine_water)
 
     occurrence = ee.Image(refined_images.sum().toUint8())
 
-    # add image date to resulting image based on the original NAIP image
-    def add_date(img):
-        sys_index = ee.Number.parse(img.get("system:index"))
-        start_index = time_start.get(sys_index)
-        end_index = time_end.get(sys_index)
-        return img.set({"system:time_start": start_index, "system:time_end": end_index})
-
-    refined_images = refined_images.map(add_date)
-    ith_refined_water = ee.Image(refined_images.toList(num_years).get(ith_year))
+    # pair each refined image with the JRC monthly water of the same year
+    pairs = ee.Join.inner("refined", "jrc").apply(
+        **{
+            "primary": refined_images,
+            "secondary": JRC_monthly_waters,
+            "condition": ee.Filter.equals(
+                **{"leftField": "year", "rightField": "year"}
+            ),
+        }
+    )
 
     # calculate omission error
-    def calcOmission(img):
-        sys_index = ee.Number.parse(img.get("system:index"))
-        iJRCwater = ee.Image(JRC_monthly_waters.toList(num_years).get(sys_index))
+    def calcOmission(pair):
+        img = ee.Image(pair.get("refined"))
+        iJRCwater = ee.Image(pair.get("jrc"))
         inputUnmask = img.unmask()
         omissionImage = inputUnmask.eq(0).And(iJRCwater.eq(1))
         omissionImage = omissionImage.selfMask()
-        return omissionImage
+        return ee.Image(omissionImage.copyProperties(img, DATE_PROPERTIES))
+
+    omission_images = ee.ImageCollection(pairs.map(calcOmission))
+    return {
+        "refined_images": refined_images,
+        "occurrence": occurrence,
+        "omission_images": omission_images,
+    }
 
-    omission_images = refined_images.map(calcOmission)
-    omission_images = omission_images.map(add_date)
 
-    # calculate pixel area in hectare
-    def get_area(img):
-        pixelArea = img.multiply(ee.Image.pixelArea()).divide(10000)
+@stage("basin", "refinement", "jrc_monthly")
+def areas(basin, refinement, jrc_monthly):
+    basin_fc = basin["basin_fc"]
+
+    def year_bands(collection):
+        return collection.aggregate_array("year").map(
+            lambda year: ee.String("Y").cat(ee.Number(year).format())
+        )
+
+    # calculate pixel area in hectare of every year in a single pass: the yearly
+    # masks are stacked as Y<year> bands and reduced together, which gives one
+    # row per watershed with a column per year. The sum is applied per band so
+    # that a single year is also output as Y<year> (and not as "sum").
+    def get_area(collection):
+        bands = year_bands(collection)
+        stacked = collection.map(lambda img: img.unmask(0)).toBands().rename(bands)
+        pixelArea = stacked.multiply(ee.Image.pixelArea()).divide(10000)
         watershedArea = pixelArea.reduceRegions(
-            **{"collection": basin_fc, "reducer": ee.Reducer.sum(), "scale": 10}
+            **{
+                "collection": basin_fc,
+                "reducer": ee.Reducer.sum().forEachBand(stacked),
+                "scale": 10,
+            }
         )
+        return watershedArea.select(ee.List(["name"]).cat(bands))
 
-        def set_year(fc):
-            year = ee.Date(img.get("system:time_start")).get("year")
-            fieldValue = ee.String("Y").cat(ee.String(year.format()))
-            return fc.set("year", fieldValue)
+    return {
+        "NAIP_water_table": get_area(refinement["refined_images"]),
+        "JRC_water_table": get_area(jrc_monthly["JRC_monthly_waters"]),
+        "omission_table": get_area(refinement["omission_images"]),
+    }
 
-        watershedArea = watershedArea.map(set_year)
-        watershedArea = watershedArea.select(["huc10", "name", "year", "sum"])
-        return watershedArea  # .select([".*"], None, False)
 
-    NAIP_water_areas = refined_images.map(get_area)
-    NAIP_water_areas = NAIP_water_areas.flatten()
+@stage("basin")
+def nwi(basin):
+    # NWI wetlands for the clicked watershed
+    nwi_asset_path = "users/giswqs/NWI-HU8/HU8_" + basin["huc8_id"] + "_Wetlands"
+    basin_nwi = ee.FeatureCollection(nwi_asset_path).filterBounds(basin["basin_geom"])
+
+    # Area statistics and aggregated area of each wetland type in one pass;
+    # hectares and wetland type names are formatted client-side (nwi_summary)
+    area_stats = (
+        ee.Reducer.count()
+        .combine(ee.Reducer.sum(), None, True)
+        .combine(ee.Reducer.mean(), None, True)
+        .combine(ee.Reducer.median(), None, True)
+        .combine(ee.Reducer.minMax(), None, True)
+    )
+    reducer = area_stats.combine(ee.Reducer.sum().group(1, "type"), None, False)
+    NWI_stats = basin_nwi.reduceColumns(
+        reducer, ["Shape_Area", "Shape_Area", "WETLAND_TY"]
+    )
+    return {"NWI_stats": NWI_stats}
 
-    JRC_water_areas = JRC_monthly_waters.map(get_area)
-    JRC_water_areas = JRC_water_areas.flatten()
 
-    x = list(NAIP_water_areas.aggregate_array("year").getInfo())
-    labels = [i[1:] for i in x]
+@stage("watershed", "basin", "nwi")
+def stats(watershed, basin, nwi):
+    data_dict = ee.Dictionary(
+        {
+            "HUC_10": watershed,
+            "HUC_08": basin["huc8_id"],
+            "HUC_Name": basin["basin_name"],
+            "HUC_Area": basin["basin_size"],
+        }
+    )
+    return {"data_dict": data_dict.set("NWI", nwi["NWI_stats"])}
 
-    y = list(NAIP_water_areas.aggregate_array("sum").getInfo())
-    y = [round(i, 2) for i in y]
-    y2 = list(JRC_water_areas.aggregate_array("sum").getInfo())
-    y2 = [round(i, 2) for i in y2]
+
+@stage("naip", "clusters", "jrc_monthly", "refinement", "selected_year")
+def display(naip, clusters, jrc_monthly, refinement, selected_year):
+    yearList = naip["yearList"]
+    ith_year_tmp = yearList.indexOf(selected_year)
+    ith_year = ee.List([ith_year_tmp, 0]).reduce(ee.Reducer.max())
+    shown_year = yearList.get(ith_year)
+
+    def ith_image(collection):
+        return ee.Image(collection.filter(ee.Filter.eq("year", shown_year)).first())
+
+    return {
+        "shown_year": shown_year,
+        # selected NAIP imagery to display on the map
+        "ith_NAIP": ith_image(naip["NAIP_images"]),
+        "ith_cluster_image": ith_image(clusters["cluster_images"]),
+        "ith_JRCwater": ith_image(jrc_monthly["JRC_monthly_waters"]),
+        "ith_refined_water": ith_image(refinement["refined_images"]),
+    }
+
+
+# Client-side values of the pipeline: {name: (stage, function building the ee object)}
+OUTPUTS = {
+    "shown_year": ("display", lambda out: out["shown_year"]),
+    "layer_name": (
+        "display",
+        lambda out: ee.String("NAIP ").cat(out["ith_NAIP"].get("system:time_start")),
+    ),
+    "areas": (
+        "areas",
+        lambda out: {
+            product: out[table].first().toDictionary().remove(["name"])
+            for product, table in [
+                ("JRC", "JRC_water_table"),
+                ("NAIP", "NAIP_water_table"),
+                ("OMI", "omission_table"),
+            ]
+        },
+    ),
+    "basin_summary": ("stats", lambda out: out["data_dict"]),
+}
+
+# Outputs that do not depend on the display year and are persisted on disk.
+STORED_OUTPUTS = ["areas", "basin_summary"]
+
+
+# Client-side values derived from the outputs: {name: (outputs, function)}
+DERIVED = {
+    "chart": (["areas"], chart_data),
+    "summary": (["basin_summary"], decode_summary),
+    "stats": (
+        ["areas", "basin_summary"],
+        lambda areas, summary: stats_row(areas, decode_summary(summary)),
+    ),
+}
+
+
+def wetland_pipeline(
+    watershed,
+    selected_year,
+    cluster_threshold,
+    permanent_threshold,
+    usda_threshold,
+):
+    """Collects the parameters of the NAIP water mapping pipeline for a HUC10 watershed.
+
+    Nothing is computed here; use ``run_stage`` to get the Earth Engine objects of
+    a stage and ``evaluate_pipeline`` to fetch client-side values.
+
+    Parameters
+    ----------
+    watershed:
+        HUC10 watershed ID.
+    selected_year:
+        selected year to display NAIP imagery.
+    cluster_threshold:
+        fraction of pixels within permanent water a cluster must exceed to be classified as water.
+    permanent_threshold:
+        threshold (%) for extracting permanent water from JRC Global Water Occurrence.
+    usda_threshold:
+        usda cropland water threshold 1-21.
+    """
+    return {
+        "watershed": watershed,
+        "selected_year": selected_year,
+        "cluster_threshold": cluster_threshold,
+        "permanent_threshold": permanent_threshold,
+        "usda_threshold": usda_threshold,
+    }
+
+
+def evaluate_pipelines(pipelines, names):
+    """Evaluates several outputs of one or more pipelines in a single request.
+
+    Values already evaluated for the same stage inputs are served from the stage
+    cache, the on-disk result store or the precomputed summary cube and only the
+    missing ones are requested.
+
+    Parameters
+    ----------
+    pipelines:
+        a list of dictionaries returned by ``wetland_pipeline``.
+    names:
+        the values to evaluate, any of "shown_year", "layer_name", "areas",
+        "summary", "chart" and "stats".
+
+    Returns
+    -------
+    list
+        The decoded client-side values of each pipeline, keyed by name.
+    """
+    requested = names
+    names = []
+    for name in requested:
+        for output in DERIVED[name][0] if name in DERIVED else [name]:
+            if output not in names:
+                names.append(output)
+
+    results = []
+    request = {}
+    sources = {}  # the request entry of each missing value, shared by equal keys
+    for index, pipeline in enumerate(pipelines):
+        keys = {
+            name: ("value",) + stage_key(OUTPUTS[name][0], pipeline) + (name,)
+            for name in names
+        }
+        values = {name: _cache_get(key) for name, key in keys.items()}
+        missing = [name for name in names if values[name] is None]
+
+        store_key = (
+            pipeline["watershed"],
+            pipeline["cluster_threshold"],
+            pipeline["permanent_threshold"],
+            pipeline["usda_threshold"],
+        )
+        if any(name in STORED_OUTPUTS for name in missing):
+            stored = get_store(ALGORITHM_VERSION).get(*store_key) or {}
+            cube = get_cube()
+            if cube is not None and not all(name in stored for name in STORED_OUTPUTS):
+                stored = {**(cube.outputs(*store_key) or {}), **stored}
+            for name in list(missing):
+                if name in stored:
+                    values[name] = stored[name]
+                    _cache_set(keys[name], stored[name])
+                    missing.remove(name)
+
+        for name in missing:
+            if keys[name] not in sources:
+                sources[keys[name]] = (str(index), name)
+                stage_name, func = OUTPUTS[name]
+                request.setdefault(str(index), {})[name] = func(
+                    run_stage(stage_name, pipeline)
+                )
+        results.append((keys, values, missing, store_key))
+
+    info = ee.Dictionary(request).getInfo() if request else {}
+
+    evaluated = []
+    for index, (keys, values, missing, store_key) in enumerate(results):
+        for name in missing:
+            source, output = sources[keys[name]]
+            values[name] = info[source][output]
+            _cache_set(keys[name], values[name])
+
+        stored = {name: values[name] for name in missing if name in STORED_OUTPUTS}
+        if stored:
+            get_store(ALGORITHM_VERSION).put(*store_key, stored)
+
+        for name in requested:
+            if name in DERIVED:
+                outputs, func = DERIVED[name]
+                values[name] = func(*[values[output] for output in outputs])
+        evaluated.append({name: values[name] for name in requested})
+    return evaluated
+
+
+def evaluate_pipeline(pipeline, names):
+    """Evaluates several outputs of ``wetland_pipeline`` in a single request.
+
+    See ``evaluate_pipelines`` for the available outputs.
+    """
+    return evaluate_pipelines([pipeline], names)[0]
+
+
+def wetland_stats(
+    watershed, cluster_threshold=0.1, permanent_threshold=30, usda_threshold=2
+):
+    """Computes the NAIP/JRC/omission inundation statistics of a HUC10 watershed.
+
+    Returns
+    -------
+    dict
+        The CSV row of the watershed.
+    """
+    pipeline = wetland_pipeline(
+        watershed, 2019, cluster_threshold, permanent_threshold, usda_threshold
+    )
+    return evaluate_pipeline(pipeline, ["stats"])["stats"]
+
+
+def threshold_sweep(
+    watershed, cluster_thresholds, permanent_thresholds, usda_thresholds
+):
+    """Compares the NAIP water mapping results of a grid of threshold values.
+
+    The threshold-independent stages (NAIP lookup, clustering, JRC and USDA
+    occurrence, NWI statistics) are built once and shared by every grid point,
+    and the areas are fetched in one request per ``SWEEP_CHUNK`` grid points,
+    so that a large grid does not exceed the computation limits of a request.
+
+    Parameters
+    ----------
+    watershed:
+        HUC10 watershed ID.
+    cluster_thresholds, permanent_thresholds, usda_thresholds:
+        lists of values of each threshold; every combination is evaluated, up
+        to ``MAX_SWEEP_POINTS`` combinations.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per grid point with the mean yearly NAIP, JRC and omission
+        areas (ha), the omission rate relative to JRC and the ratio of the
+        mean NAIP area to the total NWI wetland area.
+    """
+    grid = list(
+        itertools.product(cluster_thresholds, permanent_thresholds, usda_thresholds)
+    )
+    if len(grid) > MAX_SWEEP_POINTS:
+        raise ValueError(
+            f"The sweep has {len(grid)} threshold combinations, "
+            f"at most {MAX_SWEEP_POINTS} are allowed."
+        )
+    pipelines = [wetland_pipeline(watershed, 2019, *point) for point in grid]
+    results = []
+    for start in range(0, len(pipelines), SWEEP_CHUNK):
+        chunk = pipelines[start : start + SWEEP_CHUNK]
+        results += evaluate_pipelines(chunk, ["areas", "summary"])
+
+    rows = []
+    for point, result in zip(grid, results):
+        table = pivot_areas(result["areas"])
+        means = table.mean(axis=1)
+        nwi_sum = float(result["summary"]["NWI_sum"])
+        rows.append(
+            {
+                "cluster_threshold": point[0],
+                "permanent_threshold": point[1],
+                "usda_threshold": point[2],
+                "NAIP_mean": means["NAIP"],
+                "JRC_mean": means["JRC"],
+                "OMI_mean": means["OMI"],
+                "omission_rate": means["OMI"] / means["JRC"] if means["JRC"] else None,
+                "NAIP_NWI_ratio": means["NAIP"] / nwi_sum if nwi_sum else None,
+            }
+        )
+    return pd.DataFrame(rows).round(4)
+
+
+def wetland_mapping(
+    Map,
+    output,
+    watershed,
+    selected_year,
+    cluster_threshold,
+    permanent_threshold,
+    usda_threshold,
+):
+
+    pipeline = wetland_pipeline(
+        watershed,
+        selected_year,
+        cluster_threshold,
+        permanent_threshold,
+        usda_threshold,
+    )
+    basin_fc = run_stage("basin", pipeline)["basin_fc"]
+    layers = run_stage("display", pipeline)
+    with output:
+        st.write("Running. Please wait ...")
+
+    info = evaluate_pipeline(pipeline, ["shown_year", "layer_name", "chart"])
+    shown_year = info["shown_year"]
+    add_layer(Map, layers["ith_NAIP"], {"bands": ["N", "R", "G"]}, info["layer_name"])
+
+    labels = info["chart"]["labels"]
+    y = info["chart"]["naip"]
+    y2 = info["chart"]["jrc"]
 
     fig, ax = plt.subplots()
     x = np.arange(len(labels))  # the label locations
@@ -370,131 +731,6 @@ def wetland_mapping(
     # # output.clear_output()
     # plt.show()
     # print("Exporting data ...")
-
-    omission_areas = omission_images.map(get_area)
-    omission_areas = omission_areas.flatten()
-
-    NAIP_water_table = ee.FeatureCollection(
-        format_table(NAIP_water_areas, "name", "year", "sum")
-    )
-    JRC_water_table = ee.FeatureCollection(
-        format_table(JRC_water_areas, "name", "year", "sum")
-    )
-    omission_table = ee.FeatureCollection(
-        format_table(omission_areas, "name", "year", "sum")
-    )
-
-    #     NAIP_water_table = NAIP_water_table.map(lambda f: f.set({'Type': 'NAIP'}))
-    #     JRC_water_table = JRC_water_table.map(lambda f: f.set({'Type': 'JRC'}))
-    #     omission_table = omission_table.map(lambda f: f.set({'Type': 'Omission'}))
-
-    #     NAIP_water_table = geemap.remove_geometry(NAIP_water_table)
-    #     JRC_water_table = geemap.remove_geometry(JRC_water_table)
-    #     omission_table = geemap.remove_geometry(omission_table)
-    stats_table = NAIP_water_table.merge(JRC_water_table).merge(omission_table)
-    #     print(stats_table.getInfo())
-
-    #     NWI_summary = geemap.summary_stats(basin_nwi, 'Shape_Area')
-    NWI_summary = eval(str(basin_nwi.aggregate_stats("Shape_Area").getInfo()))
-    #     print(NWI_summary)
-    NWI_count = NWI_summary.get("total_count")
-    NWI_total = "{:.4f}".format(NWI_summary.get("sum") / 10000)
-    NWI_mean = "{:.4f}".format(NWI_summary.get("mean") / 10000)
-    NWI_min = "{:.4f}".format(NWI_summary.get("min") / 10000)
-    NWI_max = "{:.4f}".format(NWI_summary.get("max") / 10000)
-    NWI_median = ee.Dictionary(
-        geemap.column_stats(basin_nwi, "Shape_Area", "median")
-    ).get("median")
-    NWI_median = geemap.ee_num_round(ee.Number(NWI_median).divide(10000), 4)
-
-    NWI_dict = ee.Dictionary(
-        {
-            "NWI_count": NWI_count,
-            "NWI_sum": NWI_total,
-            "NWI_mean": NWI_mean,
-            "NWI_median": NWI_median,
-            "NWI_min": NWI_min,
-            "NWI_max": NWI_max,
-        }
-    )
-    #     print(NWI_dict.getInfo())
-
-    # Aggregated wetland area for each wetland type
-    NWI_sums = geemap.summarize_by_group(
-        basin_nwi, "Shape_Area", "WETLAND_TY", "Wetland Type", "sum"
-    )
-    NWI_sums = NWI_sums.rename(NWI_sums.keys(), geemap.nwi_rename(NWI_sums.keys()))
-    NWI_sums = NWI_sums.rename(
-        NWI_sums.keys(),
-        NWI_sums.keys().map(lambda k: ee.String("NWI_").cat(ee.String(k))),
-    )
-    NWI_sums = ee.Dictionary.fromLists(
-        NWI_sums.keys(),
-        NWI_sums.values().map(
-            lambda v: ee.Number.parse(ee.Number(v).divide(10000).format("%.4f"))
-        ),
-    )
-    NWI_dict = NWI_dict.combine(NWI_sums)
-    #     print(NWI_dict.getInfo())
-
-    #     NWI_medians = geemap.summarize_by_group(basin_nwi, 'Shape_Area', 'WETLAND_TY', 'Wetland Type', 'median')
-    #     NWI_medians = NWI_medians.rename(NWI_medians.keys(), geemap.nwi_rename(NWI_medians.keys()))
-    #     NWI_medians = NWI_medians.rename(NWI_medians.keys(), NWI_medians.keys().map(lambda k: ee.String('Median-').cat(ee.String(k))))
-    #     print(NWI_medians.getInfo())
-
-    #     NWI_median = geemap.column_stats(basin_nwi, 'Shape_Area', 'median')
-    #     NWI_median = NWI_median.rename(NWI_median.keys(),
-    #                                    NWI_median.keys().map(lambda k: ee.String(k).replace('median', 'NWI-median')))
-    #     print(NWI_median.getInfo())
-
-    def pre_data_dict(fc):
-        fc_dict = fc.first().toDictionary().remove(["name"])
-        fc_dict_keys = fc_dict.keys()
-        fc_dict_values = fc_dict_keys.map(
-            lambda key: ee.Number.parse(ee.Number(fc_dict.get(key)).format("%.2f"))
-        )
-        fc_dict = ee.Dictionary.fromLists(fc_dict_keys, fc_dict_values)
-        return fc_dict
-
-    JRC_dict = pre_data_dict(JRC_water_table)
-    NAIP_dict = pre_data_dict(NAIP_water_table)
-    OMI_dict = pre_data_dict(omission_table)
-
-    JRC_dict = JRC_dict.rename(
-        JRC_dict.keys(),
-        JRC_dict.keys().map(lambda k: ee.String(k).replace("Y", "JRC_")),
-    )
-    NAIP_dict = NAIP_dict.rename(
-        NAIP_dict.keys(),
-        NAIP_dict.keys().map(lambda k: ee.String(k).replace("Y", "NAIP_")),
-    )
-    OMI_dict = OMI_dict.rename(
-        OMI_dict.keys(),
-        OMI_dict.keys().map(lambda k: ee.String(k).replace("Y", "OMI_")),
-    )
-
-    def create_data_dict():
-        data = ee.Dictionary(
-            {
-                "HUC_10": watershed,
-                "HUC_08": huc8_id,
-                "HUC_Name": basin_name,
-                "HUC_Area": basin_size,
-            }
-        )
-        data = (
-            data.combine(JRC_dict)
-            .combine(NAIP_dict)
-            .combine(OMI_dict)
-            .combine(NWI_dict)
-        )
-        return data
-
-    data_dict = create_data_dict()
-    #     print(data_dict.getInfo())
-    csv_feature = ee.Feature(None, data_dict)
-    csv_feat_col = ee.FeatureCollection([csv_feature])
-    #     print(csv_feat_col.getInfo())
     #     out_csv = os.path.join(os.path.expanduser('~/Downloads'), watershed + '.csv')
     #     geemap.ee_export_vector(csv_feat_col, out_csv)
     #     link = geemap.create_download_link(out_csv)
@@ -503,8 +739,19 @@ def wetland_mapping(
     #     Map.addLayer(hillshade, {}, 'NED Hillshade', False)
     #     Map.addLayer(landforms, vis_landform, 'NED Landforms', False)
     #     Map.addLayer(nlcd_2016, {}, "NLCD 2016", False)
-    Map.addLayer(ith_cluster_image.randomVisualizer(), {}, "X-Means Clusters", False)
-    Map.addLayer(occurrence.randomVisualizer(), {}, "NAIP Water Occurrence")
+    add_layer(
+        Map,
+        layers["ith_cluster_image"].randomVisualizer(),
+        {},
+        "X-Means Clusters",
+        False,
+    )
+    add_layer(
+        Map,
+        run_stage("refinement", pipeline)["occurrence"].randomVisualizer(),
+        {},
+        "NAIP Water Occurrence",
+    )
     #     Map.addLayer(ith_water_image, {'palette': 'white'}, 'Water Clusters', False)
     #     Map.addLayer(landforms_wet, {'palette': 'cyan'}, 'NED Wet Landforms', False)
     #     Map.addLayer(usda_occurrence, vis_cropland, 'USDA Water Occurrence', False)
@@ -512,18 +759,24 @@ def wetland_mapping(
     #     Map.addLayer(nlcd_occurrence.randomVisualizer(), {}, 'NLCD Water Occurrence', False)
     #     Map.addLayer(nlcd_max_extent, {}, 'NLCD Max Water Extent', False)
     #     Map.addLayer(JRC_Water_Occurrence, vis_ndwi, 'JRC Water Occurrence')
-    Map.addLayer(
-        ith_JRCwater,
+    add_layer(
+        Map,
+        layers["ith_JRCwater"],
         {"palette": "orange"},
         "JRC Inundation Area ({})".format(shown_year),
         False,
     )
-    Map.addLayer(
-        ith_refined_water,
+    add_layer(
+        Map,
+        layers["ith_refined_water"],
         {"palette": "blue"},
         "NAIP Inundation Area ({})".format(shown_year),
     )
-    Map.centerObject(basin_fc, 10)
+    index = get_index()
+    if index is not None and watershed in index:
+        Map.set_center(*index.center(watershed), 10)
+    else:
+        Map.centerObject(basin_fc, 10)
     #     Map.addLayer(JRC_Permanent_Water, {'palette': 'white'}, "JRC Permanent Water", False)
     # Map.addLayer(nwi_color, {'gamma': 0.3, 'opacity': 0.7}, 'NWI Wetlands Color', False)
     #     Map.add_basemap('FWS NWI Wetlands')
@@ -535,30 +788,114 @@ def wetland_mapping(
 def app():
 
     st.title("Surface Water Mapping Using NAIP Imagery")
-    in_csv = os.path.join(os.path.dirname(__file__), "data/WBDHU10.csv")
-    with open(in_csv) as f:
-        hu10_list = f.readlines()[1:]
+    catalog = get_catalog()
+
+    filter_col1, filter_col2, _ = st.columns([1, 1, 2])
+    region = filter_col1.selectbox(
+        "Filter by HU2/HU4 region",
+        [""] + catalog.units(2) + catalog.units(4),
+        format_func=lambda code: catalog.label(code) if code else "All",
+    )
+    subbasin = select_unit(filter_col2, "HU8", 8, prefix=region, key="water_hu8")
+    hu10_list = catalog.units(10, subbasin or region)
 
     Map = geemap.Map(plugin_Draw=True, Draw_export=True)
     with st.form(key="submit_form"):
 
         col1, col2, col3, col4, col5, col6, col7 = st.columns([1, 1, 1, 2, 0.2, 1, 1])
-        selected = col1.selectbox("Select a HU10", hu10_list, index=3547)
+        selected = col1.selectbox(
+            "Select a HU10",
+            hu10_list,
+            index=hu10_list.index(DEFAULT_HU10) if DEFAULT_HU10 in hu10_list else 0,
+            format_func=catalog.label,
+        )
         lat = col2.text_input("Enter a latitude", "")
         lon = col3.text_input("Enter a longitude", "")
         year = col4.slider("Select a year to display NAIP imagery", 2008, 2019, 2019)
 
         submit = st.form_submit_button(label="Submit")
 
+    if get_index() is None:
+        st.caption(
+            "Latitude/longitude lookups query Earth Engine, "
+            "as the local HUC10 index (apps/data/WBDHU10.npz) is not built."
+        )
     output = st.empty()
 
+    if submit and lat.strip() and lon.strip():
+        try:
+            located = lookup_HUC10(float(lon), float(lat))
+        except ValueError:
+            submit = False
+            output.error("Invalid latitude or longitude.")
+        else:
+            if located is not None:
+                selected = located
+            else:
+                submit = False
+                output.error(f"No HU10 found at ({lat}, {lon}).")
+    elif submit and selected is None:
+        submit = False
+        output.error("No HU10 in the selected region.")
+
     if submit:
+        st.caption(
+            " › ".join(catalog.label(code) for code in catalog.ancestors(selected))
+        )
         output.write("Running. Please wait ...")
-        fig = wetland_mapping(Map, output, selected.strip(), year, 0.1, 30, 2)
+        fig = wetland_mapping(Map, output, selected, year, *DEFAULT_THRESHOLDS)
         with output.expander("See chart"):
             st.pyplot(fig)
         # output.pyplot(fig)
 
+        cube = get_cube()
+        if cube is not None:
+            rollups = {
+                catalog.label(code): cube.rollup(code, *DEFAULT_THRESHOLDS)
+                for code in [selected[:8], selected[:6]]
+            }
+            rollups = {label: row for label, row in rollups.items() if row}
+            if rollups:
+                with st.expander("Basin summary"):
+                    st.dataframe(pd.DataFrame(rollups))
+
+    with st.expander("Threshold sweep"):
+        with st.form(key="sweep_form"):
+            sweep_cols = st.columns(3)
+            cluster_values = sweep_cols[0].text_input(
+                "Cluster thresholds", "0.05, 0.1, 0.2"
+            )
+            permanent_values = sweep_cols[1].text_input(
+                "Permanent water thresholds (%)", "20, 30, 50"
+            )
+            usda_values = sweep_cols[2].text_input("USDA thresholds", "1, 2, 4")
+            sweep = st.form_submit_button(label="Compare")
+
+        if sweep and selected is None:
+            st.error("No HU10 in the selected region.")
+        elif sweep:
+            try:
+                grid = [
+                    [float(v) for v in values.split(",")]
+                    for values in [cluster_values, permanent_values, usda_values]
+                ]
+                if not all(np.isfinite(values).all() for values in grid):
+                    raise ValueError("The thresholds must be finite numbers.")
+            except ValueError:
+                st.error(
+                    "Enter the thresholds as comma-separated finite numbers, "
+                    "e.g., 0.05, 0.1, 0.2."
+                )
+            else:
+                points = len(grid[0]) * len(grid[1]) * len(grid[2])
+                if points > MAX_SWEEP_POINTS:
+                    st.error(
+                        f"The sweep has {points} threshold combinations, "
+                        f"at most {MAX_SWEEP_POINTS} are allowed."
+                    )
+                else:
+                    st.dataframe(threshold_sweep(selected, *grid))
+
     # Load Prairie Pothole Region (PPR) and National Hydrography Dataset (NHD)
     # Map.add_basemap('HYBRID')
     ROI = ee.FeatureCollection("users/giswqs/MRB/NWI_HU8_Boundary_Simplify")
@@ -587,10 +924,10 @@ def app():
             ee.Filter.stringStartsWith(**{"leftField": "huc10", "rightValue": "10"}),
         )
     )
-    Map.addLayer(huc8.style(**{"fillColor": "00000000", "width": 1}), {}, "NHD-HUC10")
+    add_layer(Map, huc8.style(**{"fillColor": "00000000", "width": 1}), {}, "NHD-HUC10")
     ROI_style = ROI.style(**{"color": "0000FF", "width": 2, "fillColor": "00000000"})
-    Map.addLayer(ROI_style, {}, "MRB")
+    add_layer(Map, ROI_style, {}, "MRB")
     Map.to_streamlit(width=1400, height=700)
 
     with col6:
-        st.write(f"Number of HU10: 4600")
+        st.write(f"Number of HU10: {len(hu10_list)}")
@@ -2,12 +2,10 @@ import ee
 import ast
 import streamlit as st
 import geemap.foliumap as geemap
-
-
-@st.cache
-def get_layers(url):
-    options = geemap.get_wms_layers(url)
-    return options
+from .ows import get_wms_layers
+from .session import ee_initialize
+from .tile_proxy import add_wms_layer
+from .tiles import add_layer
 
 
 def app():
@@ -25,7 +23,7 @@ def app():
     height = 600
     layers = None
 
-    geemap.ee_initialize()
+    ee_initialize()
     roi = ee.FeatureCollection("users/giswqs/MRB/NWI_HU8_Boundary_Simplify")
     style = {
         "color": "000000ff",
@@ -43,7 +41,11 @@ def app():
         empty = st.empty()
 
         if url:
-            options = get_layers(url)
+            try:
+                options = get_wms_layers(url)
+            except Exception as e:
+                st.error(f"Cannot read the layers of the WMS service: {e}")
+                options = []
 
             default = None
             if url == esa_landcover:
@@ -72,12 +74,17 @@ def app():
 
             if layers is not None:
                 for layer in layers:
-                    m.add_wms_layer(
-                        url, layers=layer, name=layer, attribution=" ", transparent=True
+                    add_wms_layer(
+                        m,
+                        url,
+                        layers=layer,
+                        name=layer,
+                        attribution=" ",
+                        transparent=True,
                     )
             if add_legend and legend_text:
                 legend_dict = ast.literal_eval(legend_text)
                 m.add_legend(legend_dict=legend_dict)
 
-            m.addLayer(roi.style(**style), {}, "MRB")
+            add_layer(m, roi.style(**style), {}, "MRB")
             m.to_streamlit(width, height)
@@ -0,0 +1,339 @@
+"""A lease-based work queue to shard watershed processing across hosts.
+
+The queue is a SQLite database on storage shared by all hosts (use a local
+file for a single host). Workers lease one watershed at a time and renew the
+lease with heartbeats while it runs; the lease of a crashed worker expires and
+the watershed is handed to another worker, up to ``max_attempts`` times.
+Results are the checkpoints of ``apps/batch.py``, keyed by thresholds, so a
+watershed leased twice is simply written twice with the same content.
+
+Usage:
+    python -m apps.workqueue init --db queue.sqlite
+    python -m apps.workqueue worker --db queue.sqlite --out-dir results --processes 4
+    python -m apps.workqueue status --db queue.sqlite
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from .batch import (
+    DEFAULT_CSV,
+    _init_worker,
+    checkpoint_path,
+    read_checkpoint,
+    read_huc10_list,
+    write_checkpoint,
+)
+
+
+class WorkQueue:
+    """A SQLite-backed queue of watershed tasks with leases.
+
+    Parameters
+    ----------
+    path:
+        the SQLite database file.
+    max_attempts:
+        number of leases after which a watershed that keeps failing or whose
+        workers keep dying is marked as failed.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS tasks (
+                    watershed TEXT NOT NULL,
+                    cluster_threshold REAL NOT NULL,
+                    permanent_threshold REAL NOT NULL,
+                    usda_threshold REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    lease_expires REAL,
+                    finished REAL,
+                    elapsed REAL,
+                    error TEXT,
+                    PRIMARY KEY (watershed, cluster_threshold, permanent_threshold, usda_threshold)
+                )""")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def enqueue(self, watersheds, thresholds):
+        """Adds watersheds to the queue; already queued ones are left untouched."""
+        with self._connect() as conn:
+            conn.executemany(
+                """INSERT OR IGNORE INTO tasks (watershed, cluster_threshold,
+                permanent_threshold, usda_threshold) VALUES (?, ?, ?, ?)""",
+                [(watershed,) + tuple(thresholds) for watershed in watersheds],
+            )
+
+    def lease(self, owner, lease_seconds):
+        """Leases the next pending or expired task.
+
+        Returns
+        -------
+        tuple
+            The (watershed, cluster_threshold, permanent_threshold, usda_threshold)
+            key of the task, or None if there is nothing left to lease.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # expired leases that used up their attempts are not retried
+            conn.execute(
+                """UPDATE tasks SET status = 'failed', owner = NULL,
+                error = COALESCE(error, 'lease expired')
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?""",
+                (now, self.max_attempts),
+            )
+            row = conn.execute(
+                """SELECT watershed, cluster_threshold, permanent_threshold, usda_threshold
+                FROM tasks WHERE status = 'pending'
+                OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY attempts, watershed LIMIT 1""",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """UPDATE tasks SET status = 'leased', owner = ?, lease_expires = ?,
+                attempts = attempts + 1 WHERE watershed = ? AND cluster_threshold = ?
+                AND permanent_threshold = ? AND usda_threshold = ?""",
+                (owner, now + lease_seconds) + row,
+            )
+        return row
+
+    def heartbeat(self, task, owner, lease_seconds):
+        """Extends a lease; returns False if the task is no longer leased by owner."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """UPDATE tasks SET lease_expires = ? WHERE watershed = ?
+                AND cluster_threshold = ? AND permanent_threshold = ? AND usda_threshold = ?
+                AND status = 'leased' AND owner = ?""",
+                (time.time() + lease_seconds,) + tuple(task) + (owner,),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task, elapsed):
+        """Marks a task as done, whoever holds its lease."""
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE tasks SET status = 'done', owner = NULL, finished = ?,
+                elapsed = ?, error = NULL WHERE watershed = ? AND cluster_threshold = ?
+                AND permanent_threshold = ? AND usda_threshold = ?""",
+                (time.time(), elapsed) + tuple(task),
+            )
+
+    def fail(self, task, owner, error):
+        """Releases a failed task for retry, or marks it as failed after max_attempts."""
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE tasks SET
+                status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                owner = NULL, error = ? WHERE watershed = ? AND cluster_threshold = ?
+                AND permanent_threshold = ? AND usda_threshold = ?
+                AND status = 'leased' AND owner = ?""",
+                (self.max_attempts, error) + tuple(task) + (owner,),
+            )
+
+    def retry_failed(self):
+        """Puts the failed tasks back in the queue with fresh attempts."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'pending', attempts = 0 WHERE status = 'failed'"
+            )
+
+    def stats(self, window=600):
+        """Returns the progress of the queue.
+
+        Parameters
+        ----------
+        window:
+            the period (s) over which the throughput is measured.
+
+        Returns
+        -------
+        dict
+            The number of tasks per status, the throughput (watersheds per
+            hour), the ETA (s), the workers holding leases and the failed
+            watersheds with their errors.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            counts = dict(
+                conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+            )
+            recent = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = 'done' AND finished > ?",
+                (now - window,),
+            ).fetchone()[0]
+            workers = [
+                row[0]
+                for row in conn.execute(
+                    """SELECT DISTINCT owner FROM tasks
+                    WHERE status = 'leased' AND lease_expires >= ?""",
+                    (now,),
+                )
+            ]
+            failed = conn.execute(
+                "SELECT watershed, error FROM tasks WHERE status = 'failed' ORDER BY watershed"
+            ).fetchall()
+
+        remaining = counts.get("pending", 0) + counts.get("leased", 0)
+        rate = recent / window
+        return {
+            "counts": counts,
+            "throughput": rate * 3600,
+            "eta": remaining / rate if rate else None,
+            "workers": workers,
+            "failed": failed,
+        }
+
+
+def _heartbeat(queue, task, owner, lease_seconds, interval, stop):
+    while not stop.wait(interval):
+        if not queue.heartbeat(task, owner, lease_seconds):
+            break
+
+
+def run_worker(db, out_dir, owner=None, lease_seconds=900, heartbeat=60, verbose=True):
+    """Processes leased watersheds until the queue is drained.
+
+    Parameters
+    ----------
+    db:
+        the queue database file.
+    out_dir:
+        directory of the watershed checkpoints.
+    owner:
+        unique worker name; defaults to <host>-<pid>.
+    lease_seconds:
+        lease duration, renewed every ``heartbeat`` seconds while the watershed runs.
+
+    Returns
+    -------
+    int
+        The number of watersheds processed by this worker.
+    """
+    from .water import wetland_stats
+
+    queue = WorkQueue(db)
+    owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+
+    while True:
+        task = queue.lease(owner, lease_seconds)
+        if task is None:
+            return count
+        watershed, thresholds = task[0], task[1:]
+
+        # a watershed with a current checkpoint was completed by an expired lease
+        path = checkpoint_path(out_dir, watershed, thresholds)
+        if read_checkpoint(path, thresholds) is not None:
+            queue.complete(task, 0)
+            continue
+
+        stop = threading.Event()
+        beat = threading.Thread(
+            target=_heartbeat,
+            args=(queue, task, owner, lease_seconds, heartbeat, stop),
+            daemon=True,
+        )
+        beat.start()
+        start = time.time()
+        try:
+            stats = wetland_stats(watershed, *thresholds)
+        except Exception as e:
+            queue.fail(task, owner, f"{e}\n{traceback.format_exc()}")
+            if verbose:
+                print(f"{owner} {watershed}: failed ({e})")
+        else:
+            write_checkpoint(out_dir, watershed, thresholds, stats)
+            queue.complete(task, time.time() - start)
+            count += 1
+            if verbose:
+                print(f"{owner} {watershed}: done in {time.time() - start:.1f}s")
+        finally:
+            stop.set()
+            beat.join()
+
+
+def _run_worker_process(args):
+    return run_worker(*args)
+
+
+def print_status(queue):
+    stats = queue.stats()
+    counts = stats["counts"]
+    print(", ".join(f"{counts[status]} {status}" for status in sorted(counts)))
+    print(f"{stats['throughput']:.1f} watersheds/hour, {len(stats['workers'])} workers")
+    if stats["eta"] is not None:
+        print(f"ETA: {stats['eta'] / 3600:.1f} hours")
+    if stats["failed"]:
+        print("Failed: " + ", ".join(watershed for watershed, _ in stats["failed"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("command", choices=["init", "worker", "status", "retry"])
+    parser.add_argument("--db", default="queue.sqlite")
+    parser.add_argument("--in-csv", default=DEFAULT_CSV)
+    parser.add_argument("--cluster-threshold", type=float, default=0.1)
+    parser.add_argument("--permanent-threshold", type=float, default=30)
+    parser.add_argument("--usda-threshold", type=float, default=2)
+    parser.add_argument("--out-dir", default="results")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--lease", type=float, default=900, help="lease duration (s)")
+    parser.add_argument("watersheds", nargs="*", help="HUC10 IDs (default: all)")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.db)
+    if args.command == "init":
+        watersheds = args.watersheds or read_huc10_list(args.in_csv)
+        thresholds = (
+            args.cluster_threshold,
+            args.permanent_threshold,
+            args.usda_threshold,
+        )
+        queue.enqueue(watersheds, thresholds)
+        print_status(queue)
+    elif args.command == "retry":
+        queue.retry_failed()
+        print_status(queue)
+    elif args.command == "status":
+        print_status(queue)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.processes, initializer=_init_worker
+        ) as executor:
+            worker_args = [(args.db, args.out_dir, None, args.lease)] * args.processes
+            total = sum(executor.map(_run_worker_process, worker_args))
+        print(f"{total} watersheds processed on {socket.gethostname()}.")
+        print_status(queue)
+
+
+if __name__ == "__main__":
+    main()
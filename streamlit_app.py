@@ -1,38 +1,30 @@
+import importlib
+
 import streamlit as st
 from streamlit_option_menu import option_menu
-from apps import (
-    datasets,
-    dem,
-    home,
-    lidar,
-    naip,
-    planet,
-    resources,
-    split,
-    timelapse,
-    trend,
-    water,
-    wms,
-)
+from apps.metrics import instrument, page
+from apps.session import ee_initialize
 
 st.set_page_config(page_title="NFW Project", layout="wide")
 
-# A dictionary of apps in the format of {"App title": "App icon"}
+# A list of apps with the module of each page under apps/; a page module is
+# imported the first time the page is selected. Earth Engine is initialized
+# before every page unless "ee" is False.
 # More icons can be found here: https://icons.getbootstrap.com
 
 apps = [
-    {"func": home.app, "title": "Home", "icon": "house"},
-    {"func": dem.app, "title": "DEM Datasets", "icon": "building"},
-    {"func": split.app, "title": "Split-panel Map", "icon": "layout-split"},
-    {"func": planet.app, "title": "Planet Imagery", "icon": "globe"},
-    {"func": naip.app, "title": "NAIP Imagery", "icon": "camera"},
-    {"func": datasets.app, "title": "Surface Water Datasets", "icon": "moisture"},
-    {"func": water.app, "title": "NAIP Water Mapping", "icon": "water"},
-    {"func": wms.app, "title": "ESA Global Land Cover", "icon": "map"},
-    {"func": lidar.app, "title": "LiDAR Data", "icon": "lightning"},
-    {"func": trend.app, "title": "Trend Analysis", "icon": "graph-up-arrow"},
-    {"func": timelapse.app, "title": "Timelapse", "icon": "film"},
-    {"func": resources.app, "title": "Useful Resources", "icon": "book"},
+    {"module": "home", "title": "Home", "icon": "house", "ee": False},
+    {"module": "dem", "title": "DEM Datasets", "icon": "building"},
+    {"module": "split", "title": "Split-panel Map", "icon": "layout-split"},
+    {"module": "planet", "title": "Planet Imagery", "icon": "globe"},
+    {"module": "naip", "title": "NAIP Imagery", "icon": "camera"},
+    {"module": "datasets", "title": "Surface Water Datasets", "icon": "moisture"},
+    {"module": "water", "title": "NAIP Water Mapping", "icon": "water"},
+    {"module": "wms", "title": "ESA Global Land Cover", "icon": "map"},
+    {"module": "lidar", "title": "LiDAR Data", "icon": "lightning"},
+    {"module": "trend", "title": "Trend Analysis", "icon": "graph-up-arrow"},
+    {"module": "timelapse", "title": "Timelapse", "icon": "film"},
+    {"module": "resources", "title": "Useful Resources", "icon": "book", "ee": False},
 ]
 
 titles = [app["title"] for app in apps]
@@ -68,5 +60,11 @@ with st.sidebar:
 
 for app in apps:
     if app["title"] == selected:
-        app["func"]()
+        with page(app["title"]):
+            if app.get("ee", True):
+                # one Earth Engine session per process, shared by all the pages
+                ee_initialize()
+            module = importlib.import_module(f"apps.{app['module']}")
+            instrument()
+            module.app()
         break
@@ -0,0 +1,77 @@
+"""Round trip of an Earth Engine computation through apps.replay.
+
+The ``ee.data`` calls are stubbed, so the test needs ``earthengine-api`` but
+neither credentials nor network.
+"""
+
+import pytest
+
+ee = pytest.importorskip("ee")
+
+from apps import replay  # noqa: E402
+
+# The signature of the single algorithm used by the recorded computation
+ALGORITHMS = {
+    "Number.add": {
+        "description": "",
+        "returns": "Number",
+        "args": [
+            {"name": "left", "type": "Number", "description": ""},
+            {"name": "right", "type": "Number", "description": ""},
+        ],
+    }
+}
+
+
+def unreachable(*args, **kwargs):
+    raise AssertionError("a replayed call reached the Earth Engine client")
+
+
+@pytest.fixture
+def restore_ee(monkeypatch):
+    # monkeypatch restores the ee.data functions wrapped by replay.install
+    for name in replay.CALLS + ["_install_cloud_api_resource"]:
+        monkeypatch.setattr(ee.data, name, getattr(ee.data, name, None), raising=False)
+    yield monkeypatch
+    ee.Reset()
+
+
+def record(monkeypatch, replay_dir, computed):
+    """Records the computation of a graph with stubbed ee.data calls."""
+    calls = []
+
+    def compute_value(obj):
+        calls.append(obj)
+        return computed
+
+    monkeypatch.setattr(ee.data, "getAlgorithms", lambda: ALGORITHMS)
+    monkeypatch.setattr(ee.data, "computeValue", compute_value)
+    monkeypatch.setattr(ee.data, "_install_cloud_api_resource", lambda: None)
+    replay.install("record", replay_dir)
+    ee.Initialize(replay.ReplayCredentials(), project=replay.OFFLINE_PROJECT)
+    assert ee.Number(1).add(2).getInfo() == computed
+    assert len(calls) == 1
+    ee.Reset()
+
+
+def test_replay_round_trip(restore_ee, tmp_path):
+    record(restore_ee, str(tmp_path), 3)
+
+    for name in replay.CALLS:
+        restore_ee.setattr(ee.data, name, unreachable, raising=False)
+    replay.initialize_offline(str(tmp_path))
+
+    # the same graph is served from its capture, keyed by call_key
+    key = replay.call_key("computeValue", (ee.Number(1).add(2),), {})
+    assert (tmp_path / key[:2] / f"{key}.json").exists()
+    assert ee.Number(1).add(2).getInfo() == 3
+
+    # another graph was never recorded
+    with pytest.raises(ee.EEException, match="No recorded response"):
+        ee.Number(1).add(3).getInfo()
+
+
+def test_unsupported_client_version(restore_ee, tmp_path):
+    restore_ee.setattr(ee, "__version__", "0.1.300")
+    with pytest.raises(ee.EEException, match="not supported"):
+        replay.initialize_offline(str(tmp_path))